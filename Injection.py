@@ -1,6 +1,28 @@
 import argparse
+import contextlib
+import ctypes
+import ctypes.util
+import fnmatch
+import functools
+import gzip
+import hashlib
+import html
+import io
+import json
+import logging
+import math
 import os
-from bs4 import BeautifulSoup
+import re
+import select
+import shutil
+import sqlite3
+import struct
+import sys
+import tempfile
+import time
+import urllib.parse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
 # --- The JavaScript code to be injected ---
 JAVASCRIPT_TO_INJECT = """
@@ -21,11 +43,22 @@ JAVASCRIPT_TO_INJECT = """
 
     // --- Configuration for Scrolling ---
     const ARROW_KEY_SCROLL_AMOUNT = 150;
+    const ARROW_KEY_SCROLL_EASE = 0.25; // Fraction of the remaining arrow key distance scrolled per 60 Hz frame
+    const TOUCH_DRAG_SCROLL = true; // Drive one-finger touch scrolling with the scroll engine (pinch zoom stays native)
+    const MOMENTUM_FRICTION = 0.95; // Share of the release velocity kept per 60 Hz frame after a drag
+    const MOMENTUM_MIN_VELOCITY = 0.02; // px/ms below which momentum stops
+    const MOMENTUM_SAMPLE_MS = 100; // Drag movement within this window before release sets the momentum
 
-    // --- State for Mouse Drag Scrolling ---
-    let isDragging = false;
-    let startY;
-    let startScrollTop;
+    // --- State for the Scroll Engine (drag, momentum and arrow key scrolling) ---
+    let dragPointerId = null; // Pointer currently drag-scrolling, if any
+    let dragStartY;
+    let dragStartScrollTop;
+    let dragY;
+    let dragSamples = []; // [timeStamp, clientY] of the recent drag movement
+    let momentumVelocity = 0; // px/ms in pointer direction, decaying after a release
+    let keyScrollTarget = null; // scrollY the arrow keys are easing towards
+    let scrollFrame = null;
+    let lastScrollFrameTime = 0;
 
     // --- Configuration for Zooming ---
     let currentZoomLevel = 1.0;
@@ -37,6 +70,80 @@ JAVASCRIPT_TO_INJECT = """
     // --- Configuration for Image Fallback ---
     const FALLBACK_EXTENSIONS = ['.jpeg', '.png', '.webp', '.gif', '.avif'];
 
+    // --- Configuration for Lazy Loading ---
+    const LAZY_LOAD_PAGES = true; // Only load page images near the viewport and release far off-screen ones
+    const LAZY_LOAD_MARGIN_PX = 1500; // Pages within this distance of the viewport get their image loaded
+    const EVICT_MARGIN_PX = 6000; // Loaded pages farther than this from the viewport release their decoded image
+
+    // --- Configuration for Merged Volumes ---
+    const HYDRATE_MARGIN_PX = 4000; // Chapters of a merged volume are materialized within this distance of the viewport
+
+    // @instrument-begin
+    // --- Performance Instrumentation (only in builds made with Injection.py --instrument) ---
+    const PERF_OVERLAY = false; // Show the summary on screen; a #webtoon-perf URL fragment does the same
+    const perfEntries = [];
+    const perfCounters = {};
+
+    function perfStart(name) {
+        performance.mark(`webtoon:${name}:start`);
+        return performance.now();
+    }
+
+    function perfEnd(name, category, startTime) {
+        const duration = performance.now() - startTime;
+        try {
+            performance.measure(`webtoon:${name}`, `webtoon:${name}:start`);
+        } catch (e) { /* Start mark already cleared by an overlapping measure of the same name */ }
+        performance.clearMarks(`webtoon:${name}:start`);
+        perfEntries.push({ name, category, start: startTime, duration });
+    }
+
+    function perfCount(name) {
+        perfCounters[name] = (perfCounters[name] || 0) + 1;
+    }
+
+    function perfSummary() {
+        const categories = {};
+        perfEntries.forEach(entry => (categories[entry.category] = categories[entry.category] || []).push(entry.duration));
+        const stats = {};
+        Object.entries(categories).forEach(([category, durations]) => {
+            durations.sort((a, b) => a - b);
+            const total = durations.reduce((sum, d) => sum + d, 0);
+            const at = q => durations[Math.min(durations.length - 1, Math.round(q * (durations.length - 1)))];
+            stats[category] = {
+                count: durations.length, totalMs: +total.toFixed(2), meanMs: +(total / durations.length).toFixed(2),
+                p50Ms: +at(0.5).toFixed(2), p95Ms: +at(0.95).toFixed(2), maxMs: +durations[durations.length - 1].toFixed(2)
+            };
+        });
+        const bootstrap = {};
+        perfEntries.filter(entry => entry.category === 'bootstrap')
+            .forEach(entry => { bootstrap[entry.name.replace('bootstrap:', '')] = +entry.duration.toFixed(2); });
+        return { bootstrap, categories: stats, counters: { ...perfCounters } };
+    }
+
+    window.__mokuroWebtoonPerf = { entries: perfEntries, counters: perfCounters, summary: perfSummary };
+
+    function showPerfOverlay() {
+        const overlay = document.createElement('pre');
+        overlay.id = 'webtoon-perf-overlay';
+        overlay.style.cssText = 'position:fixed;right:8px;bottom:8px;z-index:2147483647;margin:0;padding:6px 8px;' +
+            'max-height:50vh;overflow:auto;font:11px/1.3 monospace;color:#0f0;background:rgba(0,0,0,.8);' +
+            'border-radius:4px;pointer-events:none;white-space:pre;';
+        document.body.appendChild(overlay);
+        const render = () => {
+            const summary = perfSummary();
+            const lines = Object.entries(summary.bootstrap).map(([phase, ms]) => `${phase.padEnd(22)} ${ms.toFixed(1)} ms`);
+            Object.entries(summary.categories).filter(([category]) => category !== 'bootstrap').forEach(([category, stat]) => {
+                lines.push(`${category.padEnd(10)} n=${stat.count} p50 ${stat.p50Ms} p95 ${stat.p95Ms} max ${stat.maxMs} ms`);
+            });
+            Object.entries(summary.counters).forEach(([name, count]) => lines.push(`${name.padEnd(22)} ${count}`));
+            overlay.textContent = lines.join('\\n');
+        };
+        render();
+        setInterval(render, 1000);
+    }
+    // @instrument-end
+
     function applyWebtoonStyles() {
         const styleSheet = document.createElement("style");
         styleSheet.type = "text/css";
@@ -61,6 +168,12 @@ JAVASCRIPT_TO_INJECT = """
 
             body.is-dragging {
                 cursor: grabbing !important;
+                user-select: none;
+                -webkit-user-select: none;
+            }
+
+            html.webtoon-touch-scroll, html.webtoon-touch-scroll body {
+                touch-action: pinch-zoom; /* One-finger pans go to the scroll engine */
             }
 
             #pagesContainer {
@@ -80,7 +193,7 @@ JAVASCRIPT_TO_INJECT = """
                 display: block !important;
                 float: none !important;
                 width: 100% !important;
-                max-width: ${DEFAULT_PAGE_MAX_WIDTH}px; /* Initial max-width */
+                max-width: calc(${DEFAULT_PAGE_MAX_WIDTH}px * var(--webtoon-zoom, 1)); /* Zoom is a single custom property */
                 height: auto !important;
                 margin: 0 auto 0px auto !important;
                 padding: 0 !important;
@@ -88,7 +201,6 @@ JAVASCRIPT_TO_INJECT = """
                 box-shadow: none !important;
                 position: relative;
                 order: initial !important;
-                transition: max-width 0.1s ease-out;
             }
 
             .pageContainer {
@@ -112,13 +224,30 @@ JAVASCRIPT_TO_INJECT = """
                 pointer-events: none;
             }
 
+            .webtoon-chapter {
+                display: flex;
+                flex-direction: column;
+                align-items: center;
+                width: 100%;
+            }
+
+            .webtoon-chapter[data-hydrated="false"] {
+                /* Placeholder with the height the chapter's pages will take, so the scrollbar is right from the start */
+                height: calc(var(--webtoon-page-width, ${DEFAULT_PAGE_MAX_WIDTH}) * var(--chapter-height-ratio, 1) * 1px);
+            }
+
+            .webtoon-tile {
+                position: relative !important;
+                width: 100%;
+            }
+
             .textBox {
                 position: absolute !important;
                 padding: 0 !important;
                 border: 1px solid rgba(0,0,0,0) !important;
                 opacity: 0;
                 pointer-events: none;
-                transition: opacity 0.1s ease-in-out, font-size 0.05s ease-out; /* Added font-size transition */
+                transition: opacity 0.1s ease-in-out;
                 box-sizing: content-box !important; /* Ensure width/height apply to content area */
                 overflow: hidden; /* Clip overflowing text, e.g. due to browser min font size */
             }
@@ -133,7 +262,16 @@ JAVASCRIPT_TO_INJECT = """
                 word-break: break-word;
                 margin: 0; /* Remove default p margins that could affect layout */
                 padding: 0; /* Remove default p paddings */
-                /* Font size will be set by JS or inherited from .textBox */
+                /* Font size is scaled below or inherited from .textBox */
+            }
+
+            /* Base font sizes scale with the rendered page width: --webtoon-page-width is set once per zoom/resize by applyZoom */
+            .textBox[data-original-font-size] {
+                font-size: calc(var(--webtoon-page-width) / var(--original-width) * var(--original-font-size) * 1px) !important;
+            }
+
+            .textBox p[data-original-p-font-size] {
+                font-size: calc(var(--webtoon-page-width) / var(--original-width) * var(--original-p-font-size) * 1px) !important;
             }
 
             #leftAPage, #rightAPage, #leftAScreen, #rightAScreen,
@@ -153,114 +291,102 @@ JAVASCRIPT_TO_INJECT = """
         console.log("Webtoon CSS (v0.9.2) injected. OCR boxes on pageContainer hover. Added box-sizing, overflow, and dynamic font scaling support.");
     }
 
+    // Zooming costs the same on any chapter length: page width and text size both derive from
+    // two custom properties on <html>, instead of rewriting every page and textbox.
     function applyZoom() {
-        const pages = document.querySelectorAll('.page');
-        const newGlobalMaxWidth = DEFAULT_PAGE_MAX_WIDTH * currentZoomLevel;
+        const perfZoom = perfStart('zoom'); // @instrument
+        const root = document.documentElement;
+        const pagesContainer = document.getElementById('pagesContainer') || document.body;
+        const availableWidth = pagesContainer.clientWidth; // Read before writing so no layout is forced
+        const pageWidth = Math.min(availableWidth, DEFAULT_PAGE_MAX_WIDTH * currentZoomLevel);
+        root.style.setProperty('--webtoon-zoom', currentZoomLevel.toFixed(2));
+        root.style.setProperty('--webtoon-page-width', pageWidth.toFixed(2));
+        const sizes = pageImageSizes();
+        srcsetImages.forEach(img => { img.sizes = sizes; }); // Only the loaded pages carry a srcset
+        perfEnd('zoom', 'zoom', perfZoom); // @instrument
+    }
 
-        pages.forEach(page => {
-            page.style.maxWidth = `${newGlobalMaxWidth.toFixed(0)}px`;
-        });
+    const srcsetImages = new Set(); // Page images currently carrying a srcset (see setSrcset)
+
+    function pageImageSizes() {
+        return `${Math.ceil(Math.min(window.innerWidth, DEFAULT_PAGE_MAX_WIDTH * currentZoomLevel))}px`;
+    }
+
+    // An <img> starts fetching as soon as it has a srcset, so it is only set when the page is loaded
+    function setSrcset(img, srcset) {
+        img.sizes = pageImageSizes();
+        img.srcset = srcset;
+        srcsetImages.add(img);
+    }
 
+    let zoomUpdateScheduled = false;
+    function scheduleZoomUpdate() { // Coalesces wheel/key/resize input into at most one update per frame
+        if (zoomUpdateScheduled) return;
+        zoomUpdateScheduled = true;
         requestAnimationFrame(() => {
-            pages.forEach(page => {
-                const container = page.querySelector('.pageContainer');
-                const img = container ? container.querySelector('img.webtoon-image') : null;
-
-                if (img && container) {
-                    const originalContainerWidthPx = parseFloat(container.dataset.originalWidth || 0);
-
-                    if (originalContainerWidthPx > 0) {
-                        const currentImageRenderedWidth = img.offsetWidth;
-                        if (currentImageRenderedWidth > 0) {
-                            const currentWidthScaleFactor = currentImageRenderedWidth / originalContainerWidthPx;
-                            const textBoxes = container.querySelectorAll('.textBox');
-
-                            textBoxes.forEach(textBox => {
-                                const originalFontSizePx = parseFloat(textBox.dataset.originalFontSize || 0);
-                                if (!isNaN(originalFontSizePx)) {
-                                    const newFontSize = originalFontSizePx * currentWidthScaleFactor;
-                                    textBox.style.fontSize = newFontSize.toFixed(2) + 'px';
-                                }
-
-                                textBox.querySelectorAll('p').forEach(pElem => {
-                                    if (pElem.dataset.originalPFontSize) {
-                                        const pOriginalFontSize = parseFloat(pElem.dataset.originalPFontSize);
-                                        if (!isNaN(pOriginalFontSize)) {
-                                            const newPFontSize = pOriginalFontSize * currentWidthScaleFactor;
-                                            pElem.style.fontSize = newPFontSize.toFixed(2) + 'px';
-                                        }
-                                    } else {
-                                        pElem.style.fontSize = ''; // Clear to inherit from .textBox
-                                    }
-                                });
-                            });
-                        } else {
-                             console.warn(`applyZoom: currentImageRenderedWidth is 0 for page ${page.id}. Font sizes not updated.`);
-                        }
-                    }
+            zoomUpdateScheduled = false;
+            applyZoom();
+        });
+    }
+
+    // Converts Mokuro's pixel textbox geometry to percentages of the page and records the base font
+    // sizes as CSS custom properties, so that scaling them is left to the stylesheet (see applyZoom).
+    // Injection.py --precompute-layout does the same at injection time.
+    function convertTextBoxLayout(container, originalContainerWidthPx, originalContainerHeightPx) {
+        const perfTextBoxes = perfStart(`textboxes:${container.parentElement.id}`); // @instrument
+        container.style.setProperty('--original-width', originalContainerWidthPx);
+        container.querySelectorAll('.textBox').forEach(textBox => {
+            const originalLeftPx = parseFloat(textBox.style.left);
+            const originalTopPx = parseFloat(textBox.style.top);
+            const originalWidthPx = parseFloat(textBox.style.width);
+            const originalHeightPx = parseFloat(textBox.style.height);
+
+            // Convert positions and dimensions to percentages
+            if (!isNaN(originalLeftPx)) textBox.style.left = (originalLeftPx / originalContainerWidthPx * 100) + '%';
+            if (!isNaN(originalTopPx)) textBox.style.top = (originalTopPx / originalContainerHeightPx * 100) + '%';
+            if (!isNaN(originalWidthPx)) textBox.style.width = (originalWidthPx / originalContainerWidthPx * 100) + '%';
+            if (!isNaN(originalHeightPx)) textBox.style.height = (originalHeightPx / originalContainerHeightPx * 100) + '%';
+
+            // Handle font size for the textBox itself
+            const originalFontSizePx = parseFloat(textBox.style.fontSize);
+            if (!isNaN(originalFontSizePx)) {
+                textBox.dataset.originalFontSize = originalFontSizePx;
+                textBox.style.setProperty('--original-font-size', originalFontSizePx);
+            }
+
+            // Handle font sizes for <p> elements with an inline font-size; the others inherit from the textBox
+            textBox.querySelectorAll('p').forEach(pElem => {
+                const pOriginalFontSizeValue = parseFloat(pElem.style.fontSize);
+                if (!isNaN(pOriginalFontSizeValue)) {
+                    pElem.dataset.originalPFontSize = pOriginalFontSizeValue;
+                    pElem.style.setProperty('--original-p-font-size', pOriginalFontSizeValue);
                 }
             });
         });
+        container.dataset.layoutPrecomputed = 'true'; // Converted once; reloading the image changes nothing
+        perfEnd(`textboxes:${container.parentElement.id}`, 'textboxes', perfTextBoxes); // @instrument
     }
 
 
     async function loadImageWithFallback(imgElement, baseSrcWithoutExt, originalExt, fallbackExtensions, pageEl, container, hasValidOriginalDimensions, originalContainerWidthPx, originalContainerHeightPx) {
         const extensionsToTry = [originalExt, ...fallbackExtensions.filter(ext => ext.toLowerCase() !== originalExt.toLowerCase())];
+        const perfImage = perfStart(`image:${pageEl.id}`); // @instrument
 
         for (const ext of extensionsToTry) {
             const currentSrc = baseSrcWithoutExt + ext;
+            if (ext !== originalExt) perfCount('imageFallbackAttempts'); // @instrument
             imgElement.src = currentSrc;
             try {
                 await new Promise((resolve, reject) => {
                     imgElement.onload = () => {
                         console.log(`Successfully loaded image: ${currentSrc} for page ${pageEl.id}`);
-                        const newImageRenderedWidth = imgElement.offsetWidth;
-                        if (newImageRenderedWidth === 0) {
-                            console.warn(`Image for page ${pageEl.id} loaded but its offsetWidth is 0. Textbox repositioning/scaling might fail.`);
-                        }
-
-                        // Store original container dimensions on the container element for applyZoom
-                        if (hasValidOriginalDimensions) {
-                            container.dataset.originalWidth = originalContainerWidthPx;
-                            container.dataset.originalHeight = originalContainerHeightPx;
+                        imgElement.dataset.loadedSrc = currentSrc; // Reused when an evicted page is reloaded
+                        if (imgElement.naturalWidth > 0 && imgElement.naturalHeight > 0) {
+                            // Keep the page's height reserved at the real image ratio, even once its image is released
+                            container.style.aspectRatio = `${imgElement.naturalWidth} / ${imgElement.naturalHeight}`;
                         }
-
-                        if (hasValidOriginalDimensions && newImageRenderedWidth > 0) {
-                            const initialWidthScaleFactor = newImageRenderedWidth / originalContainerWidthPx;
-                            const textBoxes = container.querySelectorAll('.textBox');
-
-                            textBoxes.forEach(textBox => {
-                                const originalLeftPx = parseFloat(textBox.style.left);
-                                const originalTopPx = parseFloat(textBox.style.top);
-                                const originalWidthPx = parseFloat(textBox.style.width);
-                                const originalHeightPx = parseFloat(textBox.style.height);
-                                
-                                // Convert positions and dimensions to percentages
-                                if (!isNaN(originalLeftPx)) textBox.style.left = (originalLeftPx / originalContainerWidthPx * 100) + '%';
-                                if (!isNaN(originalTopPx)) textBox.style.top = (originalTopPx / originalContainerHeightPx * 100) + '%';
-                                if (!isNaN(originalWidthPx)) textBox.style.width = (originalWidthPx / originalContainerWidthPx * 100) + '%';
-                                if (!isNaN(originalHeightPx)) textBox.style.height = (originalHeightPx / originalContainerHeightPx * 100) + '%';
-
-                                // Handle font size for the textBox itself
-                                const originalFontSizePx = parseFloat(textBox.style.fontSize);
-                                if (!isNaN(originalFontSizePx)) {
-                                    textBox.dataset.originalFontSize = originalFontSizePx; // Store for dynamic scaling
-                                    textBox.style.fontSize = (originalFontSizePx * initialWidthScaleFactor).toFixed(2) + 'px'; // Initial scaled size
-                                }
-
-                                // Handle font sizes for <p> elements within the textBox
-                                textBox.querySelectorAll('p').forEach(pElem => {
-                                    const pStyleFontSize = pElem.style.fontSize;
-                                    if (pStyleFontSize) { // If <p> has an inline font-size
-                                        const pOriginalFontSizeValue = parseFloat(pStyleFontSize);
-                                        if (!isNaN(pOriginalFontSizeValue)) {
-                                            pElem.dataset.originalPFontSize = pOriginalFontSizeValue; // Store for dynamic scaling
-                                            pElem.style.fontSize = (pOriginalFontSizeValue * initialWidthScaleFactor).toFixed(2) + 'px'; // Initial scaled size
-                                        }
-                                    }
-                                    // If pElem.style.fontSize is empty, it inherits; no data-attribute or inline style set here.
-                                });
-                            });
+                        if (hasValidOriginalDimensions && container.dataset.layoutPrecomputed !== 'true') {
+                            convertTextBoxLayout(container, originalContainerWidthPx, originalContainerHeightPx);
                         }
                         resolve();
                     };
@@ -268,19 +394,122 @@ JAVASCRIPT_TO_INJECT = """
                         reject();
                     };
                 });
+                perfEnd(`image:${pageEl.id}`, 'image', perfImage); // @instrument
                 return true;
             } catch (error) {
                 // Continue to next extension
             }
         }
+        perfEnd(`image:${pageEl.id}`, 'image', perfImage); // @instrument
+        perfCount('imageFailures'); // @instrument
         console.error(`All attempts to load image for page ${pageEl.id} (base: ${baseSrcWithoutExt}) failed.`);
         return false;
     }
 
 
-    async function processPagesAndTextBoxes() {
-        const pageElements = document.querySelectorAll('.page');
-        let promises = [];
+    function loadTileImage(img, pageEl) {
+        return new Promise(resolve => {
+            const perfTile = perfStart(`tile:${img.dataset.src}`); // @instrument
+            img.onload = () => {
+                perfEnd(`tile:${img.dataset.src}`, 'image', perfTile); // @instrument
+                img.dataset.loadedSrc = img.dataset.src;
+                resolve(true);
+            };
+            img.onerror = () => {
+                perfEnd(`tile:${img.dataset.src}`, 'image', perfTile); // @instrument
+                perfCount('imageFailures'); // @instrument
+                console.error(`Failed to load image tile ${img.dataset.src} for page ${pageEl.id}.`);
+                resolve(false);
+            };
+            img.src = img.dataset.src;
+        });
+    }
+
+    let lazyObservers = null; // Shared, so pages of chapters hydrated later join the same observers
+
+    function setupLazyLoading(pages) {
+        if (!lazyObservers) lazyObservers = createLazyObservers();
+        const { pageByContainer, loadObserver, evictObserver } = lazyObservers;
+        pages.forEach(page => {
+            pageByContainer.set(page.container, page);
+            loadObserver.observe(page.container);
+            evictObserver.observe(page.container);
+        });
+        console.log(`Lazy loading enabled for ${pages.length} pages (load margin ${LAZY_LOAD_MARGIN_PX}px, evict margin ${EVICT_MARGIN_PX}px).`);
+    }
+
+    function createLazyObservers() {
+        const pageByContainer = new Map();
+
+        const loadObserver = new IntersectionObserver(entries => {
+            entries.forEach(entry => {
+                if (!entry.isIntersecting) return;
+                const page = pageByContainer.get(entry.target);
+                if (page.state === 'idle') {
+                    page.state = 'loading';
+                    page.load().then(loaded => { page.state = loaded ? 'loaded' : 'failed'; });
+                } else if (page.state === 'evicted') {
+                    if (page.img.dataset.loadedSrcset) setSrcset(page.img, page.img.dataset.loadedSrcset);
+                    page.img.src = page.img.dataset.loadedSrc;
+                    page.state = 'loaded';
+                }
+            });
+        }, { rootMargin: `${LAZY_LOAD_MARGIN_PX}px 0px` });
+
+        const evictObserver = new IntersectionObserver(entries => {
+            entries.forEach(entry => {
+                if (entry.isIntersecting) return;
+                const page = pageByContainer.get(entry.target);
+                if (page.state === 'loaded') {
+                    if (page.img.srcset) {
+                        page.img.dataset.loadedSrcset = page.img.srcset;
+                        page.img.removeAttribute('srcset');
+                        srcsetImages.delete(page.img);
+                    }
+                    page.img.removeAttribute('src'); // Lets the browser drop the decoded bitmap; the container keeps its height
+                    page.state = 'evicted';
+                }
+            });
+        }, { rootMargin: `${EVICT_MARGIN_PX}px 0px` });
+
+        return { pageByContainer, loadObserver, evictObserver };
+    }
+
+    function hydrateChapter(section) {
+        if (section.dataset.hydrated !== 'false') return;
+        const template = section.querySelector('template.webtoon-chapter-pages');
+        if (template) section.replaceChildren(template.content);
+        section.querySelectorAll('.page').forEach(p => {
+            p.style.setProperty('display', 'block', 'important');
+            p.style.setProperty('order', 'initial', 'important');
+        });
+        section.dataset.hydrated = 'true'; // Drops the placeholder height; the pages reserve their own
+        processPagesAndTextBoxes(section).catch(error => console.error(`Error hydrating chapter ${section.dataset.chapterTitle}:`, error));
+    }
+
+    function setupChapterHydration() {
+        // Merged volumes keep each chapter as an inert <template> until the reader gets close to it
+        const chapters = document.querySelectorAll('.webtoon-chapter[data-hydrated="false"]');
+        if (!chapters.length) return;
+        if (!('IntersectionObserver' in window)) {
+            chapters.forEach(hydrateChapter);
+            return;
+        }
+        const hydrateObserver = new IntersectionObserver(entries => {
+            entries.forEach(entry => {
+                if (!entry.isIntersecting) return;
+                hydrateObserver.unobserve(entry.target);
+                hydrateChapter(entry.target);
+            });
+        }, { rootMargin: `${HYDRATE_MARGIN_PX}px 0px` });
+        chapters.forEach(section => hydrateObserver.observe(section));
+        console.log(`Merged volume: ${chapters.length} chapters hydrate on demand (margin ${HYDRATE_MARGIN_PX}px).`);
+    }
+
+
+    async function processPagesAndTextBoxes(root = document) {
+        const pageElements = root.querySelectorAll('.page');
+        const pages = [];
 
         for (const [pageIndex, pageEl] of pageElements.entries()) {
             const container = pageEl.querySelector('.pageContainer');
@@ -289,13 +518,27 @@ JAVASCRIPT_TO_INJECT = """
                 continue;
             }
 
+            if (container.dataset.tiled === 'true') {
+                // Tall strip split into tiles at injection time: each tile is loaded and released on its own
+                container.querySelectorAll('.webtoon-tile').forEach(tile => {
+                    const img = tile.querySelector('img.webtoon-image');
+                    if (img && img.dataset.src) {
+                        pages.push({ container: tile, img, state: 'idle', load: () => loadTileImage(img, pageEl) });
+                    }
+                });
+                continue;
+            }
+
             const bgImageStyle = container.style.backgroundImage;
             const originalContainerWidthPx = parseFloat(container.style.width);
             const originalContainerHeightPx = parseFloat(container.style.height);
             const hasValidOriginalDimensions = !isNaN(originalContainerWidthPx) && originalContainerWidthPx > 0 &&
                                               !isNaN(originalContainerHeightPx) && originalContainerHeightPx > 0;
 
-            if (!hasValidOriginalDimensions) {
+            if (hasValidOriginalDimensions) {
+                // Reserve the page's height before its image arrives so the scroll position never jumps
+                container.style.aspectRatio = `${originalContainerWidthPx} / ${originalContainerHeightPx}`;
+            } else {
                 console.warn(`Page ${pageIndex} (ID: ${pageEl.id}): Invalid original dimensions (${container.style.width}, ${container.style.height}). Textbox repositioning/scaling may be inaccurate or skipped.`);
             }
 
@@ -322,20 +565,41 @@ JAVASCRIPT_TO_INJECT = """
                 img.classList.add('webtoon-image');
                 img.alt = `Page image ${pageIndex + 1}`;
 
+                if (container.dataset.imageWidth && container.dataset.imageHeight) {
+                    // Real size read from the image file at injection time: the <img> reserves its box before loading
+                    img.width = parseInt(container.dataset.imageWidth, 10);
+                    img.height = parseInt(container.dataset.imageHeight, 10);
+                }
+
                 container.style.backgroundImage = 'none';
                 container.prepend(img);
 
-                const promise = loadImageWithFallback(
-                    img, baseUrlWithoutExt, originalExt, FALLBACK_EXTENSIONS,
-                    pageEl, container, hasValidOriginalDimensions, originalContainerWidthPx, originalContainerHeightPx
-                );
-                promises.push(promise);
+                // Pages resolved at injection time point at the real file; only guess extensions for the rest
+                const fallbackExtensions = container.dataset.imageResolved === 'true' ? [] : FALLBACK_EXTENSIONS;
+                pages.push({
+                    container, img, state: 'idle',
+                    load: () => {
+                        if (container.dataset.srcset) {
+                            // Downscaled variants generated at injection time; let the browser pick the smallest adequate one
+                            setSrcset(img, container.dataset.srcset);
+                        }
+                        return loadImageWithFallback(
+                            img, baseUrlWithoutExt, originalExt, fallbackExtensions,
+                            pageEl, container, hasValidOriginalDimensions, originalContainerWidthPx, originalContainerHeightPx
+                        );
+                    }
+                });
             } else {
                  console.warn(`Page ${pageIndex} (ID: ${pageEl.id}): No valid background image style or not a URL.`);
             }
         }
 
-        await Promise.all(promises);
+        if (LAZY_LOAD_PAGES && 'IntersectionObserver' in window) {
+            setupLazyLoading(pages);
+            return;
+        }
+
+        await Promise.all(pages.map(page => page.load()));
         console.log("All pages processed for image loading and text box relocation/styling.");
     }
 
@@ -347,6 +611,10 @@ JAVASCRIPT_TO_INJECT = """
             p.style.setProperty('order', 'initial', 'important');
         });
 
+        if (document.documentElement.dataset.readerStripped === 'true') {
+            return; // Injection.py --strip-reader removed the original reader; there is nothing to disable
+        }
+
         if (window.pz) {
             try {
                 if (typeof window.pz.dispose === 'function') window.pz.dispose();
@@ -404,21 +672,21 @@ JAVASCRIPT_TO_INJECT = """
         let scrolled = false;
         let zoomed = false;
         switch (event.key) {
-            case "ArrowUp": window.scrollBy(0, -ARROW_KEY_SCROLL_AMOUNT); scrolled = true; break;
-            case "ArrowDown": window.scrollBy(0, ARROW_KEY_SCROLL_AMOUNT); scrolled = true; break;
+            case "ArrowUp": scrollByKey(-ARROW_KEY_SCROLL_AMOUNT); scrolled = true; break;
+            case "ArrowDown": scrollByKey(ARROW_KEY_SCROLL_AMOUNT); scrolled = true; break;
             case "+": case "=":
                 if (event.ctrlKey || !event.altKey && !event.metaKey) { // Allow Ctrl+= or just =
-                    currentZoomLevel = Math.min(MAX_ZOOM, currentZoomLevel + ZOOM_STEP); applyZoom(); zoomed = true;
+                    currentZoomLevel = Math.min(MAX_ZOOM, currentZoomLevel + ZOOM_STEP); scheduleZoomUpdate(); zoomed = true;
                 }
                 break;
             case "-":
                 if (event.ctrlKey || !event.altKey && !event.metaKey) { // Allow Ctrl+- or just -
-                    currentZoomLevel = Math.max(MIN_ZOOM, currentZoomLevel - ZOOM_STEP); applyZoom(); zoomed = true;
+                    currentZoomLevel = Math.max(MIN_ZOOM, currentZoomLevel - ZOOM_STEP); scheduleZoomUpdate(); zoomed = true;
                 }
                 break;
             case "0":
                 if (event.ctrlKey || !event.altKey && !event.metaKey) { // Allow Ctrl+0 or just 0
-                    currentZoomLevel = 1.0; applyZoom(); zoomed = true;
+                    currentZoomLevel = 1.0; scheduleZoomUpdate(); zoomed = true;
                 }
                 break;
         }
@@ -433,47 +701,128 @@ JAVASCRIPT_TO_INJECT = """
             else if (event.deltaY > 0) currentZoomLevel -= ZOOM_STEP;
             currentZoomLevel = Math.max(MIN_ZOOM, Math.min(MAX_ZOOM, currentZoomLevel));
             if (currentZoomLevel !== prevZoomLevel) {
-                applyZoom();
+                scheduleZoomUpdate();
+            }
+        } else {
+            stopScrollAnimation(); // Native wheel scrolling takes over from momentum or key scrolling
+        }
+    }
+
+    // Scroll engine: input handlers only record where the page should be (drag position, momentum,
+    // arrow key target) and one requestAnimationFrame callback writes it, so there is at most one
+    // scroll write per frame however many events arrive. Smooth scroll-behavior is switched off
+    // while the engine drives the scroll position, as every write would start its own animation.
+    function setSmoothScrolling(enabled) {
+        document.documentElement.style.scrollBehavior = enabled ? '' : 'auto';
+    }
+
+    function scheduleScrollFrame() {
+        if (scrollFrame === null) scrollFrame = requestAnimationFrame(runScrollFrame);
+    }
+
+    function runScrollFrame(now) {
+        scrollFrame = null;
+        perfCount('scrollFrames'); // @instrument
+        const frames = lastScrollFrameTime ? Math.min(now - lastScrollFrameTime, 100) / (1000 / 60) : 1;
+        lastScrollFrameTime = now;
+        const maxScrollY = document.documentElement.scrollHeight - window.innerHeight;
+        let targetY = window.scrollY;
+        if (dragPointerId !== null) {
+            targetY = dragStartScrollTop - (dragY - dragStartY);
+        } else if (momentumVelocity !== 0) {
+            targetY = window.scrollY - momentumVelocity * frames * (1000 / 60);
+            momentumVelocity *= Math.pow(MOMENTUM_FRICTION, frames);
+            if (Math.abs(momentumVelocity) < MOMENTUM_MIN_VELOCITY || targetY <= 0 || targetY >= maxScrollY) {
+                momentumVelocity = 0;
+            }
+        } else if (keyScrollTarget !== null) {
+            const remaining = keyScrollTarget - window.scrollY;
+            targetY = window.scrollY + remaining * (1 - Math.pow(1 - ARROW_KEY_SCROLL_EASE, frames));
+            if (Math.abs(keyScrollTarget - targetY) < 1) {
+                targetY = keyScrollTarget;
+                keyScrollTarget = null;
             }
         }
+        window.scrollTo(0, Math.max(0, Math.min(maxScrollY, targetY)));
+        if (momentumVelocity !== 0 || keyScrollTarget !== null) {
+            scheduleScrollFrame(); // Animations run every frame; drags only when the pointer moves
+        } else if (dragPointerId === null) {
+            lastScrollFrameTime = 0;
+            setSmoothScrolling(true);
+        }
     }
 
-    function handleMouseDown(event) {
-        if (event.button !== 0 || event.target.closest('.textBox, a, button, input, select, textarea')) return;
-        if (event.clientX >= document.documentElement.clientWidth || event.clientY >= document.documentElement.clientHeight) return;
-        isDragging = true;
-        startY = event.clientY;
-        startScrollTop = window.scrollY;
-        document.body.classList.add('is-dragging');
-        event.preventDefault();
+    function stopScrollAnimation() {
+        momentumVelocity = 0;
+        keyScrollTarget = null;
     }
 
-    function handleMouseMove(event) {
-        if (!isDragging) return;
-        window.scrollTo(0, startScrollTop - (event.clientY - startY));
+    function scrollByKey(delta) {
+        momentumVelocity = 0;
+        const maxScrollY = document.documentElement.scrollHeight - window.innerHeight;
+        keyScrollTarget = Math.max(0, Math.min(maxScrollY, (keyScrollTarget === null ? window.scrollY : keyScrollTarget) + delta));
+        setSmoothScrolling(false);
+        scheduleScrollFrame();
     }
 
-    function handleMouseUp(event) {
-        if (isDragging && event.button === 0) {
-            isDragging = false;
-            document.body.classList.remove('is-dragging');
+    function endDrag(event, withMomentum) {
+        if (event.pointerId !== dragPointerId) return;
+        dragPointerId = null;
+        document.body.classList.remove('is-dragging');
+        // Release velocity over the last MOMENTUM_SAMPLE_MS of movement, if the pointer was still moving
+        const [firstTime, firstY] = dragSamples[0];
+        const [lastTime, lastY] = dragSamples[dragSamples.length - 1];
+        if (withMomentum && event.timeStamp - lastTime < 50 && lastTime > firstTime) {
+            momentumVelocity = (lastY - firstY) / (lastTime - firstTime);
         }
+        dragSamples = [];
+        scheduleScrollFrame();
     }
 
-    function handleMouseLeaveDocument(event) {
-        if (isDragging && (event.relatedTarget === null || event.target.nodeName === 'HTML')) {
-             isDragging = false;
-             document.body.classList.remove('is-dragging');
+    function handlePointerDown(event) {
+        if (!event.isPrimary || dragPointerId !== null) return;
+        if (event.pointerType === 'mouse') {
+            if (event.button !== 0 || event.target.closest('.textBox, a, button, input, select, textarea')) return;
+            if (event.clientX >= document.documentElement.clientWidth || event.clientY >= document.documentElement.clientHeight) return;
+        } else if (!TOUCH_DRAG_SCROLL || event.target.closest('a, button, input, select, textarea')) {
+            return; // Touch drags may start on textboxes, which cover much of a page; a tap still reaches them
+        }
+        stopScrollAnimation();
+        dragPointerId = event.pointerId;
+        dragStartY = dragY = event.clientY;
+        dragStartScrollTop = window.scrollY;
+        dragSamples = [[event.timeStamp, event.clientY]];
+        setSmoothScrolling(false);
+        if (event.pointerType === 'mouse') {
+            document.body.classList.add('is-dragging'); // Also suppresses text selection while dragging
+            document.body.setPointerCapture(event.pointerId); // Keep receiving moves outside the window
         }
     }
 
+    function handlePointerMove(event) {
+        if (event.pointerId !== dragPointerId) return;
+        perfCount('scrollInputEvents'); // @instrument
+        dragY = event.clientY;
+        dragSamples.push([event.timeStamp, dragY]);
+        while (dragSamples.length > 2 && event.timeStamp - dragSamples[0][0] > MOMENTUM_SAMPLE_MS) dragSamples.shift();
+        scheduleScrollFrame();
+    }
+
+    function handleDragStart(event) {
+        if (dragPointerId !== null) event.preventDefault(); // No native image drag while drag-scrolling
+    }
+
     function setupEventListeners() {
         document.addEventListener('keydown', handleKeyDown, true); // Use true for capture phase to potentially override other listeners
-        document.body.addEventListener('mousedown', handleMouseDown);
-        document.addEventListener('mousemove', handleMouseMove);
-        document.addEventListener('mouseup', handleMouseUp);
-        document.addEventListener('mouseleave', handleMouseLeaveDocument); // Changed to document to catch leaving window
-        document.addEventListener('wheel', handleWheel, { passive: false });
+        document.body.addEventListener('pointerdown', handlePointerDown, { passive: true });
+        document.addEventListener('pointermove', handlePointerMove, { passive: true });
+        document.addEventListener('pointerup', event => endDrag(event, true), { passive: true });
+        document.addEventListener('pointercancel', event => endDrag(event, false), { passive: true });
+        document.addEventListener('lostpointercapture', event => endDrag(event, false), { passive: true });
+        document.addEventListener('dragstart', handleDragStart); // Not passive: cancels native image drags
+        document.addEventListener('wheel', handleWheel, { passive: false }); // Not passive: Ctrl+wheel zooms
+        if (TOUCH_DRAG_SCROLL) document.documentElement.classList.add('webtoon-touch-scroll');
+        window.addEventListener('resize', scheduleZoomUpdate, { passive: true }); // The page width drives text scaling
         console.log("Event listeners for scroll and zoom added.");
     }
 
@@ -482,11 +831,23 @@ JAVASCRIPT_TO_INJECT = """
         // Further delay to ensure Mokuro's own setup (if any residual) might have finished
         setTimeout(async () => {
             try {
+                let perfPhase = perfStart('bootstrap:disableMangaJS'); // @instrument
                 disableMangaJS();
+                perfEnd('bootstrap:disableMangaJS', 'bootstrap', perfPhase); // @instrument
+                perfPhase = perfStart('bootstrap:applyWebtoonStyles'); // @instrument
                 applyWebtoonStyles();
-                await processPagesAndTextBoxes(); // This now stores original sizes and sets initial scaled sizes
+                perfEnd('bootstrap:applyWebtoonStyles', 'bootstrap', perfPhase); // @instrument
+                perfPhase = perfStart('bootstrap:applyZoom'); // @instrument
+                applyZoom(); // Apply initial zoom level (1.0 by default); textbox fonts scale from it as pages load
+                perfEnd('bootstrap:applyZoom', 'bootstrap', perfPhase); // @instrument
+                perfPhase = perfStart('bootstrap:processPages'); // @instrument
+                await processPagesAndTextBoxes(); // Converts textbox layouts as images load
+                setupChapterHydration();
+                perfEnd('bootstrap:processPages', 'bootstrap', perfPhase); // @instrument
+                perfPhase = perfStart('bootstrap:setupEventListeners'); // @instrument
                 setupEventListeners();
-                applyZoom(); // Apply initial zoom level (1.0 by default), this will also correctly scale fonts
+                perfEnd('bootstrap:setupEventListeners', 'bootstrap', perfPhase); // @instrument
+                if (PERF_OVERLAY || location.hash.includes('webtoon-perf')) showPerfOverlay(); // @instrument
                 window.scrollTo(0, 0);
                 console.log("Mokuro to Webtoon transformation (v0.9.2) complete.");
             } catch (error) {
@@ -501,203 +862,3933 @@ JAVASCRIPT_TO_INJECT = """
 # Unique ID for the injected script to prevent duplicate injections
 INJECTED_SCRIPT_ID = "mokuro-to-webtoon-userscript-injected"
 
-def inject_script_to_html(html_file_path, final_output_path):
-    """
-    Injects the JAVASCRIPT_TO_INJECT into the given HTML file and saves it.
-    """
-    try:
-        with open(html_file_path, 'r', encoding='utf-8') as f:
-            html_content = f.read()
-    except FileNotFoundError:
-        raise
-    except Exception as e:
-        raise
+# Per-file progress of the injection API. Silent unless configured; the command line prints it
+# (see _log_to_stdout).
+logger = logging.getLogger(__name__)
 
-    soup = BeautifulSoup(html_content, 'html.parser')
+# Size of the blocks read by the streaming splice engine; bounds its memory use per file.
+SPLICE_CHUNK_SIZE = 1024 * 1024
 
-    existing_script = soup.find('script', id=INJECTED_SCRIPT_ID)
-    if existing_script:
-        print(f"  Script '{INJECTED_SCRIPT_ID}' already found. Replacing it.")
-        existing_script.decompose()
-    else:
-        print(f"  Injecting script '{INJECTED_SCRIPT_ID}'.")
+# Injection engines: "splice" streams the file and only touches the injected <script> tag,
+# "bs4" parses and re-serializes the whole document, "auto" picks the cheapest one that works.
+INJECTION_ENGINES = ("auto", "splice", "bs4")
 
-    new_script_tag = soup.new_tag('script')
-    new_script_tag['type'] = 'text/javascript'
-    new_script_tag['id'] = INJECTED_SCRIPT_ID
-    new_script_tag.string = JAVASCRIPT_TO_INJECT
+_SPLICE_ID_RE = re.compile(rb"""\bid\s*=\s*(["']?)""" + re.escape(INJECTED_SCRIPT_ID.encode()) + rb"""\1(?=[\s/>])""")
+_SPLICE_TAG_RE = re.compile(rb"<(!--|script(?=[\s/>])|style(?=[\s/>])|/(?:body|head|html)(?=[\s>]))")
 
-    target_element = soup.body or soup.head or soup.html
-    if target_element:
-        if not soup.body and soup.head:
-             print("  Warning: <body> tag not found. Appending script to <head>.")
-        elif not soup.body and not soup.head and soup.html:
-             print("  Warning: <body> and <head> not found. Appending script to root <html>.")
-        target_element.append(new_script_tag)
-    else:
-        raise Exception("No <html>, <head>, or <body> tag found. Cannot inject script.")
+# Files picked up from input directories unless --include is given.
+HTML_INCLUDE_PATTERNS = ("*.html", "*.htm")
 
-    try:
-        output_dir = os.path.dirname(final_output_path)
-        if output_dir: # Only create if final_output_path implies a subdirectory
-            os.makedirs(output_dir, exist_ok=True)
-
-        with open(final_output_path, 'w', encoding='utf-8') as f:
-            f.write(str(soup))
-        print(f"  Successfully saved: {final_output_path}")
-    except Exception as e:
-        raise
+# How the script is delivered: "inline" copies it into every chapter, "shared" writes one
+# minified, versioned asset per library root and injects only a <script src> reference.
+ASSET_MODES = ("inline", "shared")
+SHARED_ASSET_FILENAME = "mokuro-webtoon.{script_hash}.js"
 
-if __name__ == "__main__":
-    parser = argparse.ArgumentParser(
-        description="Injects a specific JavaScript into HTML file(s) or all HTML files in specified directorie(s) for Mokuro webtoon style.",
-        formatter_class=argparse.RawTextHelpFormatter
-    )
-    parser.add_argument(
-        "input_paths",
-        nargs='+',
-        help="Path(s) to input HTML file(s) and/or directorie(s) containing HTML files."
-             "\n(e.g., 'manga-ch1.html' 'my_manga_folder/' './another_folder')."
-    )
-    parser.add_argument(
-        "-o", "--output",
-        help="Output file path (if single resolved input file & output is a file name), "
-             "or output directory (if multiple resolved input files, or single input & output is a directory path). "
-             "\nIf not provided, input file(s) will be overwritten (with a single confirmation at the start)."
-    )
-    parser.add_argument(
-        "-y", "--yes",
-        action="store_true",
-        help="Automatically confirm all overwrites. Use with caution."
-    )
+# Per-directory manifest of injected files, used with --manifest to skip up-to-date files
+# from a single stat call.
+MANIFEST_FILENAME = ".mokuro-webtoon-manifest.json"
+MANIFEST_VERSION = 1
+
+# How much of the end of a file is searched for the injected tag when checking its hash.
+HASH_PROBE_TAIL_BYTES = 256 * 1024
+
+_INJECTED_HASH_RE = re.compile(rb'<script\s+data-script-hash="([0-9a-f]+)"\s+id="' + re.escape(INJECTED_SCRIPT_ID.encode()) + rb'"')
+
+# Default number of files whose data is flushed to disk together before being renamed into place.
+FSYNC_BATCH_SIZE = 64
+# Threads fsyncing a batch's files concurrently, so the filesystem can commit them in one journal flush.
+FSYNC_THREADS = 8
+
+# Compressed siblings written next to outputs by --precompress (Content-Encoding, suffix), in the
+# order the serve subcommand prefers them. Brotli is only written if the brotli module is installed.
+PRECOMPRESS_ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+PRECOMPRESS_MIN_BYTES = 1024 # Smaller files are not worth a compressed sibling
 
-    args = parser.parse_args()
+# Journal of completed input files, used by --resume to continue an interrupted batch.
+DEFAULT_JOURNAL_PATH = ".mokuro-webtoon-journal.txt"
 
-    # --- 1. Resolve input_paths to a list of actual HTML files ---
-    resolved_html_files = set() # Use a set to avoid duplicates
-    for path_arg in args.input_paths:
-        path_arg = os.path.abspath(path_arg) # Normalize path
-        if os.path.isfile(path_arg):
-            if path_arg.lower().endswith(('.html', '.htm')):
-                resolved_html_files.add(path_arg)
+class SpliceFallback(Exception):
+    """Raised when a document cannot be handled by the splice engine and needs a full parse."""
+
+def minify_javascript(source):
+    """
+    Conservatively minifies JavaScript: removes comments and collapses whitespace outside of
+    string, template and regex literals. Line breaks are kept (one per run of blank lines),
+    so automatic semicolon insertion behaves exactly as in the original source.
+    """
+    out = []
+    i = 0
+    n = len(source)
+    last_significant = ""  # Last non-whitespace character emitted, for regex detection
+    pending_space = ""     # Collapsed whitespace waiting to be emitted ("", " " or "\n")
+    template_depth = []    # Brace depth at which each open template literal resumes
+
+    def flush_space():
+        nonlocal pending_space
+        if pending_space and out:
+            out.append(pending_space)
+        pending_space = ""
+
+    def read_template(start):
+        """Copies a template literal chunk starting after ` or }; returns the index after it."""
+        j = start
+        while j < n:
+            ch = source[j]
+            if ch == "\\":
+                j += 2
+                continue
+            if ch == "`":
+                out.append(source[start:j + 1])
+                return j + 1, False
+            if ch == "$" and source.startswith("${", j):
+                out.append(source[start:j + 2])
+                return j + 2, True
+            j += 1
+        raise ValueError("Unterminated template literal")
+
+    while i < n:
+        ch = source[i]
+        if ch in " \t\r\n":
+            if ch == "\n" or pending_space == "\n":
+                pending_space = "\n"
             else:
-                print(f"Warning: Skipping non-HTML file specified directly: {path_arg}")
-        elif os.path.isdir(path_arg):
-            print(f"Scanning directory: {path_arg}")
-            found_in_dir = 0
-            for item in os.listdir(path_arg):
-                item_path = os.path.join(path_arg, item)
-                if os.path.isfile(item_path) and item_path.lower().endswith(('.html', '.htm')):
-                    resolved_html_files.add(item_path)
-                    found_in_dir +=1
-            if found_in_dir == 0:
-                print(f"  No .html or .htm files found in directory: {path_arg}")
+                pending_space = " "
+            i += 1
+            continue
+        if source.startswith("//", i):
+            end = source.find("\n", i)
+            i = n if end == -1 else end
+            continue
+        if source.startswith("/*", i):
+            end = source.find("*/", i + 2)
+            if end == -1:
+                raise ValueError("Unterminated block comment")
+            if not pending_space:
+                pending_space = " "
+            i = end + 2
+            continue
+
+        flush_space()
+        if ch in "'\"":
+            j = i + 1
+            while j < n and source[j] != ch:
+                j += 2 if source[j] == "\\" else 1
+            out.append(source[i:j + 1])
+            i = j + 1
+        elif ch == "`":
+            out.append("`")
+            i, opened = read_template(i + 1)
+            if opened:
+                template_depth.append(0)
+        elif ch == "/" and (not last_significant or last_significant in "(,=:[!&|?{};+-*%<>~^"):
+            j = i + 1
+            in_class = False
+            while j < n and (in_class or source[j] != "/"):
+                if source[j] == "\\":
+                    j += 1
+                elif source[j] == "[":
+                    in_class = True
+                elif source[j] == "]":
+                    in_class = False
+                j += 1
+            j += 1
+            while j < n and (source[j].isalnum() or source[j] == "_"):
+                j += 1 # Flags
+            out.append(source[i:j])
+            i = j
+        elif ch in "{}" and template_depth:
+            if ch == "{":
+                template_depth[-1] += 1
+                out.append(ch)
+                i += 1
+            elif template_depth[-1] == 0:
+                out.append("}")
+                template_depth.pop()
+                i, opened = read_template(i + 1)
+                if opened:
+                    template_depth.append(0)
             else:
-                print(f"  Found {found_in_dir} HTML file(s) in {path_arg}")
+                template_depth[-1] -= 1
+                out.append(ch)
+                i += 1
         else:
-            print(f"Warning: Input path not found or not a file/directory: {path_arg}")
+            out.append(ch)
+            i += 1
+        last_significant = out[-1][-1]
+    return "".join(out).strip() + "\n"
 
-    actual_files_to_process = sorted(list(resolved_html_files)) # Convert to sorted list for consistent order
+# Injection options that configure the script itself, mapped to the `const` they replace.
+SCRIPT_OPTION_CONSTANTS = {
+    "lazy_loading": "LAZY_LOAD_PAGES",
+    "lazy_margin": "LAZY_LOAD_MARGIN_PX",
+    "evict_margin": "EVICT_MARGIN_PX",
+    "perf_overlay": "PERF_OVERLAY",
+    "touch_scroll": "TOUCH_DRAG_SCROLL",
+}
 
-    if not actual_files_to_process:
-        print("No HTML files found to process. Exiting.")
-        exit(0)
+# Instrumentation lives between `// @instrument-begin` and `// @instrument-end` lines and on
+# lines ending in `// @instrument`; unless --instrument is given it is compiled out of the
+# payload, together with the single-line console.log progress messages.
+_INSTRUMENT_BLOCK_RE = re.compile(r"^[ \t]*// @instrument-begin\n.*?^[ \t]*// @instrument-end\n", re.MULTILINE | re.DOTALL)
+_INSTRUMENT_LINE_RE = re.compile(r"^[^\n]*// @instrument\n", re.MULTILINE)
+_CONSOLE_LOG_LINE_RE = re.compile(r"^[ \t]*console\.log\([^\n]*\);[ \t]*\n", re.MULTILINE)
+_INSTRUMENT_MARKER_RE = re.compile(r"[ \t]*// @instrument(?:-begin|-end)?$", re.MULTILINE)
 
-    print(f"\nTotal unique HTML files to process: {len(actual_files_to_process)}")
-    # --- End of input file resolution ---
+def strip_instrumentation(javascript):
+    """Returns javascript without its instrumentation and console.log lines."""
+    javascript = _INSTRUMENT_BLOCK_RE.sub("", javascript)
+    javascript = _INSTRUMENT_LINE_RE.sub("", javascript)
+    return _CONSOLE_LOG_LINE_RE.sub("", javascript)
 
+def configure_javascript(javascript, instrument=False, **script_options):
+    """
+    Returns javascript with the `const` declarations named in SCRIPT_OPTION_CONSTANTS set to
+    the given option values. Options left as None keep the script's defaults.
+    Unless instrument is set, the instrumentation is compiled out (see strip_instrumentation).
+    """
+    unknown = sorted(set(script_options) - set(SCRIPT_OPTION_CONSTANTS))
+    if unknown:
+        raise ValueError(f"Unknown script option(s): {', '.join(unknown)} "
+                         f"(choose from instrument, {', '.join(SCRIPT_OPTION_CONSTANTS)}).")
+    if script_options.get("perf_overlay") is not None and not instrument:
+        raise ValueError("The performance overlay requires an instrumented build.")
+    for option, value in script_options.items():
+        if value is None:
+            continue
+        literal = json.dumps(value) # Python bools/ints/strings map onto JS literals
+        javascript, count = re.subn(rf"(\bconst {SCRIPT_OPTION_CONSTANTS[option]} = )[^;]+;",
+                                    lambda m: m.group(1) + literal + ";", javascript, count=1)
+        if not count:
+            raise ValueError(f"Script constant for option '{option}' not found.")
+    if instrument:
+        return _INSTRUMENT_MARKER_RE.sub("", javascript)
+    return strip_instrumentation(javascript)
 
-    # --- 2. Validate --output based on the number of resolved files ---
-    if args.output and len(actual_files_to_process) > 1:
-        # If output is specified and there are multiple files, output MUST be a directory
-        if os.path.exists(args.output) and not os.path.isdir(args.output):
-            print(f"Error: Output path '{args.output}' is an existing file. "
-                  "For multiple input files, --output must specify a directory.")
-            exit(1)
-    # --- End of output validation ---
+@functools.lru_cache(maxsize=None)
+def build_payload(asset_mode="inline", **script_options):
+    """
+    Returns (script_hash, javascript) of the payload for the given asset mode and script
+    options: the configured script as written for inline injection, or its minified form for
+    the shared asset.
+    """
+    javascript = configure_javascript(JAVASCRIPT_TO_INJECT, **script_options)
+    if asset_mode == "shared":
+        javascript = minify_javascript(javascript)
+    return hashlib.sha256(javascript.encode('utf-8')).hexdigest()[:16], javascript
 
+# Hash and text of the default payload (inline, default script options). The hash is stored on
+# the injected tag so re-runs can skip files that already carry the current script without
+# parsing them; other builds pass the hash returned by build_payload.
+SCRIPT_HASH, DEFAULT_JAVASCRIPT = build_payload("inline")
 
-    # --- 3. Handle overwrite confirmation if no -o is given ---
-    proceed_with_overwrites = False
-    if not args.output: # Overwrite mode is active
-        if args.yes:
-            proceed_with_overwrites = True
-            print("\nOverwrite mode: -y specified, all input files will be overwritten if possible.")
+def write_shared_asset(library_root, **script_options):
+    """
+    Writes the minified, versioned shared script into library_root unless it already exists,
+    and returns its path. Older versions are left in place for chapters not yet rewritten.
+    """
+    script_hash, javascript = build_payload("shared", **script_options)
+    asset_path = os.path.join(library_root, SHARED_ASSET_FILENAME.format(script_hash=script_hash))
+    if not os.path.exists(asset_path):
+        with atomic_write(asset_path) as f:
+            f.write(javascript)
+    return asset_path
+
+def build_script_tag(script_hash=SCRIPT_HASH, javascript=DEFAULT_JAVASCRIPT, src=None):
+    """
+    Returns the complete injected <script> element as a string, serialized the same way
+    BeautifulSoup serializes the tag created by the bs4 engine. With src, the element only
+    references the shared asset.
+    """
+    if src:
+        return (f'<script data-script-hash="{script_hash}" id="{INJECTED_SCRIPT_ID}" '
+                f'src="{html.escape(src)}" type="text/javascript"></script>')
+    return (f'<script data-script-hash="{script_hash}" id="{INJECTED_SCRIPT_ID}" type="text/javascript">'
+            f'{javascript}</script>')
+
+_umask = None # Process umask, read on first use (see process_umask)
+
+def process_umask(allow_round_trip=False):
+    """
+    Returns the process umask, read from /proc/self/status where available. os.umask has no
+    getter, and setting it to read it changes it for every thread for a moment, so that is only
+    done with allow_round_trip (by the command line entry point, before any other thread runs). Until then 0o022 is
+    assumed on platforms without /proc.
+    """
+    global _umask
+    if _umask is None:
+        try:
+            with open("/proc/self/status", encoding="ascii", errors="replace") as f:
+                for line in f:
+                    if line.startswith("Umask:"):
+                        _umask = int(line.split()[1], 8)
+                        break
+        except (OSError, ValueError, IndexError):
+            pass
+    if _umask is None and allow_round_trip:
+        _umask = os.umask(0)
+        os.umask(_umask)
+    return 0o022 if _umask is None else _umask
+
+def create_temp_output(final_output_path):
+    """
+    Creates the destination directory if needed and returns (fd, path) of a new temporary
+    file next to final_output_path, so it can later be renamed onto it atomically.
+    """
+    output_dir = os.path.dirname(final_output_path)
+    if output_dir: # Only create if final_output_path implies a subdirectory
+        os.makedirs(output_dir, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(prefix=".mokuro-", suffix=".tmp", dir=output_dir or ".")
+    if hasattr(os, "fchmod"):
+        # mkstemp creates 0600 files; give the output the permissions a plain open() would,
+        # or keep those of the file being replaced
+        try:
+            mode = os.stat(final_output_path).st_mode & 0o7777
+        except OSError:
+            mode = 0o666 & ~process_umask()
+        os.fchmod(fd, mode)
+    return fd, temp_path
+
+@contextlib.contextmanager
+def staged_output(final_output_path, mode='w'):
+    """
+    Yields (file, temp_path) for a temporary file created by create_temp_output. The file is
+    closed when the with block ends and removed if the block raises; otherwise renaming it onto
+    final_output_path is left to the caller.
+    """
+    fd, temp_path = create_temp_output(final_output_path)
+    try:
+        with os.fdopen(fd, mode, encoding=None if 'b' in mode else 'utf-8') as f:
+            yield f, temp_path
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(temp_path)
+        raise
+
+@contextlib.contextmanager
+def atomic_write(path, mode='w'):
+    """
+    Yields a file whose contents replace path atomically once the with block succeeds. Readers
+    see either the old file or the complete new one; on error path is left untouched.
+    """
+    with staged_output(path, mode) as (f, temp_path):
+        yield f
+        f.close()
+        os.replace(temp_path, path)
+
+def _fsync_path(path, directory=False):
+    """fsyncs a file or (on POSIX) a directory by path."""
+    if directory and not hasattr(os, "O_DIRECTORY"):
+        return # Directories cannot be opened for fsync on this platform
+    fd = os.open(path, (os.O_RDONLY | os.O_DIRECTORY) if directory else os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+class AtomicWriteBatch:
+    """
+    Renames staged temporary files onto their final paths in batches. Before a batch is renamed
+    its staged files are fsynced together (concurrently, see FSYNC_THREADS), and the touched
+    directories are fsynced once each afterwards, so every rename is crash-safe without paying
+    for a sequential file and directory fsync per file.
+    """
+
+    def __init__(self, batch_size=FSYNC_BATCH_SIZE):
+        self.batch_size = max(1, batch_size)
+        self.staged = [] # (temp_path, final_path, payload)
+
+    def add(self, temp_path, final_path, payload=None):
+        """
+        Stages a file; returns the payloads of any files committed as a result (files staged
+        without a payload, such as compressed siblings, are committed but not reported).
+        """
+        self.staged.append((temp_path, final_path, payload))
+        if len(self.staged) >= self.batch_size:
+            return self.commit()
+        return []
+
+    def commit(self):
+        """Flushes, renames and fsyncs the directories of all staged files; returns their payloads."""
+        staged, self.staged = self.staged, []
+        if not staged:
+            return []
+        # Only our own files: os.sync would wait on every filesystem's I/O. fsync releases the GIL,
+        # and concurrent fsyncs share the journal commits of ext4/XFS instead of waiting one by one.
+        temp_paths = [temp_path for temp_path, _, _ in staged]
+        if len(temp_paths) > 1:
+            with ThreadPoolExecutor(max_workers=min(FSYNC_THREADS, len(temp_paths))) as pool:
+                list(pool.map(_fsync_path, temp_paths))
         else:
-            num_files_to_overwrite = len(actual_files_to_process)
-            plural_s = "s" if num_files_to_overwrite > 1 else ""
-            confirm_msg = (
-                f"\nNo output destination specified. This will attempt to overwrite "
-                f"{num_files_to_overwrite} resolved input file{plural_s}.\n"
-                "Are you sure you want to proceed with overwriting ALL applicable files? (yes/no): "
-            )
-            initial_confirm = input(confirm_msg).lower()
-            if initial_confirm == 'yes':
-                proceed_with_overwrites = True
-                print("Overwrite mode: Confirmed. Applicable input files will be overwritten.")
-            else:
-                print("Operation cancelled by user. No files will be overwritten.")
-                exit(0)
-    # --- End of overwrite confirmation ---
+            _fsync_path(temp_paths[0])
+        for temp_path, final_path, _ in staged:
+            os.replace(temp_path, final_path)
+        for directory in sorted({os.path.dirname(os.path.abspath(final_path)) for _, final_path, _ in staged}):
+            with contextlib.suppress(OSError):
+                _fsync_path(directory, directory=True)
+        return [payload for _, _, payload in staged if payload is not None]
 
-    # --- 4. Process each resolved file ---
-    total_files = len(actual_files_to_process)
-    processed_count = 0
-    skipped_count = 0
-
-    for i, input_path in enumerate(actual_files_to_process):
-        print(f"\n[{i+1}/{total_files}] Processing: {input_path}")
-
-        actual_output_path = ""
-
-        if args.output:
-            if len(actual_files_to_process) > 1: # Multiple resolved files -> output must be dir
-                # Ensure output directory exists (or can be created)
-                if not os.path.exists(args.output):
-                     os.makedirs(args.output, exist_ok=True)
-                     print(f"  Created output directory: {args.output}")
-                elif not os.path.isdir(args.output): # Should have been caught by pre-validation
-                    print(f"  Internal Error: Output path '{args.output}' is not a directory.")
-                    skipped_count += 1
-                    continue
-                actual_output_path = os.path.join(args.output, os.path.basename(input_path))
-            else: # Single resolved file with -o argument
-                if args.output.endswith(os.path.sep) or \
-                   (os.path.exists(args.output) and os.path.isdir(args.output)): # Output is a dir
-                    if not os.path.exists(args.output):
-                        os.makedirs(args.output, exist_ok=True)
-                        print(f"  Created output directory: {args.output}")
-                    actual_output_path = os.path.join(args.output, os.path.basename(input_path))
-                else: # Output is a specific file name
-                    actual_output_path = args.output
-        else: # Overwrite mode
-            if not proceed_with_overwrites: # Should have exited if user said no
-                print(f"  Skipping overwrite for {input_path} (internal safeguard).")
-                skipped_count += 1
-                continue
-            actual_output_path = input_path
-        
-        # Userscript @match filename check/warning (optional)
-        # For the new script, the @match is file:///*, so this specific warning is less relevant
-        # but kept for structure.
-        # expected_filename_part = "-Zombie-Sagashitemasu-01.html" 
-        # if expected_filename_part not in os.path.basename(input_path):
-        #     print(f"  Warning: Input filename '{os.path.basename(input_path)}' "
-        #           f"does not match the example pattern ('{expected_filename_part}') "
-        #           "from the userscript's @match directive. "
-        #           "The script will be injected, but it might not be the intended file type.")
+    def discard(self):
+        """Removes all staged temporary files without renaming them."""
+        staged, self.staged = self.staged, []
+        for temp_path, _, _ in staged:
+            with contextlib.suppress(OSError):
+                os.remove(temp_path)
+
+def _brotli_module():
+    try:
+        import brotli # Optional dependency, only needed for the .br siblings
+    except ImportError:
+        return None
+    return brotli
+
+def precompress_suffixes():
+    """Returns the sibling suffixes --precompress writes with the modules available."""
+    return tuple(suffix for encoding, suffix in PRECOMPRESS_ENCODINGS if encoding != "br" or _brotli_module())
 
+def precompressed_is_current(path):
+    """True if every compressed sibling of path exists and is not older than path itself."""
+    try:
+        file_stat = os.stat(path)
+    except OSError:
+        return False
+    if file_stat.st_size < PRECOMPRESS_MIN_BYTES:
+        return True
+    for suffix in precompress_suffixes():
         try:
-            inject_script_to_html(input_path, actual_output_path)
-            processed_count += 1
-        except FileNotFoundError:
-            print(f"  Error: Input file not found during processing: {input_path}") 
-            skipped_count += 1
-        except Exception as e:
-            print(f"  Error processing file {input_path}: {e}")
-            skipped_count += 1
-    
-    print(f"\n--- Batch Processing Summary ---")
-    print(f"Total unique HTML files considered: {total_files}")
-    print(f"Successfully processed: {processed_count}")
-    print(f"Skipped or failed:    {skipped_count}")
\ No newline at end of file
+            if os.stat(path + suffix).st_mtime_ns < file_stat.st_mtime_ns:
+                return False
+        except OSError:
+            return False
+    return True
+
+def precompress_file(path, source_path=None, staged=False):
+    """
+    Writes the compressed siblings of path (path.gz, and path.br if the brotli module is
+    installed) from the contents of source_path, by default path itself, so a server can send
+    them with a Content-Encoding instead of compressing on every request. source_path may be
+    the staged temporary file of path; the siblings are written after it and are therefore never
+    older than the file they belong to.
+    With staged=True the renames are left to the caller and [(temp_path, sibling_path)] is
+    returned, otherwise the list of sibling paths written.
+    """
+    source_path = source_path or path
+    if os.path.getsize(source_path) < PRECOMPRESS_MIN_BYTES:
+        return []
+    written = []
+    try:
+        for suffix in precompress_suffixes():
+            with open(source_path, 'rb') as src, staged_output(path + suffix, 'wb') as (dst, temp_path):
+                written.append((temp_path, path + suffix))
+                if suffix == ".br":
+                    brotli = _brotli_module()
+                    compressor = brotli.Compressor(mode=brotli.MODE_TEXT, quality=11)
+                    for chunk in iter(functools.partial(src.read, SPLICE_CHUNK_SIZE), b""):
+                        dst.write(compressor.process(chunk))
+                    dst.write(compressor.finish())
+                else:
+                    # mtime=0 keeps the output reproducible, so unchanged files compress identically
+                    with gzip.GzipFile(filename="", mode='wb', compresslevel=9, fileobj=dst, mtime=0) as gz:
+                        shutil.copyfileobj(src, gz, SPLICE_CHUNK_SIZE)
+    except BaseException:
+        for temp_path, _ in written:
+            with contextlib.suppress(OSError):
+                os.remove(temp_path)
+        raise
+    if staged:
+        return written
+    for temp_path, sibling_path in written:
+        os.replace(temp_path, sibling_path)
+    return [sibling_path for _, sibling_path in written]
+
+def load_journal(journal_path):
+    """Returns the set of input paths recorded as completed in the journal."""
+    try:
+        with open(journal_path, 'r', encoding='utf-8') as f:
+            return {line.rstrip("\n") for line in f if line.strip()}
+    except FileNotFoundError:
+        return set()
+
+def read_injected_hash(html_file_path):
+    """
+    Returns the data-script-hash of the injected script found near the end of the file,
+    or None. Only the last HASH_PROBE_TAIL_BYTES are read; the document is not parsed.
+    """
+    with open(html_file_path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        f.seek(max(0, f.tell() - HASH_PROBE_TAIL_BYTES))
+        tail = f.read()
+    matches = _INJECTED_HASH_RE.findall(tail)
+    return matches[-1].decode() if matches else None
+
+def is_up_to_date(html_file_path, final_output_path, script_hash=SCRIPT_HASH):
+    """
+    True if final_output_path already carries the current script and, when it is a separate
+    output file, is not older than its source.
+    """
+    try:
+        if os.path.abspath(html_file_path) != os.path.abspath(final_output_path):
+            if os.stat(final_output_path).st_mtime_ns < os.stat(html_file_path).st_mtime_ns:
+                return False
+        return read_injected_hash(final_output_path) == script_hash
+    except OSError:
+        return False
+
+def load_manifest(directory):
+    """Returns the file entries of the manifest in directory, or an empty dict."""
+    try:
+        with open(os.path.join(directory, MANIFEST_FILENAME), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(manifest, dict) or manifest.get("version") != MANIFEST_VERSION:
+        return {}
+    files = manifest.get("files")
+    return files if isinstance(files, dict) else {}
+
+def save_manifest(directory, files):
+    """Atomically writes the manifest for directory."""
+    manifest_path = os.path.join(directory, MANIFEST_FILENAME)
+    with atomic_write(manifest_path) as f:
+        json.dump({"version": MANIFEST_VERSION, "files": files}, f, indent=1, sort_keys=True)
+
+def manifest_entry(html_file_path, final_output_path, script_hash=SCRIPT_HASH):
+    """Builds the manifest entry (size, mtime, script hash) for a freshly written output file."""
+    output_stat = os.stat(final_output_path)
+    entry = {"size": output_stat.st_size, "mtime_ns": output_stat.st_mtime_ns, "script_hash": script_hash}
+    if os.path.abspath(html_file_path) != os.path.abspath(final_output_path):
+        source_stat = os.stat(html_file_path)
+        entry["source_size"] = source_stat.st_size
+        entry["source_mtime_ns"] = source_stat.st_mtime_ns
+    return entry
+
+def manifest_is_current(entry, html_file_path, final_output_path, script_hash=SCRIPT_HASH):
+    """True if the manifest entry still describes the files on disk and the current script."""
+    if not entry or entry.get("script_hash") != script_hash:
+        return False
+    try:
+        return manifest_entry(html_file_path, final_output_path, script_hash) == \
+            {key: value for key, value in entry.items() if key != "chapter"}
+    except OSError:
+        return False
+
+_CLASS_ATTR_RE = re.compile(rb"""\sclass\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s>"']+))""", re.IGNORECASE)
+_PAGE_IMAGE_ATTR_RE = re.compile(
+    rb"""\sstyle\s*=\s*"[^"]*?background-image\s*:\s*url\(\s*(?:&quot;|')?([^)"]*?)(?:&quot;|')?\s*\)"""
+    rb"""|\sdata-source-image\s*=\s*"([^"]*)\"""", re.IGNORECASE)
+MAX_TAG_CARRY_BYTES = 4096 # Tags longer than this may straddle two chunks and be missed
+
+class ChapterMetadataScanner:
+    """
+    Collects a chapter's page count, textbox count and first page image from its raw bytes,
+    fed in arbitrary chunks (e.g. alongside the splice scan), without parsing the document.
+    """
+    def __init__(self):
+        self.pages = 0
+        self.text_boxes = 0
+        self.thumbnail = None
+        self._carry = b""
+
+    def feed(self, chunk):
+        data = self._carry + chunk
+        cut = data.rfind(b"<") # Hold back the last, possibly incomplete, tag
+        if cut == -1 or len(data) - cut > MAX_TAG_CARRY_BYTES:
+            cut = len(data)
+        self._scan(data[:cut])
+        self._carry = data[cut:]
+
+    def _scan(self, data):
+        for m in _CLASS_ATTR_RE.finditer(data):
+            classes = (m.group(1) or m.group(2) or m.group(3) or b"").lower().split()
+            self.pages += b"page" in classes
+            self.text_boxes += b"textbox" in classes
+        if self.thumbnail is None:
+            m = _PAGE_IMAGE_ATTR_RE.search(data)
+            if m:
+                self.thumbnail = html.unescape((m.group(1) or m.group(2)).decode('utf-8', 'replace'))
+
+    def result(self):
+        self._scan(self._carry)
+        self._carry = b""
+        return {"pages": self.pages, "textboxes": self.text_boxes, "thumbnail": self.thumbnail}
+
+def scan_chapter_metadata(html_file_path, chunk_size=SPLICE_CHUNK_SIZE):
+    """Streams html_file_path through a ChapterMetadataScanner and returns its result."""
+    scanner = ChapterMetadataScanner()
+    with open(html_file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            scanner.feed(chunk)
+    return scanner.result()
+
+def soup_chapter_metadata(soup):
+    """Same result as scan_chapter_metadata, from an already parsed document."""
+    first_container = soup.find(class_="pageContainer")
+    thumbnail = None
+    if first_container is not None:
+        thumbnail = page_background_url(first_container) or first_container.get("data-source-image")
+    return {"pages": len(soup.find_all(class_="page")), "textboxes": len(soup.find_all(class_="textBox")),
+            "thumbnail": thumbnail}
+
+# Library index pages (--index), generated from the manifest entries' chapter metadata.
+INDEX_FILENAME = "index.html"
+INDEX_GENERATOR = "mokuro-webtoon-index" # <meta name="generator"> marking the index pages we write
+INDEX_PROBE_BYTES = 4096
+_INDEX_GENERATOR_RE = re.compile(rb'<meta\s+name="generator"\s+content="' + re.escape(INDEX_GENERATOR.encode()) + rb'"')
+
+INDEX_TEMPLATE = """<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="UTF-8">
+<meta name="viewport" content="width=device-width, initial-scale=1.0">
+<meta name="generator" content="{generator}">
+<title>{title}</title>
+<style>
+body {{ margin: 0 auto; max-width: 960px; padding: 16px; font-family: sans-serif; background: #c4c3d0; color: #222; }}
+h1 {{ font-size: 1.4em; }}
+ul {{ list-style: none; padding: 0; display: grid; grid-template-columns: repeat(auto-fill, minmax(150px, 1fr)); gap: 12px; }}
+li a {{ display: block; color: inherit; text-decoration: none; background: #fff; border-radius: 6px; overflow: hidden; }}
+li img {{ display: block; width: 100%; aspect-ratio: 2 / 3; object-fit: cover; object-position: top; background: #ddd; }}
+li span {{ display: block; padding: 4px 6px; font-size: 0.85em; overflow-wrap: anywhere; }}
+li small {{ display: block; padding: 0 6px 6px; color: #666; }}
+.outdated small {{ color: #a40; }}
+</style>
+</head>
+<body>
+<h1>{title}</h1>
+{sections}
+</body>
+</html>
+"""
+
+def _index_item(href, thumbnail, name, details, css_class=""):
+    image = f'<img src="{html.escape(thumbnail)}" alt="" loading="lazy" decoding="async">' if thumbnail else "<img alt=\"\">"
+    class_attr = f' class="{css_class}"' if css_class else ""
+    return (f'<li{class_attr}><a href="{html.escape(href)}">{image}<span>{html.escape(name)}</span>'
+            f'<small>{html.escape(details)}</small></a></li>')
+
+def is_generated_index(path):
+    """Returns True if path is an index page written by write_index, judged by its generator <meta>."""
+    if os.path.basename(path).lower() != INDEX_FILENAME:
+        return False
+    try:
+        with open(path, 'rb') as f:
+            return bool(_INDEX_GENERATOR_RE.search(f.read(INDEX_PROBE_BYTES)))
+    except OSError:
+        return False
+
+def find_series_directories(library_root):
+    """Returns the directories below library_root (not itself) holding a manifest, in natural order."""
+    series = []
+    for directory, subdirs, files in os.walk(library_root):
+        subdirs[:] = sorted((name for name in subdirs if not name.startswith(".")), key=natural_sort_key)
+        if directory != library_root and MANIFEST_FILENAME in files:
+            series.append(directory)
+    return series
+
+def write_index(directory, script_hash, series_directories=()):
+    """
+    Writes INDEX_FILENAME in directory, listing the chapters recorded in its manifest (page and
+    textbox counts, first-page thumbnail, whether they carry the current script) and, for a
+    library root, the given series directories. Only manifests are read, never the chapters.
+    Returns the path written.
+    """
+    sections = []
+    series_items = []
+    for series_directory in series_directories:
+        files = load_manifest(series_directory)
+        if not files:
+            continue
+        relative_dir = os.path.relpath(series_directory, directory).replace(os.sep, "/")
+        names = sorted(files, key=natural_sort_key)
+        chapters = [files[name].get("chapter") or {} for name in names]
+        thumbnail = next((chapter["thumbnail"] for chapter in chapters if chapter.get("thumbnail")), None)
+        if thumbnail and not urllib.parse.urlsplit(thumbnail).scheme:
+            thumbnail = urllib.parse.quote(relative_dir) + "/" + thumbnail
+        pages = sum(chapter.get("pages", 0) for chapter in chapters)
+        series_items.append(_index_item(f"{urllib.parse.quote(relative_dir)}/{INDEX_FILENAME}", thumbnail,
+                                        relative_dir, f"{len(names)} chapters, {pages} pages"))
+    if series_items:
+        sections.append("<h2>Series</h2>\n<ul>\n" + "\n".join(series_items) + "\n</ul>")
+
+    files = load_manifest(directory)
+    chapter_items = []
+    for name in sorted(files, key=natural_sort_key):
+        entry = files[name]
+        chapter = entry.get("chapter") or {}
+        current = entry.get("script_hash") == script_hash
+        details = (f"{chapter.get('pages', '?')} pages, {chapter.get('textboxes', '?')} textboxes, "
+                   f"{'injected' if current else 'outdated script'}")
+        chapter_items.append(_index_item(urllib.parse.quote(name), chapter.get("thumbnail"),
+                                         os.path.splitext(name)[0], details, "" if current else "outdated"))
+    if chapter_items:
+        sections.append("<h2>Chapters</h2>\n<ul>\n" + "\n".join(chapter_items) + "\n</ul>")
+
+    index_path = os.path.join(directory, INDEX_FILENAME)
+    title = os.path.basename(os.path.abspath(directory)) or directory
+    with atomic_write(index_path) as f:
+        f.write(INDEX_TEMPLATE.format(generator=INDEX_GENERATOR, title=html.escape(title), sections="\n".join(sections)))
+    return index_path
+
+# Phases of the per-file timings gathered by inject_script_to_html (see its stats parameter)
+STAT_PHASES = ("read", "parse", "modify", "write")
+
+@contextlib.contextmanager
+def _timed(stats, phase):
+    """Adds the time spent in the with block to stats[phase], if stats is a dict."""
+    if stats is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats[phase] += time.perf_counter() - start
+
+def _scan_for_splice(html_file, chunk_size=SPLICE_CHUNK_SIZE, metadata_scanner=None, stats=None):
+    """
+    Streams the file (a path, or a binary file object read from its current position) once and
+    returns (spans, closing), where spans lists the (start, end) byte offsets of every existing
+    injected script element and closing maps 'body'/'head'/'html' to the byte offset of the last
+    closing tag of that name. Comments, <script> and <style> contents
+    are skipped so that tags inside them are never matched. Only one chunk plus a small carry-over
+    is held in memory. Raises SpliceFallback for documents the scanner cannot follow.
+    Every chunk read is also fed to metadata_scanner, if given. With a stats dict, the time
+    spent reading is added to stats["read"].
+    """
+    spans = []
+    closing = {}
+    raw_end = None        # Terminator we are looking for while inside a comment/script/style
+    script_start = None   # (offset, is_injected) of the script element we are inside
+    buf = b""
+    base = 0              # Absolute offset of buf[0]
+
+    with open(html_file, 'rb') if isinstance(html_file, (str, os.PathLike)) else contextlib.nullcontext(html_file) as f:
+        while True:
+            with _timed(stats, "read"):
+                chunk = f.read(chunk_size)
+            eof = not chunk
+            if metadata_scanner is not None:
+                metadata_scanner.feed(chunk)
+            buf += chunk
+            lower = buf.lower()
+            pos = 0
+            while True:
+                if raw_end is not None:
+                    idx = lower.find(raw_end, pos)
+                    if idx == -1:
+                        if eof:
+                            raise SpliceFallback("Unterminated comment, <script> or <style> element.")
+                        pos = max(pos, len(buf) - len(raw_end) + 1)
+                        break
+                    if raw_end == b"-->":
+                        pos = idx + 3
+                    else:
+                        gt = lower.find(b">", idx)
+                        if gt == -1:
+                            if eof:
+                                raise SpliceFallback("Unterminated closing tag.")
+                            pos = idx
+                            break
+                        if script_start is not None and script_start[1]:
+                            spans.append((script_start[0], base + gt + 1))
+                        script_start = None
+                        pos = gt + 1
+                    raw_end = None
+                    continue
+
+                lt = lower.find(b"<", pos)
+                if lt == -1:
+                    pos = len(buf)
+                    break
+                if len(buf) - lt < 10 and not eof:
+                    pos = lt
+                    break
+                m = _SPLICE_TAG_RE.match(lower, lt)
+                if not m:
+                    pos = lt + 1
+                    continue
+                token = m.group(1)
+                if token == b"!--":
+                    raw_end = b"-->"
+                    pos = m.end()
+                elif token.startswith(b"/"):
+                    closing[token[1:].decode()] = base + lt
+                    pos = m.end()
+                else:
+                    gt = lower.find(b">", m.end())
+                    if gt == -1:
+                        if eof:
+                            raise SpliceFallback("Unterminated start tag.")
+                        pos = lt
+                        break
+                    if token == b"script":
+                        is_injected = _SPLICE_ID_RE.search(lower, m.end(), gt + 1) is not None
+                        script_start = (base + lt, is_injected)
+                    raw_end = b"</" + token
+                    pos = gt + 1
+            if eof:
+                break
+            buf = buf[pos:]
+            base += pos
+
+    if not closing:
+        raise SpliceFallback("No </body>, </head> or </html> tag found.")
+    return spans, closing
+
+def _copy_bytes(src, dst, count, chunk_size=SPLICE_CHUNK_SIZE):
+    """Copies count bytes from src to dst in bounded-size blocks."""
+    while count > 0:
+        data = src.read(min(chunk_size, count))
+        if not data:
+            break
+        dst.write(data)
+        count -= len(data)
+
+def _plan_splice(spans, closing, script_tag):
+    """
+    Returns the edits (offset, bytes to skip, bytes to insert), in file order, that remove the
+    existing injected script elements found by _scan_for_splice and insert script_tag (bytes)
+    before </body>, falling back to </head> or </html>.
+    """
+    if spans:
+        logger.info(f"  Script '{INJECTED_SCRIPT_ID}' already found. Replacing it.")
+    else:
+        logger.info(f"  Injecting script '{INJECTED_SCRIPT_ID}'.")
+
+    if "body" in closing:
+        insert_at = closing["body"]
+    elif "head" in closing:
+        logger.warning("  Warning: <body> tag not found. Appending script to <head>.")
+        insert_at = closing["head"]
+    else:
+        logger.warning("  Warning: <body> and <head> not found. Appending script to root <html>.")
+        insert_at = closing["html"]
+
+    edits = [(start, end - start, b"") for start, end in spans]
+    edits.append((insert_at, 0, script_tag))
+    edits.sort(key=lambda edit: (edit[0], -edit[1]))
+    return edits
+
+def _apply_splice(src, dst, edits):
+    """Copies the binary file object src to dst, applying the edits from _plan_splice."""
+    position = 0
+    for offset, skip, insert in edits:
+        _copy_bytes(src, dst, offset - position)
+        dst.write(insert)
+        src.seek(offset + skip)
+        position = offset + skip
+    _copy_bytes(src, dst, float('inf'))
+
+def _inject_with_splice(html_file_path, final_output_path, script_hash, javascript, src, metadata=None, stats=None):
+    """
+    Splice engine: removes any existing injected script element and inserts the new one before
+    </body> (falling back to </head> or </html>), copying every other byte of the file unchanged.
+    The output is written to a temporary file next to final_output_path, whose path is returned.
+    If a metadata dict is given it is filled with the chapter metadata gathered during the scan.
+    Phase timings are added to stats, if given: the scan is "parse" (minus its reads), planning
+    the edits "modify" and the copy "write".
+    """
+    scanner = ChapterMetadataScanner() if metadata is not None else None
+    with _timed(stats, "parse"):
+        read_before = stats["read"] if stats is not None else 0
+        try:
+            spans, closing = _scan_for_splice(html_file_path, metadata_scanner=scanner, stats=stats)
+        finally:
+            if stats is not None: # The reads are interleaved with the scan; count them once
+                stats["parse"] -= stats["read"] - read_before
+        if scanner is not None:
+            metadata.update(scanner.result())
+    with _timed(stats, "modify"):
+        edits = _plan_splice(spans, closing, build_script_tag(script_hash, javascript, src).encode('utf-8'))
+
+    with _timed(stats, "write"), open(html_file_path, 'rb') as source, \
+            staged_output(final_output_path, 'wb') as (dst, temp_path):
+        _apply_splice(source, dst, edits)
+    return temp_path
+
+_CSS_NUMBER_RE = re.compile(r"\s*([-+]?(?:\d+\.?\d*|\.\d+)(?:e[-+]?\d+)?)", re.IGNORECASE)
+
+def parse_style(style):
+    """
+    Parses an inline style attribute into an ordered {property: value} dict. Semicolons inside
+    quotes or parentheses (e.g. in url(...)) do not split declarations.
+    """
+    declarations = {}
+    depth = 0
+    quote = None
+    start = 0
+    style = style or ""
+    for i, ch in enumerate(style + ";"):
+        if quote:
+            if ch == quote:
+                quote = None
+        elif ch in "'\"":
+            quote = ch
+        elif ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth = max(0, depth - 1)
+        elif ch == ";" and depth == 0:
+            prop, sep, value = style[start:i].partition(":")
+            if sep and prop.strip():
+                declarations[prop.strip().lower()] = value.strip()
+            start = i + 1
+    return declarations
+
+def format_style(declarations):
+    """Serializes a {property: value} dict back into an inline style attribute."""
+    return "; ".join(f"{prop}: {value}" for prop, value in declarations.items()) + (";" if declarations else "")
+
+def css_px(value):
+    """Returns the leading number of a CSS length such as '123.5px' (like JS parseFloat), or None."""
+    match = _CSS_NUMBER_RE.match(value or "")
+    return float(match.group(1)) if match else None
+
+def format_number(value):
+    """Formats a float compactly for use in markup (at most 4 decimals, no trailing zeros)."""
+    return f"{value:.4f}".rstrip("0").rstrip(".") or "0"
+
+def _precompute_text_box(text_box, width, height, top_offset=0):
+    """
+    Converts one .textBox's pixel geometry to percentages of a width x height box whose top is
+    at top_offset (in the same pixel space), and records its base font sizes. With height None
+    the geometry is taken as already converted and only the font-size properties are refreshed.
+    """
+    box_style = parse_style(text_box.get("style"))
+    if height is not None:
+        for prop, reference, offset in (("left", width, 0), ("top", height, top_offset),
+                                        ("width", width, 0), ("height", height, 0)):
+            value = css_px(box_style.get(prop))
+            if value is not None:
+                box_style[prop] = format_number((value - offset) / reference * 100) + "%"
+        font_size = css_px(box_style.get("font-size"))
+        if font_size is not None:
+            text_box["data-original-font-size"] = format_number(font_size)
+    if text_box.has_attr("data-original-font-size"):
+        box_style["--original-font-size"] = text_box["data-original-font-size"]
+    text_box["style"] = format_style(box_style)
+
+    for p_elem in text_box.find_all("p"):
+        p_style = parse_style(p_elem.get("style"))
+        if height is not None:
+            p_font_size = css_px(p_style.get("font-size"))
+            if p_font_size is not None:
+                p_elem["data-original-p-font-size"] = format_number(p_font_size)
+        if p_elem.has_attr("data-original-p-font-size"):
+            p_style["--original-p-font-size"] = p_elem["data-original-p-font-size"]
+            p_elem["style"] = format_style(p_style)
+
+def _text_box_to_px(text_box, width, height):
+    """
+    Converts a .textBox's geometry converted by _precompute_text_box back to pixels of its
+    width x height container. Values not in percentages are left as they are.
+    """
+    box_style = parse_style(text_box.get("style"))
+    for prop, reference in (("left", width), ("top", height), ("width", width), ("height", height)):
+        value = box_style.get(prop, "")
+        if value.strip().endswith("%") and css_px(value) is not None:
+            box_style[prop] = format_number(css_px(value) * reference / 100) + "px"
+    text_box["style"] = format_style(box_style)
+
+def precompute_textbox_layout(soup):
+    """
+    Does the injected script's load-time layout conversion ahead of time: every .textBox in a
+    .pageContainer with a known pixel size gets its left/top/width/height converted to
+    percentages of the container, and its (and its <p>'s) pixel font size stored in
+    data-original-font-size / data-original-p-font-size and the matching CSS custom properties
+    the script's stylesheet scales by. The container is marked with data-layout-precomputed so
+    the script leaves it alone. Returns the number of textboxes converted.
+    """
+    converted = 0
+    for container in soup.find_all(class_="pageContainer"):
+        style = parse_style(container.get("style"))
+        if container.get("data-layout-precomputed") == "true":
+            # Converted by an earlier run: geometry is already in percentages
+            width, height = css_px(container.get("data-original-width")), None
+        else:
+            width, height = css_px(style.get("width")), css_px(style.get("height"))
+            if not width or not height or width <= 0 or height <= 0:
+                continue # The script leaves these pages unscaled as well
+        if not width:
+            continue
+        container["data-original-width"] = format_number(width)
+        style["--original-width"] = format_number(width)
+        container["style"] = format_style(style)
+
+        for text_box in container.find_all(class_="textBox"):
+            _precompute_text_box(text_box, width, height)
+            converted += 1
+
+        if height is not None:
+            container["data-original-height"] = format_number(height)
+            container["data-layout-precomputed"] = "true"
+    return converted
+
+def _transform_precompute_layout(soup, html_file_path):
+    converted = precompute_textbox_layout(soup)
+    logger.info(f"  Precomputed layout of {converted} textbox(es).")
+
+# Extensions tried for a page image whose recorded file is missing, in the injected script's
+# FALLBACK_EXTENSIONS order (plus .jpg, the usual original extension).
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.gif', '.avif')
+
+_BACKGROUND_URL_RE = re.compile(r"""url\(\s*(['"]?)(.*?)\1\s*\)""", re.IGNORECASE | re.DOTALL)
+
+_image_index_cache = {} # directory -> (directory mtime_ns, {stem: set of file names})
+
+def image_index(directory):
+    """
+    Returns {stem: set of file names} for the image files in directory, built with a single
+    os.scandir pass and cached per process until the directory's mtime changes.
+    """
+    try:
+        mtime_ns = os.stat(directory).st_mtime_ns
+    except OSError:
+        return {}
+    cached = _image_index_cache.get(directory)
+    if cached and cached[0] == mtime_ns:
+        return cached[1]
+    index = {}
+    try:
+        with os.scandir(directory) as it:
+            for entry in it:
+                stem, ext = os.path.splitext(entry.name)
+                if ext.lower() in IMAGE_EXTENSIONS:
+                    index.setdefault(stem, set()).add(entry.name)
+    except OSError:
+        return {}
+    _image_index_cache[directory] = (mtime_ns, index)
+    return index
+
+def page_background_url(container):
+    """Returns the raw URL of a .pageContainer's inline background-image, or None."""
+    match = _BACKGROUND_URL_RE.search(parse_style(container.get("style")).get("background-image", ""))
+    return match.group(2) if match else None
+
+def local_image_path(url, html_dir):
+    """Maps a relative (percent-encoded) image URL to a local path, or None for remote/data URLs."""
+    parsed = urllib.parse.urlsplit(url)
+    if parsed.scheme or parsed.netloc or not parsed.path:
+        return None
+    return os.path.normpath(os.path.join(html_dir, urllib.parse.unquote(parsed.path)))
+
+def present_image_name(directory, file_name):
+    """
+    Returns the name of the image file in directory that a page recorded as file_name refers
+    to: file_name itself if present, otherwise the same base name with another extension (in
+    IMAGE_EXTENSIONS order), or None.
+    """
+    stem = os.path.splitext(file_name)[0]
+    candidates = image_index(directory).get(stem, set())
+    if file_name in candidates:
+        return file_name
+    actual_name = next((stem + ext for ext in IMAGE_EXTENSIONS if stem + ext in candidates), None)
+    if actual_name is None:
+        actual_name = next(iter(sorted(candidates)), None) # e.g. an upper-case extension
+    return actual_name
+
+def resolve_page_images(soup, html_dir):
+    """
+    Points every .pageContainer background-image at the image file actually present on disk,
+    matching by base name regardless of extension (Tachiyomi/Mihon often re-encode pages).
+    Resolved containers are marked with data-image-resolved so the injected script loads
+    them directly instead of guessing extensions. Returns (resolved, unresolved) counts.
+    """
+    resolved = unresolved = 0
+    for container in soup.find_all(class_="pageContainer"):
+        url = page_background_url(container)
+        image_path = local_image_path(url, html_dir) if url else None
+        if not image_path:
+            continue
+        directory, file_name = os.path.split(image_path)
+        ext = os.path.splitext(file_name)[1]
+        actual_name = present_image_name(directory, file_name)
+        if actual_name is None:
+            if container.has_attr("data-image-resolved"):
+                del container["data-image-resolved"] # Stale mark from an earlier run
+            unresolved += 1
+            continue
+        if actual_name != file_name:
+            new_ext = os.path.splitext(actual_name)[1]
+            base, _, query = url.partition("?")
+            new_url = base[:len(base) - len(ext)] + new_ext if ext else base + new_ext
+            if query:
+                new_url += "?" + query
+            style = parse_style(container.get("style"))
+            style["background-image"] = f'url("{new_url}")'
+            container["style"] = format_style(style)
+        container["data-image-resolved"] = "true"
+        resolved += 1
+    return resolved, unresolved
+
+def _transform_resolve_images(soup, html_file_path):
+    resolved, unresolved = resolve_page_images(soup, os.path.dirname(os.path.abspath(html_file_path)))
+    logger.info(f"  Resolved {resolved} page image(s) on disk" + (f", {unresolved} left to the browser fallback." if unresolved else "."))
+
+# Page image sizes (--image-sizes) are read from the file headers only; no pixels are decoded.
+_JPEG_SOF_MARKERS = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC} # Not DHT, JPG, DAC
+_JPEG_STANDALONE_MARKERS = frozenset([0x01, 0xD8, *range(0xD0, 0xD8)]) # TEM, SOI, RSTn: no length
+_EXIF_ORIENTATION_TAG = 0x0112
+
+_image_size_cache = {} # directory -> {file name: ((size, mtime_ns), (width, height) or None)}
+
+def _exif_orientation(segment):
+    """Returns the orientation (1-8) recorded in a JPEG APP1 Exif segment, 1 if there is none."""
+    if not segment.startswith(b"Exif\0\0"):
+        return 1
+    tiff = segment[6:]
+    order = {b"II": "<", b"MM": ">"}.get(tiff[:2])
+    if order is None or len(tiff) < 8:
+        return 1
+    offset = struct.unpack(order + "I", tiff[4:8])[0]
+    if offset + 2 > len(tiff):
+        return 1
+    count = struct.unpack(order + "H", tiff[offset:offset + 2])[0]
+    for entry in range(offset + 2, min(offset + 2 + count * 12, len(tiff) - 9), 12):
+        tag, _, _, value = struct.unpack(order + "HHIH", tiff[entry:entry + 10])
+        if tag == _EXIF_ORIENTATION_TAG:
+            return value if 1 <= value <= 8 else 1
+    return 1
+
+def _jpeg_size(f):
+    """
+    Walks the JPEG marker segments of f (positioned after SOI) up to the frame header, seeking
+    over the others. Orientations 5-8 swap the size, as browsers apply the Exif orientation.
+    """
+    orientation = 1
+    while True:
+        byte = f.read(1)
+        while byte and byte != b"\xff":
+            byte = f.read(1)
+        while byte == b"\xff": # Fill bytes
+            byte = f.read(1)
+        if not byte:
+            return None
+        marker = byte[0]
+        if marker in _JPEG_STANDALONE_MARKERS:
+            continue
+        if marker in (0xD9, 0xDA): # EOI or start of scan before any frame header
+            return None
+        length_bytes = f.read(2)
+        if len(length_bytes) < 2:
+            return None
+        length = struct.unpack(">H", length_bytes)[0]
+        if length < 2:
+            return None
+        if marker in _JPEG_SOF_MARKERS:
+            frame = f.read(5)
+            if len(frame) < 5:
+                return None
+            height, width = struct.unpack(">HH", frame[1:5])
+            return (height, width) if orientation >= 5 else (width, height)
+        if marker == 0xE1 and orientation == 1:
+            orientation = _exif_orientation(f.read(length - 2))
+        else:
+            f.seek(length - 2, os.SEEK_CUR)
+
+def _webp_size(head):
+    """Returns the canvas size from the first 30 bytes of a WebP file (lossy, lossless or extended)."""
+    chunk = head[12:16]
+    if chunk == b"VP8 " and head[23:26] == b"\x9d\x01\x2a":
+        width, height = struct.unpack("<HH", head[26:30])
+        return width & 0x3FFF, height & 0x3FFF
+    if chunk == b"VP8L" and head[20] == 0x2F:
+        bits = struct.unpack("<I", head[21:25])[0]
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    if chunk == b"VP8X":
+        return int.from_bytes(head[24:27], "little") + 1, int.from_bytes(head[27:30], "little") + 1
+    return None
+
+def _iter_boxes(f, start, end):
+    """Yields (type, payload start, payload end) for the ISO BMFF boxes of f between start and end."""
+    position = start
+    while position + 8 <= end:
+        f.seek(position)
+        header = f.read(8)
+        if len(header) < 8:
+            return
+        size, box_type = struct.unpack(">I4s", header)
+        payload = position + 8
+        if size == 1: # 64-bit size
+            large = f.read(8)
+            if len(large) < 8:
+                return
+            size = struct.unpack(">Q", large)[0]
+            payload += 8
+        elif size == 0: # Extends to the end
+            size = end - position
+        if size < payload - position:
+            return
+        yield box_type, payload, min(position + size, end)
+        position += size
+
+def _isobmff_image_size(f, file_size):
+    """
+    Returns the size of an AVIF/HEIF image from the image spatial extents ('ispe') properties in
+    meta/iprp/ipco: the largest one (thumbnails, alpha planes and grid cells are smaller), turned
+    by an 'irot' rotation of 90 or 270 degrees.
+    """
+    for box_type, start, end in _iter_boxes(f, 0, file_size):
+        if box_type != b"meta":
+            continue
+        for iprp_type, iprp_start, iprp_end in _iter_boxes(f, start + 4, end): # meta is a full box
+            if iprp_type != b"iprp":
+                continue
+            for ipco_type, ipco_start, ipco_end in _iter_boxes(f, iprp_start, iprp_end):
+                if ipco_type != b"ipco":
+                    continue
+                sizes = []
+                rotated = False
+                for prop_type, prop_start, prop_end in _iter_boxes(f, ipco_start, ipco_end):
+                    f.seek(prop_start)
+                    if prop_type == b"ispe" and prop_end - prop_start >= 12:
+                        sizes.append(struct.unpack(">II", f.read(12)[4:]))
+                    elif prop_type == b"irot" and prop_end > prop_start:
+                        rotated = rotated or (f.read(1)[0] & 0x03) in (1, 3)
+                if not sizes:
+                    return None
+                width, height = max(sizes, key=lambda size: size[0] * size[1])
+                return (height, width) if rotated else (width, height)
+        return None
+    return None
+
+def read_image_size(path):
+    """
+    Returns the displayed (width, height) of a PNG, GIF, WebP, JPEG or AVIF image read from its
+    header alone, or None for other formats and malformed headers.
+    """
+    with open(path, 'rb') as f:
+        head = f.read(32)
+        try:
+            if head.startswith(b"\x89PNG\r\n\x1a\n") and head[12:16] == b"IHDR":
+                size = struct.unpack(">II", head[16:24])
+            elif head[:6] in (b"GIF87a", b"GIF89a"):
+                size = struct.unpack("<HH", head[6:10])
+            elif head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+                size = _webp_size(head)
+            elif head[:3] == b"\xff\xd8\xff":
+                f.seek(2)
+                size = _jpeg_size(f)
+            elif head[4:8] == b"ftyp":
+                size = _isobmff_image_size(f, os.fstat(f.fileno()).st_size)
+            else:
+                size = None
+        except (struct.error, IndexError): # Truncated header
+            return None
+    if not size or min(size) <= 0:
+        return None
+    return tuple(size)
+
+def image_size(path):
+    """
+    Returns read_image_size(path), cached per process by directory and file name until the
+    file's size or mtime changes, so the pages of every chapter sharing an image directory
+    are probed once. None if the file cannot be read or its format is not recognized.
+    """
+    directory, file_name = os.path.split(path)
+    try:
+        file_stat = os.stat(path)
+    except OSError:
+        return None
+    key = (file_stat.st_size, file_stat.st_mtime_ns)
+    sizes = _image_size_cache.setdefault(directory, {})
+    cached = sizes.get(file_name)
+    if cached and cached[0] == key:
+        return cached[1]
+    try:
+        size = read_image_size(path)
+    except OSError:
+        size = None
+    sizes[file_name] = (key, size)
+    return size
+
+def _scale_css_px(declarations, prop, scale):
+    value = declarations.get(prop, "")
+    number = css_px(value)
+    if number is not None and value.strip().lower().endswith("px"):
+        declarations[prop] = format_number(number * scale) + "px"
+
+def _scale_text_box(text_box, scale_x, scale_y):
+    """
+    Scales a .textBox's pixel geometry by scale_x horizontally and scale_y vertically, and its
+    (and its <p>'s) font sizes, inline and as recorded by precompute_textbox_layout, by
+    scale_x. Percentages are relative to the container and are left as they are.
+    """
+    box_style = parse_style(text_box.get("style"))
+    for prop, scale in (("left", scale_x), ("top", scale_y), ("width", scale_x), ("height", scale_y),
+                        ("font-size", scale_x)):
+        _scale_css_px(box_style, prop, scale)
+    font_size = css_px(text_box.get("data-original-font-size"))
+    if font_size is not None:
+        text_box["data-original-font-size"] = format_number(font_size * scale_x)
+        box_style["--original-font-size"] = text_box["data-original-font-size"]
+    text_box["style"] = format_style(box_style)
+
+    for p_elem in text_box.find_all("p"):
+        p_style = parse_style(p_elem.get("style"))
+        _scale_css_px(p_style, "font-size", scale_x)
+        p_font_size = css_px(p_elem.get("data-original-p-font-size"))
+        if p_font_size is not None:
+            p_elem["data-original-p-font-size"] = format_number(p_font_size * scale_x)
+            p_style["--original-p-font-size"] = p_elem["data-original-p-font-size"]
+        if p_style:
+            p_elem["style"] = format_style(p_style)
+
+def apply_image_sizes(soup, html_dir):
+    """
+    Writes the real size of every local page image, read from its file header (see image_size),
+    into its .pageContainer: as the container's width, height and aspect-ratio, and in
+    data-image-width / data-image-height for the injected script to put on the page <img>, so
+    the layout is final before any image bytes arrive. Where the image's resolution differs
+    from the one Mokuro recorded (Tachiyomi/Mihon re-encode and resize pages), the textbox
+    geometry and font sizes are rescaled to the image's pixels. Tiled pages are left alone.
+    Returns (pages sized, pages rescaled, pages whose image is missing or unreadable).
+    """
+    sized = rescaled = unknown = 0
+    for container in soup.find_all(class_="pageContainer"):
+        if container.get("data-tiled") == "true":
+            continue # Tiles carry the real aspect ratios already
+        url = page_background_url(container)
+        image_path = local_image_path(url, html_dir) if url else None
+        if not image_path:
+            continue
+        directory, file_name = os.path.split(image_path)
+        actual_name = present_image_name(directory, file_name)
+        size = image_size(os.path.join(directory, actual_name)) if actual_name else None
+        if size is None:
+            unknown += 1
+            continue
+        image_width, image_height = size
+
+        style = parse_style(container.get("style"))
+        width, height = css_px(style.get("width")), css_px(style.get("height"))
+        if width and height and width > 0 and height > 0 and (width, height) != (image_width, image_height):
+            for text_box in container.find_all(class_="textBox"):
+                _scale_text_box(text_box, image_width / width, image_height / height)
+            rescaled += 1
+        style["width"] = f"{image_width}px"
+        style["height"] = f"{image_height}px"
+        style["aspect-ratio"] = f"{image_width} / {image_height}"
+        if container.get("data-layout-precomputed") == "true":
+            container["data-original-width"] = str(image_width)
+            container["data-original-height"] = str(image_height)
+            style["--original-width"] = str(image_width)
+        container["style"] = format_style(style)
+        container["data-image-width"] = str(image_width)
+        container["data-image-height"] = str(image_height)
+        sized += 1
+    return sized, rescaled, unknown
+
+def _transform_image_sizes(soup, html_file_path):
+    sized, rescaled, unknown = apply_image_sizes(soup, os.path.dirname(os.path.abspath(html_file_path)))
+    logger.info(f"  Read the size of {sized} page image(s)" + (f", rescaled the textboxes of {rescaled}" if rescaled else "")
+                + (f", {unknown} missing or unreadable." if unknown else "."))
+
+# Responsive page image variants (--variants) are cached next to the source images, keyed by
+# the hash of the source file, so unchanged pages are never re-encoded.
+VARIANTS_DIRNAME = ".webtoon-variants"
+VARIANT_JPEG_QUALITY = 85
+
+_source_hash_cache = {} # path -> ((size, mtime_ns), hash)
+_image_executor = None # Process pool shared by the image stages (--variants, --tile-height)
+
+def source_file_hash(path):
+    """Returns a short SHA-256 of the file's content, cached per process by size and mtime."""
+    file_stat = os.stat(path)
+    key = (file_stat.st_size, file_stat.st_mtime_ns)
+    cached = _source_hash_cache.get(path)
+    if cached and cached[0] == key:
+        return cached[1]
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(SPLICE_CHUNK_SIZE), b""):
+            digest.update(block)
+    _source_hash_cache[path] = (key, digest.hexdigest()[:16])
+    return _source_hash_cache[path][1]
+
+def generate_variant_images(source_path, targets):
+    """
+    Writes downscaled JPEG copies of source_path for each (width, output_path) in targets.
+    Runs in worker processes; imports Pillow lazily.
+    """
+    from PIL import Image
+
+    with Image.open(source_path) as image:
+        largest = max(width for width, _ in targets)
+        image.draft("RGB", (largest, image.height * largest // image.width)) # Cheap DCT downscale for JPEG sources
+        image = image.convert("RGB")
+        for width, output_path in targets:
+            height = max(1, round(image.height * width / image.width))
+            resized = image.resize((width, height), Image.Resampling.LANCZOS)
+            with atomic_write(output_path, 'wb') as f:
+                resized.save(f, "JPEG", quality=VARIANT_JPEG_QUALITY, optimize=True, progressive=True)
+
+def _run_image_jobs(function, jobs, workers):
+    """
+    Calls function(source_path, targets) for each job, in a process pool reused across files
+    when workers > 1.
+    """
+    global _image_executor
+    if workers <= 1 or len(jobs) <= 1:
+        for source_path, targets in jobs:
+            function(source_path, targets)
+        return
+    if _image_executor is None:
+        _image_executor = ProcessPoolExecutor(max_workers=workers)
+    futures = [_image_executor.submit(function, source_path, targets) for source_path, targets in jobs]
+    for future in futures:
+        future.result()
+
+def _srcset_url(url):
+    """Escapes the characters that would split a URL inside a srcset attribute."""
+    return url.replace(" ", "%20").replace(",", "%2C")
+
+def build_page_variants(soup, html_dir, widths, workers=1):
+    """
+    Generates downscaled variants of every local page image at the given widths (only those
+    narrower than the source) and records them, with the original, as a srcset in the
+    container's data-srcset, for the injected script to put on the page <img>. Outputs are
+    cached in VARIANTS_DIRNAME next to the source, keyed by the source's content hash.
+    Returns (pages with variants, variant images generated).
+    """
+    from PIL import Image
+
+    pages = []
+    jobs = []
+    for container in soup.find_all(class_="pageContainer"):
+        if container.get("data-tiled") == "true":
+            continue # Tiles replace the page image
+        url = page_background_url(container)
+        image_path = local_image_path(url, html_dir) if url else None
+        if not image_path or not os.path.isfile(image_path):
+            continue
+        with Image.open(image_path) as image: # Reads the header only
+            source_width = image.width
+        base_url = url.partition("?")[0].rsplit("/", 1)
+        url_dir = base_url[0] + "/" if len(base_url) > 1 else ""
+        source_hash = source_file_hash(image_path)
+        candidates = []
+        targets = []
+        for width in sorted(set(widths)):
+            if width >= source_width:
+                continue
+            name = f"{source_hash}-{width}w.jpg"
+            output_path = os.path.join(os.path.dirname(image_path), VARIANTS_DIRNAME, name)
+            if not os.path.exists(output_path):
+                targets.append((width, output_path))
+            candidates.append(f"{_srcset_url(url_dir)}{VARIANTS_DIRNAME}/{name} {width}w")
+        if targets:
+            jobs.append((image_path, targets))
+        candidates.append(f"{_srcset_url(url)} {source_width}w")
+        pages.append((container, ", ".join(candidates)))
+
+    _run_image_jobs(generate_variant_images, jobs, workers)
+    for container, srcset in pages:
+        container["data-srcset"] = srcset
+        container["data-image-resolved"] = "true" # The file exists at this URL
+    return len(pages), sum(len(targets) for _, targets in jobs)
+
+# Tall strips (--tile-height) are split into tiles cached next to the source image.
+TILES_DIRNAME = ".webtoon-tiles"
+TILE_SAVE_FORMATS = {'.jpg': "JPEG", '.jpeg': "JPEG", '.png': "PNG", '.webp': "WEBP"}
+
+def generate_tile_images(source_path, tiles):
+    """
+    Crops source_path into the given (top, bottom, output_path) horizontal bands, saved in the
+    format matching each output's extension. Runs in worker processes; imports Pillow lazily.
+    """
+    from PIL import Image
+
+    with Image.open(source_path) as image:
+        image.load()
+        for top, bottom, output_path in tiles:
+            tile = image.crop((0, top, image.width, bottom))
+            save_format = TILE_SAVE_FORMATS[os.path.splitext(output_path)[1]]
+            if save_format == "JPEG" and tile.mode not in ("RGB", "L"):
+                tile = tile.convert("RGB")
+            with atomic_write(output_path, 'wb') as f:
+                tile.save(f, save_format, quality=92)
+
+def tile_tall_pages(soup, html_dir, tile_height, workers=1):
+    """
+    Splits every local page image taller than tile_height into evenly sized, vertically
+    stacked tiles. Each tile becomes a .webtoon-tile <div> inside the same .pageContainer
+    holding an <img> (loaded by the injected script from data-src) and the textboxes whose
+    centre falls within it, their geometry remapped to percentages of the tile. The
+    full-size background image is removed so the browser never decodes the whole strip.
+    Returns (pages tiled, tile images generated).
+    """
+    from PIL import Image
+
+    tiled = 0
+    jobs = []
+    for container in soup.find_all(class_="pageContainer"):
+        if container.get("data-tiled") == "true":
+            continue
+        url = page_background_url(container)
+        image_path = local_image_path(url, html_dir) if url else None
+        if not image_path or not os.path.isfile(image_path):
+            continue
+        with Image.open(image_path) as image: # Reads the header only
+            image_width, image_height = image.size
+        if image_height <= tile_height:
+            continue
+
+        style = parse_style(container.get("style"))
+        if container.get("data-layout-precomputed") == "true":
+            # Converted by an earlier run: recover the pixel geometry the tiles are cut from
+            width, height = css_px(container.get("data-original-width")), css_px(container.get("data-original-height"))
+            if not width or not height or width <= 0 or height <= 0:
+                logger.warning(f"  Warning: Not tiling {url}: its precomputed layout has no recorded page size.")
+                continue
+            for text_box in container.find_all(class_="textBox"):
+                _text_box_to_px(text_box, width, height)
+        else:
+            width, height = css_px(style.get("width")), css_px(style.get("height"))
+            if not width or not height or width <= 0 or height <= 0:
+                width, height = float(image_width), float(image_height)
+        scale = height / image_height # Mokuro's page coordinates per image pixel
+
+        count = math.ceil(image_height / tile_height)
+        band = math.ceil(image_height / count)
+        source_hash = source_file_hash(image_path)
+        ext = os.path.splitext(image_path)[1].lower()
+        ext = ext if ext in TILE_SAVE_FORMATS else ".png"
+        base_url = url.partition("?")[0].rsplit("/", 1)
+        url_dir = base_url[0] + "/" if len(base_url) > 1 else ""
+
+        targets = []
+        tiles = []
+        for index in range(count):
+            top, bottom = index * band, min(image_height, (index + 1) * band)
+            name = f"{source_hash}-{band}-{index}{ext}"
+            output_path = os.path.join(os.path.dirname(image_path), TILES_DIRNAME, name)
+            if not os.path.exists(output_path):
+                targets.append((top, bottom, output_path))
+            tile = soup.new_tag("div", attrs={
+                "class": "webtoon-tile",
+                "style": f"aspect-ratio: {image_width} / {bottom - top};",
+            })
+            tile.append(soup.new_tag("img", attrs={
+                "class": "webtoon-image",
+                "alt": f"Page image tile {index + 1}/{count}",
+                "data-src": f"{url_dir}{TILES_DIRNAME}/{name}",
+            }))
+            tiles.append((tile, top * scale, (bottom - top) * scale))
+        if targets:
+            jobs.append((image_path, targets))
+
+        for text_box in container.find_all(class_="textBox"):
+            box_style = parse_style(text_box.get("style"))
+            box_top = css_px(box_style.get("top")) or 0.0
+            centre = box_top + (css_px(box_style.get("height")) or 0.0) / 2
+            tile, tile_top, tile_height_px = tiles[min(count - 1, max(0, int(centre / scale // band)))]
+            _precompute_text_box(text_box, width, tile_height_px, top_offset=tile_top)
+            tile.append(text_box.extract())
+
+        style.pop("background-image", None)
+        style["--original-width"] = format_number(width)
+        container["style"] = format_style(style)
+        container["data-source-image"] = url
+        container["data-tiled"] = "true"
+        container["data-layout-precomputed"] = "true"
+        container["data-original-width"] = format_number(width)
+        container["data-original-height"] = format_number(height)
+        for tile, _, _ in tiles:
+            container.append(tile)
+        tiled += 1
+
+    _run_image_jobs(generate_tile_images, jobs, workers)
+    return tiled, sum(len(targets) for _, targets in jobs)
+
+def _transform_tiles(soup, html_file_path, tile_height, workers):
+    tiled, generated = tile_tall_pages(soup, os.path.dirname(os.path.abspath(html_file_path)), tile_height, workers)
+    logger.info(f"  Split {tiled} tall page(s) into tiles ({generated} tile image(s) generated).")
+
+def _transform_variants(soup, html_file_path, widths, workers):
+    pages, generated = build_page_variants(soup, os.path.dirname(os.path.abspath(html_file_path)), widths, workers)
+    logger.info(f"  Responsive variants for {pages} page(s) ({generated} image(s) generated).")
+
+# Library-wide OCR text search (--search-db / the search subcommand).
+SEARCH_SCHEMA_VERSION = "1"
+
+def _text_box_geometry(text_box, container):
+    """
+    Returns (left, top, width, height) of a .textBox in Mokuro's page pixels, also for layouts
+    already converted to percentages (--precompute-layout) or split into tiles (--tile-height).
+    Unknown values are None.
+    """
+    style = parse_style(text_box.get("style"))
+    values = [style.get(prop, "").strip() for prop in ("left", "top", "width", "height")]
+    if not any(value.endswith("%") for value in values):
+        return tuple(css_px(value) for value in values)
+    width = css_px(container.get("data-original-width"))
+    height = css_px(container.get("data-original-height"))
+    if not width or not height:
+        return (None,) * 4
+    top_offset, reference_height = 0.0, height
+    tile = text_box.find_parent(class_="webtoon-tile")
+    if tile is not None:
+        ratios = []
+        for each in container.find_all(class_="webtoon-tile"):
+            tile_width, _, tile_height = parse_style(each.get("style")).get("aspect-ratio", "1 / 1").partition("/")
+            ratios.append((css_px(tile_height) or 1.0) / (css_px(tile_width) or 1.0))
+        tile_heights = [ratio / sum(ratios) * height for ratio in ratios]
+        index = container.find_all(class_="webtoon-tile").index(tile)
+        top_offset, reference_height = sum(tile_heights[:index]), tile_heights[index]
+    left, top, box_width, box_height = (css_px(value) for value in values)
+    return (
+        None if left is None else left / 100 * width,
+        None if top is None else top_offset + top / 100 * reference_height,
+        None if box_width is None else box_width / 100 * width,
+        None if box_height is None else box_height / 100 * reference_height,
+    )
+
+def extract_text_boxes(soup):
+    """
+    Returns (page index, box index, left, top, width, height, text) for every .textBox with
+    text, in document order; the lines of a box (its <p> elements) are joined with newlines.
+    """
+    rows = []
+    for page_index, page in enumerate(soup.find_all(class_="page")):
+        container = page.find(class_="pageContainer") or page
+        for box_index, text_box in enumerate(container.find_all(class_="textBox")):
+            lines = [p.get_text() for p in text_box.find_all("p")] or [text_box.get_text()]
+            text = "\n".join(line.strip() for line in lines if line.strip())
+            if text:
+                rows.append((page_index, box_index, *_text_box_geometry(text_box, container), text))
+    return rows
+
+class SearchDatabase:
+    """
+    SQLite FTS5 index of the OCR text of a library, one row per textbox. Chapters are stored
+    by path relative to the database and updated individually, keyed by the size and mtime
+    of the chapter file, so only new or changed chapters are re-indexed. Uses the trigram
+    tokenizer where available, so that Japanese text (which has no spaces) can be searched
+    by any substring of three or more characters.
+    """
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        self.root = os.path.dirname(self.path)
+        self.connection = sqlite3.connect(self.path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        with self.connection:
+            self.connection.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS chapters (id INTEGER PRIMARY KEY, path TEXT UNIQUE NOT NULL, "
+                "size INTEGER, mtime_ns INTEGER)")
+            if not self._has_table("boxes"):
+                columns = "text, chapter_id UNINDEXED, page UNINDEXED, box UNINDEXED, " \
+                          "left UNINDEXED, top UNINDEXED, width UNINDEXED, height UNINDEXED"
+                try:
+                    self.connection.execute(f"CREATE VIRTUAL TABLE boxes USING fts5({columns}, tokenize='trigram')")
+                except sqlite3.OperationalError: # SQLite < 3.34
+                    self.connection.execute(f"CREATE VIRTUAL TABLE boxes USING fts5({columns})")
+            self.connection.execute("INSERT OR REPLACE INTO meta VALUES ('schema_version', ?)", (SEARCH_SCHEMA_VERSION,))
+        self._current = {path: (size, mtime_ns) for path, size, mtime_ns
+                         in self.connection.execute("SELECT path, size, mtime_ns FROM chapters")}
+
+    def _has_table(self, name):
+        return self.connection.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (name,)).fetchone() is not None
+
+    def _key(self, chapter_path):
+        return os.path.relpath(os.path.abspath(chapter_path), self.root).replace(os.sep, "/")
+
+    def is_current(self, chapter_path):
+        """True if the chapter file is indexed as it is on disk."""
+        try:
+            chapter_stat = os.stat(chapter_path)
+        except OSError:
+            return False
+        return self._current.get(self._key(chapter_path)) == (chapter_stat.st_size, chapter_stat.st_mtime_ns)
+
+    def update(self, chapter_path, rows=None):
+        """
+        Records the chapter's current size and mtime, replacing its textboxes with rows (see
+        extract_text_boxes) if given. Without rows only an already indexed chapter is updated.
+        Call commit() to make the changes durable.
+        """
+        key = self._key(chapter_path)
+        chapter_stat = os.stat(chapter_path)
+        stat_key = (chapter_stat.st_size, chapter_stat.st_mtime_ns)
+        if rows is None:
+            if key in self._current:
+                self.connection.execute("UPDATE chapters SET size = ?, mtime_ns = ? WHERE path = ?", (*stat_key, key))
+                self._current[key] = stat_key
+            return
+        self.connection.execute("INSERT INTO chapters (path, size, mtime_ns) VALUES (?, ?, ?) "
+                                "ON CONFLICT(path) DO UPDATE SET size = excluded.size, mtime_ns = excluded.mtime_ns",
+                                (key, *stat_key))
+        chapter_id = self.connection.execute("SELECT id FROM chapters WHERE path = ?", (key,)).fetchone()[0]
+        self.connection.execute("DELETE FROM boxes WHERE chapter_id = ?", (chapter_id,))
+        self.connection.executemany(
+            "INSERT INTO boxes (text, chapter_id, page, box, left, top, width, height) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            [(text, chapter_id, page, box, left, top, width, height)
+             for page, box, left, top, width, height, text in rows])
+        self._current[key] = stat_key
+
+    def commit(self):
+        self.connection.commit()
+
+    def search(self, query, limit=20, raw=False):
+        """
+        Returns (chapter path, page, box, left, top, width, height, text) rows matching query,
+        best matches first. query is searched as a phrase unless raw, in which case it is
+        passed to FTS5 as is (AND/OR/NEAR, prefix*).
+        """
+        select = ("SELECT chapters.path, page, box, left, top, width, height, boxes.text FROM boxes "
+                  "JOIN chapters ON chapters.id = boxes.chapter_id ")
+        if not raw and len(query) < 3:
+            # Too short for trigrams: a LIKE scan, still over the index table only
+            pattern = "%" + query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+            return self.connection.execute(select + "WHERE boxes.text LIKE ? ESCAPE '\\' LIMIT ?",
+                                           (pattern, limit)).fetchall()
+        match = query if raw else '"' + query.replace('"', '""') + '"'
+        return self.connection.execute(select + "WHERE boxes MATCH ? ORDER BY rank LIMIT ?", (match, limit)).fetchall()
+
+    def close(self):
+        """Commits any pending changes and closes the database."""
+        self.connection.commit()
+        self.connection.close()
+
+def search_main(argv):
+    """Entry point of the `search` subcommand: python Injection.py search DB QUERY."""
+    parser = argparse.ArgumentParser(prog="Injection.py search",
+                                     description="Search the OCR text index built with --search-db.")
+    parser.add_argument("database", help="Search database created with --search-db.")
+    parser.add_argument("query", help="Text to find (searched as a phrase).")
+    parser.add_argument("-n", "--limit", type=int, default=20, help="Maximum number of results (default: 20).")
+    parser.add_argument("--raw", action="store_true", help="Pass the query to SQLite FTS5 unchanged (AND, OR, NEAR, prefix*).")
+    args = parser.parse_args(argv)
+    if not os.path.isfile(args.database):
+        print(f"Error: Search database not found: {args.database}")
+        return 1
+    database = SearchDatabase(args.database)
+    try:
+        start = time.perf_counter()
+        try:
+            rows = database.search(args.query, args.limit, args.raw)
+        except sqlite3.OperationalError as e:
+            print(f"Error: Invalid search query: {e}")
+            return 1
+        elapsed_ms = (time.perf_counter() - start) * 1000
+    finally:
+        database.close()
+    for path, page, box, left, top, width, height, text in rows:
+        geometry = ", ".join("?" if value is None else format_number(round(value, 1)) for value in (left, top, width, height))
+        print(f"{path}  page {page + 1}  box {box + 1}  [{geometry}]")
+        print("    " + text.replace("\n", " / "))
+    print(f"{len(rows)} result(s) in {elapsed_ms:.1f} ms.")
+    return 0
+
+# Lean documents built straight from Mokuro's OCR output (the from-ocr subcommand): only the
+# page containers and textboxes, in the structure the injected script expects.
+OCR_DOCUMENT_TEMPLATE = """<!DOCTYPE html>
+<html lang="{lang}">
+<head>
+<meta charset="UTF-8">
+<meta name="viewport" content="width=device-width, initial-scale=1.0">
+<title>{title}</title>
+<style>
+body {{ margin: 0; background-color: #c4c3d0; }}
+.textBox {{ position: absolute; z-index: 1; line-height: 1.1em; }}
+.textBox p {{ margin: 0; letter-spacing: 0.1em; font-weight: bold; color: #000; background-color: #fff; }}
+</style>
+</head>
+<body>
+<div id="pagesContainer">
+{pages}
+</div>
+</body>
+</html>
+"""
+
+def _read_json(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def load_ocr_volume(path):
+    """
+    Reads a volume's OCR results and returns (title, pages), each page a dict with
+    image_path, width, height and blocks (Mokuro's text blocks: box, vertical, font_size,
+    lines). path is either a .mokuro file, whose images live in the directory of the same
+    name next to it, or an _ocr/<volume> directory of per-page JSON files, whose images live
+    in <title>/<volume>. Raises ValueError for input it cannot read.
+    """
+    path = os.path.abspath(path)
+    pages = []
+    if os.path.isfile(path):
+        data = _read_json(path)
+        if not isinstance(data, dict) or not isinstance(data.get("pages"), list):
+            raise ValueError(f"Not a .mokuro volume (no 'pages' list): {path}")
+        image_dir = os.path.splitext(path)[0]
+        title = " - ".join(part for part in (data.get("title"), data.get("volume")) if part) or \
+            os.path.basename(image_dir)
+        for page in data["pages"]:
+            pages.append({"image_path": os.path.join(image_dir, page["img_path"]), "width": page["img_width"],
+                          "height": page["img_height"], "blocks": page.get("blocks", [])})
+        return title, pages
+
+    if not os.path.isdir(path):
+        raise ValueError(f"OCR input not found: {path}")
+    ocr_root, volume = os.path.split(path)
+    if os.path.basename(ocr_root) != "_ocr":
+        raise ValueError(f"Expected a .mokuro file or an _ocr/<volume> directory: {path}")
+    image_dir = os.path.join(os.path.dirname(ocr_root), volume)
+    images = image_index(image_dir)
+    page_files = sorted((name for name in os.listdir(path) if name.lower().endswith(".json")), key=natural_sort_key)
+    for name in page_files:
+        page = _read_json(os.path.join(path, name))
+        stem = os.path.splitext(name)[0]
+        candidates = sorted(images.get(stem, ()))
+        image_name = next((stem + ext for ext in IMAGE_EXTENSIONS if stem + ext in candidates),
+                          candidates[0] if candidates else stem + ".jpg")
+        pages.append({"image_path": os.path.join(image_dir, image_name), "width": page["img_width"],
+                      "height": page["img_height"], "blocks": page.get("blocks", [])})
+    return volume, pages
+
+def build_ocr_document(title, pages, output_path):
+    """
+    Returns a minimal Mokuro-style document for the pages (see load_ocr_volume): one
+    .page > .pageContainer per page with the image as background and a .textBox per OCR
+    block, positioned in image pixels. Image URLs are relative to output_path.
+    """
+    output_dir = os.path.dirname(os.path.abspath(output_path))
+    page_parts = []
+    for page_index, page in enumerate(pages):
+        image_url = urllib.parse.quote(os.path.relpath(page["image_path"], output_dir).replace(os.sep, "/"))
+        boxes = []
+        for block in page["blocks"]:
+            left, top, right, bottom = block["box"]
+            style = {
+                "left": f"{format_number(left)}px", "top": f"{format_number(top)}px",
+                "width": f"{format_number(right - left)}px", "height": f"{format_number(bottom - top)}px",
+                "font-size": f"{format_number(block.get('font_size', 16))}px",
+            }
+            if block.get("vertical"):
+                style["writing-mode"] = "vertical-rl"
+            lines = "".join(f"<p>{html.escape(line)}</p>" for line in block.get("lines", []))
+            boxes.append(f'<div class="textBox" style="{html.escape(format_style(style))}">{lines}</div>')
+        container_style = (f"width:{page['width']}px; height:{page['height']}px; "
+                           f"background-image:url(&quot;{html.escape(image_url)}&quot;)")
+        page_parts.append(f'<div class="page" id="page{page_index}"><div class="pageContainer" '
+                          f'style="{container_style}">{"".join(boxes)}</div></div>')
+    return OCR_DOCUMENT_TEMPLATE.format(lang="ja", title=html.escape(title), pages="\n".join(page_parts))
+
+def from_ocr_main(argv):
+    """
+    Entry point of the from-ocr subcommand: python Injection.py from-ocr INPUT... [-o OUT].
+    Builds a lean webtoon document per volume from Mokuro's OCR output and injects the script
+    (with the layout precomputed), without going through Mokuro's reader HTML.
+    """
+    parser = argparse.ArgumentParser(prog="Injection.py from-ocr", formatter_class=argparse.RawTextHelpFormatter,
+                                     description="Build lean webtoon HTMLs directly from Mokuro OCR output.")
+    parser.add_argument("inputs", nargs="+", metavar="INPUT",
+                        help="A .mokuro file, or an _ocr/<volume> directory of per-page JSON files.")
+    parser.add_argument("-o", "--output",
+                        help="Output HTML file (single input) or directory. Default: <volume>.webtoon.html"
+                             "\nnext to the .mokuro file / the volume's image directory.")
+    parser.add_argument("--asset-mode", choices=ASSET_MODES, default="inline",
+                        help="Inline the script or reference a shared asset next to the output (default: inline).")
+    parser.add_argument("--resolve-images", action="store_true", help="Point pages at the image files actually on disk.")
+    parser.add_argument("--image-sizes", action="store_true",
+                        help="Size pages (and rescale their textboxes) by the image file headers.")
+    parser.add_argument("--variants", type=_parse_widths, metavar="WIDTHS",
+                        help="Generate responsive image variants (requires Pillow).")
+    parser.add_argument("--tile-height", type=int, metavar="PX", help="Split taller pages into tiles (requires Pillow).")
+    parser.add_argument("--no-lazy-loading", action="store_true", help="Load every page image up front.")
+    parser.add_argument("--instrument", action="store_true", help="Build the script with performance instrumentation.")
+    args = parser.parse_args(argv)
+
+    if len(args.inputs) > 1 and args.output and not os.path.isdir(args.output) and not args.output.endswith(os.sep):
+        print("Error: With several inputs, --output must be a directory.")
+        return 1
+    script_options = {"lazy_loading": False if args.no_lazy_loading else None, "instrument": args.instrument}
+    failures = 0
+    for index, input_path in enumerate(args.inputs):
+        print(f"\n[{index + 1}/{len(args.inputs)}] Reading OCR: {input_path}")
+        try:
+            title, pages = load_ocr_volume(input_path)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"  Error: Cannot read OCR output {input_path}: {e}")
+            failures += 1
+            continue
+        default_name = os.path.basename(os.path.splitext(os.path.abspath(input_path))[0]) + ".webtoon.html"
+        if args.output and (len(args.inputs) > 1 or os.path.isdir(args.output) or args.output.endswith(os.sep)):
+            output_path = os.path.join(args.output, default_name)
+        elif args.output:
+            output_path = args.output
+        elif os.path.isfile(input_path):
+            output_path = os.path.join(os.path.dirname(os.path.abspath(input_path)), default_name)
+        else: # _ocr/<volume> -> <title>/<volume>.webtoon.html
+            output_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(input_path))), default_name)
+        output_path = os.path.abspath(output_path)
+
+        document_path = None
+        try:
+            with staged_output(output_path) as (f, document_path):
+                f.write(build_ocr_document(title, pages, output_path))
+            print(f"  {len(pages)} page(s), {sum(len(page['blocks']) for page in pages)} text block(s).")
+            if args.asset_mode == "shared":
+                print(f"  Shared script asset: {write_shared_asset(os.path.dirname(output_path), **script_options)}")
+            inject_script_to_html(document_path, output_path, engine="bs4", force=True, asset_mode=args.asset_mode,
+                                  script_options=script_options, precompute_layout=True,
+                                  resolve_images=args.resolve_images, image_sizes=args.image_sizes,
+                                  variants=args.variants, tile_height=args.tile_height)
+        except Exception as e:
+            print(f"  Error building {output_path}: {e}")
+            failures += 1
+        finally:
+            if document_path:
+                with contextlib.suppress(OSError):
+                    os.remove(document_path)
+    return 1 if failures else 0
+
+# Local reader server (the serve subcommand): an asyncio HTTP/1.1 server for a library root.
+SERVE_PORT = 8000
+SERVE_IDLE_TIMEOUT = 30.0 # Seconds an idle keep-alive connection is kept open
+SERVE_MAX_HEADER_BYTES = 64 * 1024
+
+# Dot-directories the reader loads images from; every other dot-file (manifest, journal,
+# temporary files) is not served.
+SERVED_DOT_DIRECTORIES = (VARIANTS_DIRNAME, TILES_DIRNAME)
+
+# The shared script is versioned by its hash, so browsers may keep it forever. Images get a
+# long lifetime; HTML is revalidated every time (cheap with the ETags: a 304 without a body).
+CACHE_CONTROL_IMMUTABLE = "public, max-age=31536000, immutable"
+CACHE_CONTROL_IMAGES = "public, max-age=2592000"
+CACHE_CONTROL_REVALIDATE = "no-cache"
+_SHARED_ASSET_NAME_RE = re.compile(re.escape(SHARED_ASSET_FILENAME).replace(re.escape("{script_hash}"), "[0-9a-f]+"))
+
+# Extensions that may have --precompress siblings, so their responses vary by Accept-Encoding
+COMPRESSIBLE_EXTENSIONS = ('.html', '.htm', '.js', '.css', '.json', '.svg', '.txt')
+
+class RangeNotSatisfiable(Exception):
+    """Raised by parse_byte_range for a range that starts past the end of the file."""
+
+def parse_byte_range(header, size):
+    """
+    Returns the inclusive (start, end) of a single-range Range header for a file of size bytes,
+    or None if the header is to be ignored and the whole file sent (other units, several
+    ranges, invalid syntax). Raises RangeNotSatisfiable if no byte of the range exists.
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, dash, last = spec.strip().partition("-")
+    if not dash:
+        return None
+    try:
+        if not first: # Suffix range: the last N bytes
+            length = int(last)
+            if length <= 0 or size == 0:
+                raise RangeNotSatisfiable(header)
+            return max(0, size - length), size - 1
+        start = int(first)
+        end = int(last) if last else size - 1
+    except ValueError:
+        return None
+    if last and end < start:
+        return None
+    if start >= size:
+        raise RangeNotSatisfiable(header)
+    return start, min(end, size - 1)
+
+def accepted_encodings(header):
+    """Returns the set of content codings an Accept-Encoding header allows (q > 0)."""
+    accepted, rejected, wildcard = set(), set(), False
+    for item in header.split(","):
+        name, *parameters = [part.strip() for part in item.split(";")]
+        quality = 1.0
+        for parameter in parameters:
+            key, _, value = parameter.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        name = {"x-gzip": "gzip"}.get(name.lower(), name.lower())
+        if name == "*":
+            wildcard = quality > 0
+        elif quality > 0:
+            accepted.add(name)
+        else:
+            rejected.add(name)
+    if wildcard:
+        accepted |= {encoding for encoding, _ in PRECOMPRESS_ENCODINGS} - rejected
+    return accepted
+
+def etag_matches(header, etag):
+    """Weak comparison of an If-None-Match list (or *) against etag."""
+    if header.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in header.split(","))
+
+def content_type(path):
+    import mimetypes
+    mime_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+    if mime_type.startswith("text/") or mime_type in ("application/javascript", "application/json"):
+        mime_type += "; charset=utf-8"
+    return mime_type
+
+def cache_control(path):
+    name = os.path.basename(path)
+    if _SHARED_ASSET_NAME_RE.fullmatch(name):
+        return CACHE_CONTROL_IMMUTABLE
+    if name.lower().endswith(IMAGE_EXTENSIONS):
+        return CACHE_CONTROL_IMAGES
+    return CACHE_CONTROL_REVALIDATE
+
+class ReaderServer:
+    """
+    Static file server for a library of injected chapters. Serves GET and HEAD over persistent
+    HTTP/1.1 connections, all handled by one asyncio event loop: the --precompress .br/.gz
+    sibling of a file when the browser accepts it and the sibling is not older than the file,
+    strong ETags (from size and mtime, so nothing is hashed per request) answered with 304s,
+    single byte ranges, and cache headers suited to the reader (see cache_control). File bodies
+    are sent with loop.sendfile, which uses os.sendfile where the platform has it.
+    """
+
+    def __init__(self, root, quiet=False):
+        self.root = os.path.abspath(root)
+        self.quiet = quiet
+
+    def local_path(self, url_path):
+        """Maps a decoded URL path onto a path below the root, or returns None if it may not be served."""
+        parts = []
+        for part in url_path.split("/"):
+            if part in ("", "."):
+                continue
+            if part == ".." or "\0" in part or os.sep in part or (os.altsep and os.altsep in part) \
+                    or os.path.splitdrive(part)[0]:
+                return None
+            if part.startswith(".") and part not in SERVED_DOT_DIRECTORIES:
+                return None
+            parts.append(part)
+        return os.path.join(self.root, *parts)
+
+    def select_representation(self, path, accept_encoding):
+        """Returns (file path, Content-Encoding or None) of the preferred representation of path."""
+        file_stat = os.stat(path)
+        accepted = accepted_encodings(accept_encoding)
+        for encoding, suffix in PRECOMPRESS_ENCODINGS:
+            if encoding in accepted:
+                try:
+                    if os.stat(path + suffix).st_mtime_ns >= file_stat.st_mtime_ns:
+                        return path + suffix, encoding
+                except OSError:
+                    pass
+        return path, None
+
+    def directory_listing(self, directory, url_path):
+        """Returns a minimal HTML listing of directory, for libraries without --index pages."""
+        with os.scandir(directory) as entries:
+            entries = sorted((entry for entry in entries if not entry.name.startswith(".")),
+                             key=lambda entry: (not entry.is_dir(), natural_sort_key(entry.name)))
+        items = [] if url_path == "/" else ['<li><a href="../">../</a></li>']
+        for entry in entries:
+            name = entry.name + ("/" if entry.is_dir() else "")
+            items.append(f'<li><a href="{html.escape(urllib.parse.quote(name))}">{html.escape(name)}</a></li>')
+        title = html.escape(url_path)
+        return (f'<!DOCTYPE html>\n<html>\n<head>\n<meta charset="UTF-8">\n'
+                f'<meta name="viewport" content="width=device-width, initial-scale=1.0">\n<title>{title}</title>\n'
+                f'</head>\n<body>\n<h1>{title}</h1>\n<ul>\n' + "\n".join(items) + '\n</ul>\n</body>\n</html>\n').encode('utf-8')
+
+    async def handle_connection(self, reader, writer):
+        """Serves the requests of one connection until the client closes it or it idles out."""
+        import asyncio
+        from http import HTTPStatus
+        peer = writer.get_extra_info("peername")
+        client = peer[0] if peer else "-"
+        try:
+            keep_alive = True
+            while keep_alive:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), SERVE_IDLE_TIMEOUT)
+                except (asyncio.IncompleteReadError, asyncio.TimeoutError):
+                    break
+                except asyncio.LimitOverrunError:
+                    await self.respond(writer, client, "-", HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE, [], False)
+                    break
+                keep_alive = await self.handle_request(writer, client, head)
+        except ConnectionError:
+            pass # The client went away mid-response
+        finally:
+            writer.close()
+            with contextlib.suppress(Exception):
+                await writer.wait_closed()
+
+    async def handle_request(self, writer, client, head):
+        """Answers one request; returns whether the connection can be kept open."""
+        import email.utils
+        from http import HTTPStatus
+        lines = head.decode('latin-1').split("\r\n")
+        request = lines[0]
+        try:
+            method, target, version = request.split(" ")
+        except ValueError:
+            await self.respond(writer, client, request, HTTPStatus.BAD_REQUEST, [], False)
+            return False
+        headers = {}
+        for line in lines[1:]:
+            name, separator, value = line.partition(":")
+            if separator:
+                headers[name.strip().lower()] = value.strip()
+        connection = headers.get("connection", "").lower()
+        keep_alive = (version == "HTTP/1.1" and "close" not in connection) or \
+                     (version == "HTTP/1.0" and "keep-alive" in connection)
+        if "content-length" in headers or "transfer-encoding" in headers:
+            keep_alive = False # Request bodies are not read, so the connection cannot be reused
+        if not version.startswith("HTTP/1."):
+            await self.respond(writer, client, request, HTTPStatus.HTTP_VERSION_NOT_SUPPORTED, [], False)
+            return False
+        if method not in ("GET", "HEAD"):
+            await self.respond(writer, client, request, HTTPStatus.METHOD_NOT_ALLOWED, [("Allow", "GET, HEAD")], keep_alive)
+            return keep_alive
+        head_only = method == "HEAD"
+
+        url = urllib.parse.urlsplit(target)
+        url_path = urllib.parse.unquote(url.path)
+        path = self.local_path(url_path)
+        if path is not None and os.path.isdir(path):
+            if not url_path.endswith("/"):
+                location = url.path + "/" + (f"?{url.query}" if url.query else "")
+                await self.respond(writer, client, request, HTTPStatus.MOVED_PERMANENTLY, [("Location", location)],
+                                   keep_alive, head_only=head_only)
+                return keep_alive
+            if not os.path.isfile(os.path.join(path, INDEX_FILENAME)):
+                body = self.directory_listing(path, url_path)
+                await self.respond(writer, client, request, HTTPStatus.OK,
+                                   [("Content-Type", "text/html; charset=utf-8"),
+                                    ("Cache-Control", CACHE_CONTROL_REVALIDATE)], keep_alive, body, head_only=head_only)
+                return keep_alive
+            path = os.path.join(path, INDEX_FILENAME)
+        try:
+            if path is None or not os.path.isfile(path):
+                raise FileNotFoundError(url_path)
+            file_path, encoding = self.select_representation(path, headers.get("accept-encoding", ""))
+            f = open(file_path, 'rb')
+        except OSError:
+            await self.respond(writer, client, request, HTTPStatus.NOT_FOUND, [], keep_alive, head_only=head_only)
+            return keep_alive
+
+        with f:
+            file_stat = os.fstat(f.fileno())
+            size = file_stat.st_size
+            etag = f'"{size:x}-{file_stat.st_mtime_ns:x}' + (f'-{encoding}"' if encoding else '"')
+            last_modified = email.utils.formatdate(file_stat.st_mtime, usegmt=True)
+            validators = [("ETag", etag), ("Last-Modified", last_modified), ("Cache-Control", cache_control(path))]
+            if path.lower().endswith(COMPRESSIBLE_EXTENSIONS):
+                validators.append(("Vary", "Accept-Encoding"))
+
+            if "if-none-match" in headers:
+                not_modified = etag_matches(headers["if-none-match"], etag)
+            else:
+                try:
+                    since = email.utils.parsedate_to_datetime(headers["if-modified-since"]).timestamp()
+                    not_modified = int(file_stat.st_mtime) <= since
+                except (KeyError, TypeError, ValueError):
+                    not_modified = False
+            if not_modified:
+                await self.respond(writer, client, request, HTTPStatus.NOT_MODIFIED, validators, keep_alive)
+                return keep_alive
+
+            response_headers = [("Content-Type", content_type(path)), ("Accept-Ranges", "bytes"), *validators]
+            if encoding:
+                response_headers.append(("Content-Encoding", encoding))
+            status, start, length = HTTPStatus.OK, 0, size
+            # If-Range: only honour the range if the client's copy is still the current one
+            if "range" in headers and headers.get("if-range", etag).strip() in (etag, last_modified):
+                try:
+                    byte_range = parse_byte_range(headers["range"], size)
+                except RangeNotSatisfiable:
+                    await self.respond(writer, client, request, HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE,
+                                       [("Content-Range", f"bytes */{size}"), *validators], keep_alive)
+                    return keep_alive
+                if byte_range:
+                    status, start, length = HTTPStatus.PARTIAL_CONTENT, byte_range[0], byte_range[1] - byte_range[0] + 1
+                    response_headers.append(("Content-Range", f"bytes {byte_range[0]}-{byte_range[1]}/{size}"))
+            await self.respond(writer, client, request, status, response_headers, keep_alive,
+                               file=f, offset=start, length=length, head_only=head_only)
+        return keep_alive
+
+    async def respond(self, writer, client, request, status, headers, keep_alive, body=b"", file=None, offset=0,
+                      length=None, head_only=False):
+        """Writes a response: headers, then body, or length bytes of file from offset."""
+        import asyncio
+        import email.utils
+        from http import HTTPStatus
+        if file is None and not body and status >= 400:
+            body = f"{status.value} {status.phrase}\n".encode('utf-8')
+            headers = [("Content-Type", "text/plain; charset=utf-8"), *headers]
+        length = len(body) if file is None else length
+        lines = [f"HTTP/1.1 {status.value} {status.phrase}", f"Date: {email.utils.formatdate(usegmt=True)}",
+                 "Server: mokuro-webtoon", *(f"{name}: {value}" for name, value in headers)]
+        if status != HTTPStatus.NOT_MODIFIED:
+            lines.append(f"Content-Length: {length}")
+        lines.append(f"Connection: {'keep-alive' if keep_alive else 'close'}")
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode('latin-1'))
+        if not head_only and status != HTTPStatus.NOT_MODIFIED:
+            if file is not None and length:
+                await writer.drain()
+                await asyncio.get_running_loop().sendfile(writer.transport, file, offset, length)
+            elif body:
+                writer.write(body)
+        await writer.drain()
+        if not self.quiet:
+            print(f'{client} "{request}" {status.value} {length if not head_only and status != HTTPStatus.NOT_MODIFIED else 0}')
+
+def serve_main(argv):
+    """Entry point of the serve subcommand: python Injection.py serve [ROOT] [--port N]."""
+    parser = argparse.ArgumentParser(prog="Injection.py serve", formatter_class=argparse.RawTextHelpFormatter,
+                                     description="Serve a library of injected chapters to browsers on the local network.")
+    parser.add_argument("root", nargs="?", default=".", help="Library directory to serve (default: the current directory).")
+    parser.add_argument("--host", default="0.0.0.0",
+                        help="Address to listen on (default: all interfaces; 127.0.0.1 for this machine only).")
+    parser.add_argument("-p", "--port", type=int, default=SERVE_PORT, help=f"Port to listen on (default: {SERVE_PORT}).")
+    parser.add_argument("-q", "--quiet", action="store_true", help="Do not log every request.")
+    args = parser.parse_args(argv)
+    if not os.path.isdir(args.root):
+        print(f"Error: Library directory not found: {args.root}")
+        return 1
+    import asyncio # The server's modules are only imported by this subcommand
+    import mimetypes
+    for mime_type, extension in (("image/webp", ".webp"), ("image/avif", ".avif"), ("application/json", ".mokuro")):
+        mimetypes.add_type(mime_type, extension)
+    server = ReaderServer(args.root, args.quiet)
+
+    async def run():
+        listener = await asyncio.start_server(server.handle_connection, args.host, args.port,
+                                              limit=SERVE_MAX_HEADER_BYTES)
+        print(f"Serving {server.root} on http://{args.host}:{args.port}/ (Ctrl+C to stop).")
+        async with listener:
+            await listener.serve_forever()
+
+    try:
+        asyncio.run(run())
+    except OSError as e:
+        print(f"Error: Cannot listen on {args.host}:{args.port}: {e}")
+        return 1
+    except KeyboardInterrupt:
+        print("\nStopped serving.")
+    return 0
+
+# Original reader controls removed by --strip-reader (the same ones the webtoon stylesheet hides),
+# along with the menu that only the removed reader code drives.
+READER_CONTROL_IDS = (
+    "leftAPage", "rightAPage", "leftAScreen", "rightAScreen", "left-nav", "right-nav",
+    "buttonLeftLeft", "buttonLeft", "buttonRight", "buttonRightRight",
+    "menuDoublePageView", "menuR2l", "menuHasCover", "menuFitToScreen", "menuFitToWidth", "menuOriginalSize",
+    "pageIdxInput", "pageIdxDisplay", "topMenu", "showMenuA",
+)
+JAVASCRIPT_TYPES = ("", "text/javascript", "application/javascript", "module")
+
+def strip_reader(soup):
+    """
+    Removes Mokuro's original reader from the document: every script except the injected one
+    (panzoom, the page logic and its animation loop), the navigation/menu controls in
+    READER_CONTROL_IDS with their labels, and all inline on* event handlers. The <html>
+    element is marked with data-reader-stripped so the injected script skips disabling them.
+    Returns (scripts, controls, handlers) removed.
+    """
+    scripts = 0
+    for script in soup.find_all("script"):
+        if script.get("id") == INJECTED_SCRIPT_ID:
+            continue
+        if (script.get("type") or "").strip().lower() not in JAVASCRIPT_TYPES:
+            continue # Data blocks such as application/json are not reader code
+        script.decompose()
+        scripts += 1
+
+    controls = 0
+    for control_id in READER_CONTROL_IDS:
+        element = soup.find(id=control_id)
+        if element is None:
+            continue
+        for label in soup.find_all("label", attrs={"for": control_id}):
+            label.decompose()
+        element.decompose()
+        controls += 1
+
+    handlers = 0
+    for element in soup.find_all(True):
+        for attribute in [name for name in element.attrs if name.lower().startswith("on")]:
+            del element[attribute]
+            handlers += 1
+
+    if soup.html is not None:
+        soup.html["data-reader-stripped"] = "true"
+    return scripts, controls, handlers
+
+def _transform_strip_reader(soup, html_file_path):
+    scripts, controls, handlers = strip_reader(soup)
+    logger.info(f"  Stripped the original reader: {scripts} script(s), {controls} control(s), {handlers} inline handler(s).")
+
+def document_transforms(precompute_layout=False, resolve_images=False, variants=None, tile_height=None,
+                        strip_reader=False, image_sizes=False, image_workers=1):
+    """
+    Returns the (name, function) DOM transforms enabled by the given options, in the order they
+    are applied. Each function takes (soup, html_file_path). Transforms need the bs4 engine.
+    """
+    transforms = []
+    if strip_reader:
+        transforms.append(("strip-reader", _transform_strip_reader))
+    if resolve_images:
+        transforms.append(("resolve-images", _transform_resolve_images))
+    if image_sizes:
+        transforms.append(("image-sizes", _transform_image_sizes))
+    if tile_height:
+        transforms.append((f"tiles:{tile_height}",
+                           functools.partial(_transform_tiles, tile_height=tile_height, workers=image_workers)))
+    if variants:
+        widths = tuple(sorted(set(variants)))
+        transforms.append((f"variants:{'/'.join(map(str, widths))}",
+                           functools.partial(_transform_variants, widths=widths, workers=image_workers)))
+    if precompute_layout:
+        transforms.append(("precompute-layout", _transform_precompute_layout))
+    return transforms
+
+def document_hash(script_hash, transforms):
+    """
+    Returns the version stored on the injected tag: the script hash, combined with the names of
+    the DOM transforms applied, so changing either makes existing outputs stale.
+    """
+    if not transforms:
+        return script_hash
+    names = ",".join(name for name, _ in transforms)
+    return hashlib.sha256(f"{script_hash}:{names}".encode('utf-8')).hexdigest()[:16]
+
+def _parse_html(markup):
+    """
+    Parses markup with BeautifulSoup's html.parser. bs4 is imported on first use, as the splice
+    engine and the search and serve subcommands never need it.
+    """
+    from bs4 import BeautifulSoup
+    return BeautifulSoup(markup, 'html.parser')
+
+def _inject_into_soup(soup, html_file_path, script_hash, javascript, src, transforms=(), metadata=None,
+                      text_boxes=None):
+    """
+    Applies the DOM transforms to a parsed document and replaces (or adds) the injected script
+    element. html_file_path is where the document lives, for transforms that resolve files.
+    metadata and text_boxes are filled as described for _inject_with_soup.
+    """
+    if text_boxes is not None:
+        text_boxes.extend(extract_text_boxes(soup))
+    for _, transform in transforms:
+        transform(soup, html_file_path)
+    if metadata is not None:
+        metadata.update(soup_chapter_metadata(soup))
+
+    existing_script = soup.find('script', id=INJECTED_SCRIPT_ID)
+    if existing_script:
+        logger.info(f"  Script '{INJECTED_SCRIPT_ID}' already found. Replacing it.")
+        existing_script.decompose()
+    else:
+        logger.info(f"  Injecting script '{INJECTED_SCRIPT_ID}'.")
+
+    new_script_tag = soup.new_tag('script')
+    new_script_tag['type'] = 'text/javascript'
+    new_script_tag['id'] = INJECTED_SCRIPT_ID
+    new_script_tag['data-script-hash'] = script_hash
+    if src:
+        new_script_tag['src'] = src
+        new_script_tag.string = ""
+    else:
+        new_script_tag.string = javascript
+
+    target_element = soup.body or soup.head or soup.html
+    if target_element:
+        if not soup.body and soup.head:
+             logger.warning("  Warning: <body> tag not found. Appending script to <head>.")
+        elif not soup.body and not soup.head and soup.html:
+             logger.warning("  Warning: <body> and <head> not found. Appending script to root <html>.")
+        target_element.append(new_script_tag)
+    else:
+        raise Exception("No <html>, <head>, or <body> tag found. Cannot inject script.")
+
+def _inject_with_soup(html_file_path, final_output_path, script_hash, javascript, src, transforms=(), metadata=None,
+                      text_boxes=None, stats=None):
+    """
+    BeautifulSoup engine: parses the whole document, applies the DOM transforms, replaces the
+    injected script and writes the re-serialized tree to a temporary file next to
+    final_output_path, whose path is returned. Used for documents the splice engine cannot
+    handle and whenever DOM transforms are requested.
+    If a metadata dict is given it is filled with the chapter metadata of the parsed tree, and
+    a text_boxes list with the OCR text (see extract_text_boxes), read before the transforms.
+    Phase timings are added to stats, if given; serializing the tree counts as "write".
+    """
+    with _timed(stats, "read"), open(html_file_path, 'r', encoding='utf-8') as f:
+        html_content = f.read()
+
+    with _timed(stats, "parse"):
+        soup = _parse_html(html_content)
+    with _timed(stats, "modify"):
+        _inject_into_soup(soup, html_file_path, script_hash, javascript, src, transforms, metadata, text_boxes)
+
+    with _timed(stats, "write"), staged_output(final_output_path) as (f, temp_path):
+        f.write(str(soup))
+    return temp_path
+
+def _record_counts(stats, metadata):
+    if stats is not None and metadata:
+        stats["pages"] = metadata.get("pages")
+        stats["textboxes"] = metadata.get("textboxes")
+
+class Injector:
+    """
+    Importable injection API, for programs that inject many chapters in one process (e.g. a
+    downloader handing chapters over as they arrive). The payload (configured script, minified
+    for the shared asset, and its hash) and the DOM transforms are prepared once, instead of on
+    every call:
+
+        injector = Injector(asset_mode="inline", script_options={"lazy_margin": 2000})
+        html_bytes = injector.inject_bytes(downloaded_bytes)
+        injector.inject_file("chapter.html", "out/chapter.html")
+        for input_path, output_path, written, error in injector.inject_many(paths, output_dir="out"):
+            ...
+
+    engine is "splice" (streaming, leaves all other bytes untouched), "bs4" (full parse) or
+    "auto"; documents the splice engine cannot follow fall back to BeautifulSoup, which is only
+    imported then. With asset_mode="shared" only a <script src> reference to the shared asset
+    in asset_root (see write_shared_asset) is injected instead of the full script.
+    script_options configures the script itself (see SCRIPT_OPTION_CONSTANTS) and
+    transform_options enable DOM transforms applied at injection time, such as
+    precompute_layout or resolve_images (see document_transforms); they require the bs4 engine.
+    Progress messages are sent to logging.getLogger("Injection") (INFO, warnings at WARNING);
+    the command line prints them.
+    """
+
+    def __init__(self, engine="auto", asset_mode="inline", asset_root=None, script_options=None, **transform_options):
+        if engine not in INJECTION_ENGINES:
+            raise ValueError(f"Unknown engine '{engine}' (choose from {', '.join(INJECTION_ENGINES)}).")
+        if asset_mode not in ASSET_MODES:
+            raise ValueError(f"Unknown asset mode '{asset_mode}' (choose from {', '.join(ASSET_MODES)}).")
+        self.engine = engine
+        self.asset_mode = asset_mode
+        self.asset_root = asset_root
+        self.script_options = dict(script_options or {})
+        self.transforms = document_transforms(**transform_options)
+        payload_hash, self.javascript = build_payload(asset_mode, **self.script_options)
+        self.asset_filename = SHARED_ASSET_FILENAME.format(script_hash=payload_hash)
+        self.script_hash = document_hash(payload_hash, self.transforms)
+
+    def script_src(self, final_output_path):
+        """
+        Returns the URL of the shared asset relative to final_output_path (asset_root, or the
+        output's own directory), or None when the script is inlined.
+        """
+        if self.asset_mode != "shared":
+            return None
+        output_dir = os.path.dirname(os.path.abspath(final_output_path))
+        asset_path = os.path.join(os.path.abspath(self.asset_root or output_dir), self.asset_filename)
+        return urllib.parse.quote(os.path.relpath(asset_path, output_dir).replace(os.sep, "/"))
+
+    def write_shared_asset(self, library_root=None):
+        """Writes the shared asset into library_root (default: asset_root) and returns its path."""
+        return write_shared_asset(library_root or self.asset_root or ".", **self.script_options)
+
+    def is_up_to_date(self, html_file_path, final_output_path=None):
+        return is_up_to_date(html_file_path, final_output_path or html_file_path, self.script_hash)
+
+    def inject_file(self, html_file_path, final_output_path=None, force=False, staged=False, metadata=None,
+                    text_boxes=None, stats=None):
+        """
+        Injects the script into html_file_path and saves the result to final_output_path
+        (default: overwrite the input). Unless force is set, files whose output already carries
+        the current script are left alone.
+
+        The output is written to a temporary file in the destination directory and atomically
+        renamed onto final_output_path, so an interrupted run never leaves a truncated file.
+        With staged=True the rename is left to the caller (see AtomicWriteBatch) and the path of
+        the temporary file is returned. Otherwise returns True if the output was written,
+        False if it was already up to date.
+
+        If a metadata dict is given it is filled with the chapter's page count, textbox count and
+        first page image (see ChapterMetadataScanner), gathered by whichever pass reads the file.
+        If a text_boxes list is given it is filled with the chapter's OCR text for the search
+        database (see extract_text_boxes); this reuses the BeautifulSoup parse, so it implies
+        the bs4 engine.
+
+        If a stats dict is given it is filled with the engine used ("splice", "bs4", or None when
+        the output was already up to date), whether the splice engine fell back, the seconds spent
+        per phase (STAT_PHASES: read, parse, modify, write), bytes_in and bytes_out, plus the page
+        and textbox counts when metadata is gathered.
+        """
+        final_output_path = final_output_path or html_file_path
+        if stats is not None:
+            stats.update({"engine": None, "fallback": False, **{phase: 0.0 for phase in STAT_PHASES},
+                          "bytes_in": os.path.getsize(html_file_path), "bytes_out": 0})
+        script_hash = self.script_hash
+        src = self.script_src(final_output_path)
+        with _timed(stats, "read"):
+            up_to_date = not force and is_up_to_date(html_file_path, final_output_path, script_hash)
+        if up_to_date:
+            logger.info(f"  Already up to date (script {script_hash}). Skipping.")
+            if metadata is not None:
+                with _timed(stats, "read"):
+                    metadata.update(scan_chapter_metadata(final_output_path))
+                _record_counts(stats, metadata)
+            if text_boxes is not None:
+                with _timed(stats, "parse"), open(final_output_path, 'r', encoding='utf-8') as f:
+                    text_boxes.extend(extract_text_boxes(_parse_html(f.read())))
+            return False
+        temp_path = None
+        needs_parse = bool(self.transforms) or text_boxes is not None
+        if needs_parse and self.engine == "splice":
+            logger.info("  Note: The requested DOM transforms or text extraction need a full parse. Using BeautifulSoup.")
+        if self.engine != "bs4" and not needs_parse:
+            try:
+                temp_path = _inject_with_splice(html_file_path, final_output_path, script_hash, self.javascript, src,
+                                                metadata, stats)
+                engine_used = "splice"
+            except SpliceFallback as e:
+                logger.info(f"  Note: {e} Falling back to BeautifulSoup.")
+                if stats is not None:
+                    stats["fallback"] = True
+        if temp_path is None:
+            temp_path = _inject_with_soup(html_file_path, final_output_path, script_hash, self.javascript, src,
+                                          self.transforms, metadata, text_boxes, stats)
+            engine_used = "bs4"
+        if stats is not None:
+            stats["engine"] = engine_used
+            stats["bytes_out"] = os.path.getsize(temp_path)
+            _record_counts(stats, metadata)
+        logger.info(f"  Successfully saved: {final_output_path}")
+        if staged:
+            return temp_path
+        with _timed(stats, "write"):
+            os.replace(temp_path, final_output_path)
+        return True
+
+    def inject_bytes(self, data, base_path=None, metadata=None, text_boxes=None):
+        """
+        Returns the injected document for the UTF-8 HTML bytes data, entirely in memory (e.g.
+        straight from a download). base_path is where the document will be saved: DOM transforms
+        resolve image files relative to it and the shared asset URL is made relative to it
+        (default: a document in the current directory). metadata and text_boxes are filled as
+        for inject_file. Documents already carrying the script get it replaced.
+        """
+        base_path = os.path.abspath(base_path or "document.html")
+        src = self.script_src(base_path)
+        if self.engine != "bs4" and not self.transforms and text_boxes is None:
+            scanner = ChapterMetadataScanner() if metadata is not None else None
+            try:
+                spans, closing = _scan_for_splice(io.BytesIO(data), metadata_scanner=scanner)
+            except SpliceFallback as e:
+                logger.info(f"  Note: {e} Falling back to BeautifulSoup.")
+            else:
+                if scanner is not None:
+                    metadata.update(scanner.result())
+                edits = _plan_splice(spans, closing, build_script_tag(self.script_hash, self.javascript, src).encode('utf-8'))
+                output = io.BytesIO()
+                _apply_splice(io.BytesIO(data), output, edits)
+                return output.getvalue()
+        soup = _parse_html(data.decode('utf-8'))
+        _inject_into_soup(soup, base_path, self.script_hash, self.javascript, src, self.transforms, metadata, text_boxes)
+        return str(soup).encode('utf-8')
+
+    def inject_many(self, paths, output_dir=None, force=False):
+        """
+        Injects files one at a time as the returned iterator is consumed, yielding
+        (input_path, output_path, written, error) for each. paths may be any iterable (e.g. a
+        generator fed by a download queue) of input paths, which are overwritten or, with
+        output_dir, written there under their own name, or of (input_path, output_path) pairs.
+        A failing file yields its exception as error instead of ending the iteration.
+        """
+        for item in paths:
+            if isinstance(item, tuple):
+                input_path, output_path = item
+            else:
+                input_path = item
+                output_path = os.path.join(output_dir, os.path.basename(item)) if output_dir else item
+            try:
+                written = self.inject_file(input_path, output_path, force=force)
+            except Exception as e:
+                yield input_path, output_path, False, e
+                continue
+            yield input_path, output_path, written, None
+
+@functools.lru_cache(maxsize=16)
+def _cached_injector(options_key):
+    engine, asset_mode, asset_root, script_options, transform_options = json.loads(options_key)
+    return Injector(engine, asset_mode, asset_root, script_options, **transform_options)
+
+def inject_script_to_html(html_file_path, final_output_path, engine="auto", force=False, staged=False,
+                          asset_mode="inline", asset_root=None, script_options=None, metadata=None,
+                          text_boxes=None, stats=None, **transform_options):
+    """
+    Injects the JAVASCRIPT_TO_INJECT into the given HTML file and saves it; see Injector for
+    the options and Injector.inject_file for the other arguments and the return value.
+    The Injector built for a set of options is reused by later calls with the same options, so
+    batches only prepare the payload once per process.
+    """
+    options_key = json.dumps([engine, asset_mode, asset_root, script_options or {}, transform_options], sort_keys=True)
+    return _cached_injector(options_key).inject_file(html_file_path, final_output_path, force, staged, metadata,
+                                                     text_boxes, stats)
+
+def natural_sort_key(path):
+    """Sort key ordering embedded numbers numerically, so 'Chapter 2' sorts before 'Chapter 10'."""
+    return [(0, int(part), "") if part.isdigit() else (1, 0, part.lower()) for part in re.split(r"(\d+)", path)]
+
+def rebase_url(url, from_dir, to_dir):
+    """
+    Rewrites a relative (percent-encoded) URL written for a document in from_dir so that it
+    points at the same file from a document in to_dir. Remote, absolute, data and fragment
+    URLs are returned unchanged.
+    """
+    parsed = urllib.parse.urlsplit(url)
+    if parsed.scheme or parsed.netloc or not parsed.path or parsed.path.startswith("/") or from_dir == to_dir:
+        return url
+    target = os.path.normpath(os.path.join(from_dir, urllib.parse.unquote(parsed.path)))
+    rebased = os.path.relpath(target, to_dir).replace(os.sep, "/")
+    return urllib.parse.urlunsplit(("", "", urllib.parse.quote(rebased), parsed.query, parsed.fragment))
+
+def _rebase_page_urls(container, from_dir, to_dir):
+    """Rebases every image URL a .pageContainer carries (background, srcset, tiles)."""
+    url = page_background_url(container)
+    if url:
+        style = parse_style(container.get("style"))
+        style["background-image"] = f'url("{rebase_url(url, from_dir, to_dir)}")'
+        container["style"] = format_style(style)
+    if container.has_attr("data-source-image"):
+        container["data-source-image"] = rebase_url(container["data-source-image"], from_dir, to_dir)
+    if container.has_attr("data-srcset"):
+        candidates = []
+        for candidate in container["data-srcset"].split(", "):
+            candidate_url, _, descriptor = candidate.partition(" ")
+            candidates.append(f"{_srcset_url(rebase_url(candidate_url, from_dir, to_dir))} {descriptor}".rstrip())
+        container["data-srcset"] = ", ".join(candidates)
+    for img in container.find_all("img", attrs={"data-src": True}):
+        img["data-src"] = rebase_url(img["data-src"], from_dir, to_dir)
+
+def build_volume(chapter_paths, output_path):
+    """
+    Merges the #pagesContainer contents of the given chapter HTMLs, in order, into one
+    continuous document based on the first chapter. Each chapter becomes a
+    section.webtoon-chapter holding its pages in an inert <template>, which the injected
+    script materializes as the reader scrolls near it; until then the section reserves the
+    chapter's height (the sum of its pages' height/width ratios). Image URLs are rebased to
+    the output's directory and element ids prefixed per chapter to stay unique. The <title>
+    is set from the output's file name.
+    Returns (soup, chapters merged, pages merged).
+    """
+    output_dir = os.path.dirname(os.path.abspath(output_path))
+    volume = None
+    volume_container = None
+    chapters = pages = 0
+    for chapter_index, chapter_path in enumerate(chapter_paths):
+        with open(chapter_path, 'r', encoding='utf-8') as f:
+            soup = _parse_html(f.read())
+        pages_container = soup.find(id="pagesContainer")
+        if pages_container is None:
+            logger.warning(f"  Warning: No #pagesContainer in {chapter_path}. Skipping chapter.")
+            continue
+        if volume is None: # The first chapter's document is the volume's shell
+            volume = soup
+            volume_container = pages_container
+            existing_script = volume.find('script', id=INJECTED_SCRIPT_ID)
+            if existing_script:
+                existing_script.decompose()
+        chapter_content = pages_container.contents[:]
+
+        template = volume.new_tag("template", attrs={"class": "webtoon-chapter-pages"})
+        for node in chapter_content:
+            template.append(node.extract())
+
+        chapter_dir = os.path.dirname(os.path.abspath(chapter_path))
+        height_ratio = 0.0
+        for container in template.find_all(class_="pageContainer"):
+            _rebase_page_urls(container, chapter_dir, output_dir)
+            style = parse_style(container.get("style"))
+            width, height = css_px(style.get("width")), css_px(style.get("height"))
+            if width and height and width > 0 and height > 0:
+                height_ratio += height / width
+        for element in template.find_all(id=True):
+            element["id"] = f"c{chapter_index}-{element['id']}"
+        pages += len(template.find_all(class_="page"))
+
+        section = volume.new_tag("section", attrs={
+            "class": "webtoon-chapter",
+            "id": f"chapter-{chapter_index}",
+            "data-chapter-title": os.path.splitext(os.path.basename(chapter_path))[0],
+            "data-hydrated": "false",
+            "style": f"--chapter-height-ratio: {format_number(height_ratio) if height_ratio else 1};",
+        })
+        section.append(template)
+        volume_container.append(section)
+        chapters += 1
+    if volume is not None:
+        title = volume.title
+        if title is None:
+            title = volume.new_tag("title")
+            (volume.head or volume.html or volume).insert(0, title)
+        title.string = volume_title(output_path)
+    return volume, chapters, pages
+
+def volume_title(output_path):
+    """Returns the title of a merged volume: its file name without the .webtoon.html/.html suffix."""
+    name = os.path.basename(output_path)
+    for suffix in (".webtoon.html", ".html", ".htm"):
+        if name.lower().endswith(suffix):
+            return name[:-len(suffix)] or name
+    return name
+
+def _matches_any(relative_path, patterns):
+    """Case-insensitively matches a '/'-separated relative path, or its last component, against glob patterns."""
+    relative_path = relative_path.lower()
+    name = relative_path.rsplit("/", 1)[-1]
+    return any(fnmatch.fnmatchcase(relative_path, pattern.lower()) or fnmatch.fnmatchcase(name, pattern.lower())
+               for pattern in patterns)
+
+def iter_html_files(directory, recursive=False, include=HTML_INCLUDE_PATTERNS, exclude=()):
+    """
+    Lazily yields the paths of the files in directory matching include and not exclude, except
+    the index pages written by --index (see is_generated_index).
+    Uses os.scandir, whose cached entry types avoid a stat per file. Each directory's entries
+    are yielded in name order, depth first. With recursive, subdirectories are walked as well;
+    directories reached twice (e.g. through symlink loops) are only walked once.
+    """
+    visited = set()
+    stack = [(directory, "")]
+    while stack:
+        current, relative_dir = stack.pop()
+        try:
+            dir_stat = os.stat(current)
+            with os.scandir(current) as it:
+                entries = sorted(it, key=lambda entry: entry.name)
+        except OSError as e:
+            logger.warning(f"  Warning: Cannot read directory {current}: {e}")
+            continue
+        dir_key = (dir_stat.st_dev, dir_stat.st_ino)
+        if dir_key in visited:
+            logger.warning(f"  Warning: Skipping directory already visited (symlink loop?): {current}")
+            continue
+        visited.add(dir_key)
+
+        subdirs = []
+        for entry in entries:
+            relative_path = relative_dir + entry.name
+            try:
+                if entry.is_file():
+                    if _matches_any(relative_path, include) and not _matches_any(relative_path, exclude) \
+                            and not is_generated_index(entry.path):
+                        yield entry.path
+                elif recursive and entry.is_dir() and not _matches_any(relative_path, exclude):
+                    subdirs.append((entry.path, relative_path + "/"))
+            except OSError:
+                continue
+        stack.extend(reversed(subdirs))
+
+def _iter_recursive_inputs(input_roots, include, exclude):
+    """
+    Yields (html_file_path, input_root) for every HTML file under the given files/directories,
+    as they are discovered, without duplicates.
+    """
+    seen = set()
+    for root in input_roots:
+        if os.path.isfile(root):
+            paths = [root] if root.lower().endswith(('.html', '.htm')) else []
+            if not paths:
+                print(f"Warning: Skipping non-HTML file specified directly: {root}")
+            elif is_generated_index(root):
+                print(f"Warning: Skipping generated index page: {root}")
+                paths = []
+            root = os.path.dirname(root)
+        else:
+            paths = iter_html_files(root, recursive=True, include=include, exclude=exclude)
+        for path in paths:
+            if path not in seen:
+                seen.add(path)
+                yield path, root
+
+# Watch mode (--watch): seconds a changed file must stay unchanged before it is injected,
+# and the number of files injected per batch.
+WATCH_SETTLE_SECONDS = 2.0
+WATCH_BATCH_SIZE = 8
+WATCH_POLL_INTERVAL = 2.0
+
+class PollingWatcher:
+    """
+    Reports files added or replaced under the watched directories by periodically checking
+    the directories' mtimes; only directories whose mtime changed are listed again, so an
+    idle library costs one stat per directory per interval. Files rewritten in place
+    (without a rename or new entry) are not detected.
+    """
+    def __init__(self, roots, recursive, interval=WATCH_POLL_INTERVAL):
+        self.recursive = recursive
+        self.interval = interval
+        self.directories = {} # directory -> (mtime_ns, {file name: (size, mtime_ns)})
+        self.visited = {} # (st_dev, st_ino) -> directory, so symlink aliases and loops are listed once
+        for root in roots:
+            self._scan(root, report=False)
+        self.last_scan = time.monotonic()
+
+    def _scan(self, directory, report=True):
+        """Lists directory (and new subdirectories); returns the files added or changed."""
+        changed = set()
+        try:
+            dir_stat = os.stat(directory)
+            dir_key = (dir_stat.st_dev, dir_stat.st_ino)
+            if self.visited.setdefault(dir_key, directory) != directory:
+                return changed # Already watched under another path (e.g. a symlink loop)
+            mtime_ns = dir_stat.st_mtime_ns
+            with os.scandir(directory) as it:
+                entries = list(it)
+        except OSError:
+            self.directories.pop(directory, None)
+            self.visited = {key: path for key, path in self.visited.items() if path != directory}
+            return changed
+        previous = self.directories.get(directory, (None, {}))[1]
+        files = {}
+        for entry in entries:
+            try:
+                if entry.is_file():
+                    entry_stat = entry.stat()
+                    files[entry.name] = (entry_stat.st_size, entry_stat.st_mtime_ns)
+                    if report and previous.get(entry.name) != files[entry.name]:
+                        changed.add(entry.path)
+                elif self.recursive and entry.is_dir() and entry.path not in self.directories:
+                    changed |= self._scan(entry.path, report)
+            except OSError:
+                continue
+        self.directories[directory] = (mtime_ns, files)
+        return changed
+
+    def poll(self, timeout):
+        """Waits up to timeout seconds; the directories are checked once every interval."""
+        remaining = self.last_scan + self.interval - time.monotonic()
+        if remaining > timeout:
+            time.sleep(timeout)
+            return set()
+        time.sleep(max(0.0, remaining))
+        self.last_scan = time.monotonic()
+        changed = set()
+        for directory, (mtime_ns, _) in list(self.directories.items()):
+            try:
+                if os.stat(directory).st_mtime_ns == mtime_ns:
+                    continue
+            except OSError:
+                del self.directories[directory]
+                continue
+            changed |= self._scan(directory)
+        return changed
+
+    def close(self):
+        pass
+
+class InotifyWatcher:
+    """
+    Reports files written or moved into the watched directories using Linux inotify (through
+    ctypes, no extra dependency). Subdirectories created later are watched as they appear.
+    Raises OSError where inotify is unavailable.
+    """
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ISDIR = 0x40000000
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+    WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+    _EVENT = struct.Struct("iIII")
+
+    def __init__(self, roots, recursive):
+        if not sys.platform.startswith("linux"):
+            raise OSError("inotify is only available on Linux")
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = self._libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.roots = roots
+        self.recursive = recursive
+        self.directories = {} # watch descriptor -> directory
+        for root in roots:
+            self._watch_tree(root)
+
+    def _watch_tree(self, directory):
+        """Watches directory (and its subdirectories if recursive); returns the files already in them."""
+        existing = set()
+        stack = [directory]
+        while stack:
+            current = stack.pop()
+            wd = self._libc.inotify_add_watch(self.fd, os.fsencode(current), self.WATCH_MASK)
+            if wd < 0:
+                logger.warning(f"  Warning: Cannot watch {current}: {os.strerror(ctypes.get_errno())}")
+                continue
+            if wd in self.directories:
+                continue # Already watched (e.g. reached through a symlink)
+            self.directories[wd] = current
+            try:
+                with os.scandir(current) as it:
+                    for entry in it:
+                        if entry.is_file():
+                            existing.add(entry.path)
+                        elif self.recursive and entry.is_dir():
+                            stack.append(entry.path)
+            except OSError:
+                continue
+        return existing
+
+    def poll(self, timeout):
+        changed = set()
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return changed
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, name_length = self._EVENT.unpack_from(data, offset)
+                offset += self._EVENT.size
+                name = data[offset:offset + name_length].rstrip(b"\0")
+                offset += name_length
+                if mask & self.IN_Q_OVERFLOW:
+                    # Events were lost: report everything, the up-to-date check filters it down
+                    for root in self.roots:
+                        changed |= set(iter_html_files(root, recursive=self.recursive, include=("*",)))
+                    continue
+                if mask & self.IN_IGNORED:
+                    self.directories.pop(wd, None)
+                    continue
+                directory = self.directories.get(wd)
+                if directory is None or not name:
+                    continue
+                path = os.path.join(directory, os.fsdecode(name))
+                if mask & self.IN_ISDIR:
+                    if self.recursive and mask & (self.IN_CREATE | self.IN_MOVED_TO):
+                        changed |= self._watch_tree(path) # Files may have landed before the watch
+                elif mask & (self.IN_CLOSE_WRITE | self.IN_MOVED_TO):
+                    changed.add(path)
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+def create_watcher(roots, recursive, interval=WATCH_POLL_INTERVAL):
+    """Returns an InotifyWatcher where inotify is available, otherwise a PollingWatcher."""
+    try:
+        return InotifyWatcher(roots, recursive)
+    except (OSError, AttributeError) as e: # AttributeError: libc without inotify functions
+        logger.warning(f"  inotify unavailable ({e}); polling every {interval:g}s instead.")
+        return PollingWatcher(roots, recursive, interval)
+
+def _parse_widths(value):
+    """argparse type for a comma-separated list of positive pixel widths."""
+    try:
+        widths = [int(part) for part in value.split(",") if part.strip()]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid width list: '{value}'")
+    if not widths or any(width <= 0 for width in widths):
+        raise argparse.ArgumentTypeError(f"invalid width list: '{value}'")
+    return widths
+
+class _StdoutLogHandler(logging.Handler):
+    """Prints log records to the current sys.stdout, so redirect_stdout captures them too."""
+
+    def emit(self, record):
+        print(self.format(record))
+
+def _log_to_stdout():
+    """Makes the injection API's messages part of the command line output (idempotent)."""
+    if not any(isinstance(handler, _StdoutLogHandler) for handler in logger.handlers):
+        logger.addHandler(_StdoutLogHandler())
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+
+def _inject_worker(input_path, output_path, options):
+    """
+    Runs inject_script_to_html for one file (staged, so the parent commits the rename) and
+    returns (console output, error message, written, chapter metadata or None, OCR text rows
+    or None, staged compressed siblings, stats). Metadata is only gathered when options has
+    collect_metadata set, and the text when it has collect_text set. With precompress set, the
+    compressed siblings of the output are staged too (see precompress_file) when it was written
+    or they are missing or stale. stats holds the per-file metrics of inject_script_to_html plus
+    the total seconds spent on the file (and on precompressing it).
+    Output is captured instead of printed so the caller can emit it in a deterministic order,
+    whether the file was processed in this process or in a worker process.
+    """
+    buffer = io.StringIO()
+    error = None
+    written = False # False if up to date, otherwise the staged temporary file
+    options = dict(options)
+    metadata = {} if options.pop("collect_metadata", False) else None
+    text_boxes = [] if options.pop("collect_text", False) else None
+    precompress = options.pop("precompress", False)
+    siblings = []
+    stats = {}
+    start = time.perf_counter()
+    _log_to_stdout() # Also in spawned worker processes, which do not run main()
+    with contextlib.redirect_stdout(buffer):
+        try:
+            written = inject_script_to_html(input_path, output_path, staged=True, metadata=metadata,
+                                            text_boxes=text_boxes, stats=stats, **options)
+        except FileNotFoundError:
+            error = f"  Error: Input file not found during processing: {input_path}"
+        except Exception as e:
+            error = f"  Error processing file {input_path}: {e}"
+        if precompress and not error and (written or not precompressed_is_current(output_path)):
+            precompress_start = time.perf_counter()
+            try:
+                siblings = precompress_file(output_path, written or None, staged=True)
+            except OSError as e:
+                print(f"  Warning: Could not precompress {output_path}: {e}")
+            stats["precompress"] = time.perf_counter() - precompress_start
+            if siblings:
+                print(f"  Precompressed: {', '.join(os.path.basename(path) for _, path in siblings)}")
+    stats["seconds"] = time.perf_counter() - start
+    return buffer.getvalue(), error, written, metadata, text_boxes, siblings, stats
+
+def _run_tasks(tasks, jobs, options):
+    """
+    Yields (task, result) for each (input_path, output_path, messages, result, task_options)
+    task, in task order. Tasks that already carry a result, or have no output path (skipped,
+    result None), are passed through; the others are run through _inject_worker with the
+    given options updated with the task's own options.
+    With jobs > 1 the files are spread across a process pool, keeping a bounded window of
+    files in flight.
+    """
+    def needs_work(task):
+        return task[1] is not None and task[3] is None
+
+    if jobs <= 1:
+        for task in tasks:
+            yield task, _inject_worker(task[0], task[1], {**options, **task[4]}) if needs_work(task) else task[3]
+        return
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        pending = deque()
+        for task in tasks:
+            future = executor.submit(_inject_worker, task[0], task[1], {**options, **task[4]}) if needs_work(task) else None
+            pending.append((task, future))
+            while len(pending) > jobs * 4:
+                done_task, done_future = pending.popleft()
+                yield done_task, done_future.result() if done_future else done_task[3]
+        while pending:
+            done_task, done_future = pending.popleft()
+            yield done_task, done_future.result() if done_future else done_task[3]
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a non-empty sequence (fraction between 0 and 1)."""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+def _format_duration(seconds):
+    minutes, seconds = divmod(int(seconds + 0.5), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}"
+
+# Aggregates written by --report for the total and per-phase seconds of the written files
+REPORT_PERCENTILES = (("p50", 0.50), ("p90", 0.90), ("p99", 0.99))
+REPORT_SLOWEST_FILES = 10
+
+class RunReport:
+    """
+    Per-file metrics of a run (--report): status, engine, seconds per phase, bytes in and out,
+    page and textbox counts. Written as one JSON document, or for a .jsonl path as JSON lines
+    (one "file" line per file, then a "summary" line), with aggregate percentiles. script_hash
+    is the version stamped into the outputs (see document_hash), so reports can be matched to them.
+    """
+
+    def __init__(self, path, script_hash):
+        self.path = path
+        self.script_hash = script_hash
+        self.started = time.strftime("%Y-%m-%dT%H:%M:%S%z")
+        self.start = time.perf_counter()
+        self.files = []
+
+    def add(self, input_path, output_path, status, stats=None, error=None):
+        entry = {"type": "file", "input": input_path, "output": output_path, "status": status}
+        for key, value in (stats or {}).items():
+            entry[key] = round(value, 6) if isinstance(value, float) else value
+        if error:
+            entry["error"] = error.strip()
+        self.files.append(entry)
+
+    def summary(self):
+        wall = time.perf_counter() - self.start
+        written = [entry for entry in self.files if entry["status"] == "processed"]
+        bytes_in = sum(entry["bytes_in"] for entry in written)
+        timings = {}
+        for key in ("seconds",) + STAT_PHASES + ("precompress",):
+            values = [entry[key] for entry in written if key in entry]
+            if values:
+                timings[key] = {"mean": round(sum(values) / len(values), 6),
+                                **{name: percentile(values, fraction) for name, fraction in REPORT_PERCENTILES},
+                                "max": max(values), "total": round(sum(values), 6)}
+        slowest = sorted(written, key=lambda entry: entry["seconds"], reverse=True)[:REPORT_SLOWEST_FILES]
+        return {
+            "type": "summary",
+            "started": self.started,
+            "script_hash": self.script_hash,
+            "wall_seconds": round(wall, 6),
+            "files": len(self.files),
+            "status": {status: sum(entry["status"] == status for entry in self.files)
+                       for status in ("processed", "up_to_date", "skipped", "failed")},
+            "engines": {engine: sum(entry["engine"] == engine for entry in written) for engine in ("splice", "bs4")},
+            "fallbacks": sum(bool(entry.get("fallback")) for entry in written),
+            "bytes_in": bytes_in,
+            "bytes_out": sum(entry["bytes_out"] for entry in written),
+            "files_per_sec": round(len(written) / wall, 3) if wall else None,
+            "mb_per_sec": round(bytes_in / wall / 1e6, 3) if wall else None,
+            "timings": timings,
+            "slowest": [{"input": entry["input"], "seconds": entry["seconds"], "engine": entry["engine"],
+                         "bytes_in": entry["bytes_in"]} for entry in slowest],
+        }
+
+    def write(self):
+        """Atomically (re)writes the report with everything recorded so far."""
+        summary = self.summary()
+        with atomic_write(self.path) as f:
+            if self.path.endswith(".jsonl"):
+                for entry in self.files:
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                f.write(json.dumps(summary, ensure_ascii=False) + "\n")
+            else:
+                json.dump({"summary": summary, "files": self.files}, f, indent=1, ensure_ascii=False)
+
+class ProgressDisplay:
+    """
+    Live single-line progress on stderr: files done, files/s and MB/s of the written files and,
+    when the total is known, the ETA. Redrawn at most every interval seconds.
+    """
+
+    def __init__(self, total=None, interval=0.2):
+        self.total = total
+        self.interval = interval
+        self.start = time.perf_counter()
+        self.files = 0
+        self.bytes = 0
+        self.last_draw = 0.0
+        self.width = 0
+
+    def update(self, bytes_in=0):
+        self.files += 1
+        self.bytes += bytes_in
+        now = time.perf_counter()
+        if now - self.last_draw >= self.interval or self.files == self.total:
+            self.draw(now)
+
+    def draw(self, now=None):
+        now = now or time.perf_counter()
+        elapsed = max(now - self.start, 1e-9)
+        rate = self.files / elapsed
+        line = (f"{self.files}/{self.total}" if self.total else f"{self.files}") + \
+               f" files  {rate:.1f} files/s  {self.bytes / elapsed / 1e6:.1f} MB/s"
+        if self.total and self.files:
+            line += f"  ETA {_format_duration((self.total - self.files) / rate)}"
+        sys.stderr.write("\r" + line.ljust(self.width))
+        sys.stderr.flush()
+        self.width = len(line)
+        self.last_draw = now
+
+    def clear(self):
+        """Erases the progress line, so regular output can be printed."""
+        if self.width:
+            sys.stderr.write("\r" + " " * self.width + "\r")
+            sys.stderr.flush()
+            self.width = 0
+
+    def finish(self):
+        self.draw()
+        sys.stderr.write("\n")
+        sys.stderr.flush()
+
+def main(argv=None):
+    """
+    Command line entry point: python Injection.py [options] INPUT..., or one of the search,
+    from-ocr and serve subcommands. Returns the exit status.
+    """
+    argv = sys.argv[1:] if argv is None else argv
+    _log_to_stdout()
+    if argv and argv[0] == "search":
+        return search_main(argv[1:])
+    if argv and argv[0] == "from-ocr":
+        return from_ocr_main(argv[1:])
+    if argv and argv[0] == "serve":
+        return serve_main(argv[1:])
+
+    parser = argparse.ArgumentParser(
+        description="Injects a specific JavaScript into HTML file(s) or all HTML files in specified directorie(s) for Mokuro webtoon style.",
+        formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument(
+        "input_paths",
+        nargs='+',
+        help="Path(s) to input HTML file(s) and/or directorie(s) containing HTML files."
+             "\n(e.g., 'manga-ch1.html' 'my_manga_folder/' './another_folder')."
+    )
+    parser.add_argument(
+        "-o", "--output",
+        help="Output file path (if single resolved input file & output is a file name), "
+             "or output directory (if multiple resolved input files, or single input & output is a directory path). "
+             "\nIf not provided, input file(s) will be overwritten (with a single confirmation at the start)."
+    )
+    parser.add_argument(
+        "-y", "--yes",
+        action="store_true",
+        help="Automatically confirm all overwrites. Use with caution."
+    )
+    parser.add_argument(
+        "-j", "--jobs",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Number of worker processes used to process files in parallel (default: CPU count)."
+             "\nUse 1 to process files one at a time in this process."
+    )
+    parser.add_argument(
+        "-r", "--recursive",
+        action="store_true",
+        help="Walk input directories recursively (e.g. a Series/Chapter/*.html library)."
+             "\nFiles are processed as soon as they are found; with -o the directory layout"
+             "\nbelow each input directory is mirrored in the output directory."
+    )
+    parser.add_argument(
+        "--include",
+        action="append",
+        metavar="GLOB",
+        help="Only process files whose name or path relative to the input directory matches GLOB."
+             f"\nMay be given several times (default: {' '.join(HTML_INCLUDE_PATTERNS)})."
+    )
+    parser.add_argument(
+        "--exclude",
+        action="append",
+        metavar="GLOB",
+        help="Skip files and directories whose name or relative path matches GLOB."
+             "\nMay be given several times."
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Re-inject every file, even those that already carry the current script version."
+    )
+    parser.add_argument(
+        "--index",
+        action="store_true",
+        help=f"Maintain an '{INDEX_FILENAME}' per output directory and library root listing the"
+             "\nchapters (page and textbox counts, first-page thumbnail, injection status)."
+             "\nThe metadata is gathered while injecting and kept in the manifest (implies"
+             "\n--manifest), so only directories with changed chapters are re-indexed."
+             f"\nFiles named '{INDEX_FILENAME}' are then not treated as chapters."
+    )
+    parser.add_argument(
+        "--search-db",
+        metavar="DB",
+        help="Keep the OCR text of every textbox (with page and box coordinates) in the SQLite"
+             "\nFTS5 database DB, updated incrementally per chapter. Chapters that need"
+             "\n(re)indexing are parsed with BeautifulSoup. Query it with:"
+             "\n  python Injection.py search DB \"text\""
+    )
+    parser.add_argument(
+        "--progress",
+        action="store_true",
+        help="Show a live progress line (files/s, MB/s, ETA) instead of the per-file messages."
+             "\nErrors are still printed."
+    )
+    parser.add_argument(
+        "--report",
+        metavar="PATH",
+        help="Write per-file metrics (engine, read/parse/modify/write seconds, bytes in and out,"
+             "\npage and textbox counts, status) with aggregate percentiles and the slowest files"
+             "\nto PATH: a JSON document, or JSON lines if PATH ends in .jsonl."
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="After processing, keep running and inject chapter HTMLs that appear or change in"
+             "\nthe input directories (inotify on Linux, directory polling elsewhere). Files are"
+             "\ninjected once they have stopped changing, in small batches."
+    )
+    parser.add_argument(
+        "--watch-settle",
+        type=float,
+        default=WATCH_SETTLE_SECONDS,
+        metavar="SECONDS",
+        help=f"With --watch, how long a file must stay unchanged before it is injected (default: {WATCH_SETTLE_SECONDS:g})."
+    )
+    parser.add_argument(
+        "--watch-batch",
+        type=int,
+        default=WATCH_BATCH_SIZE,
+        metavar="N",
+        help=f"With --watch, the maximum number of files injected per batch (default: {WATCH_BATCH_SIZE})."
+    )
+    parser.add_argument(
+        "--watch-poll",
+        type=float,
+        default=WATCH_POLL_INTERVAL,
+        metavar="SECONDS",
+        help=f"With --watch and no inotify, the directory polling interval (default: {WATCH_POLL_INTERVAL:g})."
+    )
+    parser.add_argument(
+        "--manifest",
+        action="store_true",
+        help=f"Keep a '{MANIFEST_FILENAME}' file (path, size, mtime, script hash) in each output"
+             "\ndirectory, so unchanged files can be skipped on later runs without opening them."
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Continue an interrupted batch: skip the files recorded as completed in the journal."
+    )
+    parser.add_argument(
+        "--journal",
+        metavar="PATH",
+        help=f"Journal of completed files used by --resume (default: ./{DEFAULT_JOURNAL_PATH})."
+             "\nKept in overwrite mode, with --resume or when given; removed once a batch completes."
+    )
+    parser.add_argument(
+        "--fsync-batch",
+        type=int,
+        default=FSYNC_BATCH_SIZE,
+        metavar="N",
+        help=f"Number of written files flushed to disk together before being atomically renamed"
+             f"\ninto place (default: {FSYNC_BATCH_SIZE})."
+    )
+    parser.add_argument(
+        "--asset-mode",
+        choices=ASSET_MODES,
+        default="inline",
+        help="How the script is delivered (default: inline)."
+             "\n  inline: copy the full script into every HTML file."
+             "\n  shared: write one minified, versioned mokuro-webtoon.<hash>.js per library root"
+             "\n          (the output directory, or each input directory when overwriting) and"
+             "\n          inject only a <script src> with a relative path, so browsers cache it."
+    )
+    parser.add_argument(
+        "--precompress",
+        action="store_true",
+        help="Write compressed copies next to every output (and the shared script and index"
+             "\npages): name.html.gz, plus name.html.br if the brotli module is installed. The"
+             "\nserve subcommand sends them to browsers that accept the encoding:"
+             "\n  python Injection.py serve LIBRARY_DIR"
+    )
+    parser.add_argument(
+        "--strip-reader",
+        action="store_true",
+        help="Remove Mokuro's original reader from the document: its scripts (panzoom, page"
+             "\nnavigation, animation loop), the navigation and menu controls and inline event"
+             "\nhandlers, so the browser never downloads or runs code the webtoon script would"
+             "\nonly have to disable (uses the bs4 engine)."
+    )
+    parser.add_argument(
+        "--precompute-layout",
+        action="store_true",
+        help="Convert textbox positions to percentages and store base font sizes at injection time,"
+             "\nso the browser only applies a scale factor on load (uses the bs4 engine)."
+    )
+    parser.add_argument(
+        "--resolve-images",
+        action="store_true",
+        help="Index the image files next to each HTML once per directory and point every page at"
+             "\nthe file actually present (any extension), so the browser does not have to guess"
+             "\nextensions with failed requests (uses the bs4 engine)."
+    )
+    parser.add_argument(
+        "--image-sizes",
+        action="store_true",
+        help="Read each page image's real size from its file header (PNG, JPEG, GIF, WebP, AVIF;"
+             "\nno pixels are decoded) and write it into the page as width/height/aspect-ratio"
+             "\nhints, rescaling the textboxes where the image was resized after OCR, so the layout"
+             "\nis final before any image arrives (uses the bs4 engine)."
+    )
+    parser.add_argument(
+        "--no-lazy-loading",
+        action="store_true",
+        help="Make the injected reader load every page image up front instead of only the pages"
+             "\nnear the viewport (and releasing far off-screen ones)."
+    )
+    parser.add_argument(
+        "--lazy-margin",
+        type=int,
+        metavar="PX",
+        help="Distance from the viewport within which page images are loaded (script default: 1500)."
+    )
+    parser.add_argument(
+        "--evict-margin",
+        type=int,
+        metavar="PX",
+        help="Distance from the viewport beyond which loaded page images are released (script default: 6000)."
+    )
+    parser.add_argument(
+        "--native-touch-scroll",
+        action="store_true",
+        help="Leave one-finger touch scrolling to the browser instead of the injected reader's"
+             "\nscroll engine (which coalesces drags into one scroll per frame, with momentum)."
+    )
+    parser.add_argument(
+        "--instrument",
+        action="store_true",
+        help="Build the injected script with performance instrumentation: performance marks"
+             "\nand measures for the bootstrap phases, image loads, fallback attempts, textbox"
+             "\nprocessing and zoom updates, summarized by window.__mokuroWebtoonPerf.summary()"
+             "\n(add #webtoon-perf to the URL for an on-screen overlay). Off by default, when the"
+             "\ninstrumentation and the console.log progress messages are compiled out."
+    )
+    parser.add_argument(
+        "--perf-overlay",
+        action="store_true",
+        help="Like --instrument, and always show the on-screen performance overlay."
+    )
+    parser.add_argument(
+        "--variants",
+        type=_parse_widths,
+        metavar="W1,W2,...",
+        help="Generate downscaled copies of each page image at these widths (e.g. 480,900,1800)"
+             f"\nin a '{VARIANTS_DIRNAME}' folder next to the images, and let the reader pick the"
+             "\nsmallest adequate one via srcset. Requires Pillow; uses the bs4 engine."
+    )
+    parser.add_argument(
+        "--tile-height",
+        type=int,
+        metavar="PX",
+        help="Split page images taller than PX pixels into stacked tiles (saved in a"
+             f"\n'{TILES_DIRNAME}' folder next to the images), remapping the OCR boxes onto them,"
+             "\nso mobile browsers never have to decode a whole long strip. Requires Pillow."
+    )
+    parser.add_argument(
+        "--merge-volume",
+        metavar="OUT_HTML",
+        help="Merge all resolved chapter HTMLs (in natural name order) into one continuous"
+             "\nwebtoon document OUT_HTML instead of injecting each file. Chapters are kept as"
+             "\ninert templates and only materialized as the reader scrolls near them."
+    )
+    parser.add_argument(
+        "--engine",
+        choices=INJECTION_ENGINES,
+        default="auto",
+        help="Injection engine (default: auto)."
+             "\n  splice: stream the file and only replace/insert the injected <script> tag,"
+             "\n          leaving every other byte untouched (bounded memory)."
+             "\n  bs4:    parse and re-serialize the whole document with BeautifulSoup."
+             "\n  auto:   use splice, falling back to bs4 for malformed documents."
+    )
+
+    args = parser.parse_args(argv)
+
+    if args.variants or args.tile_height:
+        try:
+            import PIL # Optional dependency, only needed for the image stages
+        except ImportError:
+            print("Error: --variants and --tile-height require Pillow (pip install Pillow).")
+            return 1
+
+    if args.precompress and not _brotli_module():
+        print("Note: The brotli module is not installed; --precompress writes only .gz files (pip install brotli).")
+
+    transform_options = {
+        "precompute_layout": args.precompute_layout,
+        "resolve_images": args.resolve_images,
+        "variants": args.variants,
+        "tile_height": args.tile_height,
+        "strip_reader": args.strip_reader,
+        "image_sizes": args.image_sizes,
+    }
+    script_options = {
+        "lazy_loading": False if args.no_lazy_loading else None,
+        "lazy_margin": args.lazy_margin,
+        "evict_margin": args.evict_margin,
+        "touch_scroll": False if args.native_touch_scroll else None,
+        "instrument": args.instrument or args.perf_overlay,
+        "perf_overlay": True if args.perf_overlay else None,
+    }
+
+    include_patterns = tuple(args.include) if args.include else HTML_INCLUDE_PATTERNS
+    exclude_patterns = tuple(args.exclude or ())
+    if args.index:
+        args.manifest = True # The index is built from the manifest entries
+        exclude_patterns += (INDEX_FILENAME,)
+
+    # --- 1. Resolve input_paths to actual HTML files ---
+    if args.recursive:
+        # Files are discovered lazily and fed into processing as soon as they are found,
+        # so the total is unknown up front.
+        input_roots = []
+        for path_arg in args.input_paths:
+            path_arg = os.path.abspath(path_arg) # Normalize path
+            if os.path.isfile(path_arg) or os.path.isdir(path_arg):
+                input_roots.append(path_arg)
+            else:
+                print(f"Warning: Input path not found or not a file/directory: {path_arg}")
+        if not input_roots:
+            print("No HTML files found to process. Exiting.")
+            return 0
+        files_to_process = _iter_recursive_inputs(input_roots, include_patterns, exclude_patterns)
+        total_files = None
+        multiple_outputs = True
+        print(f"\nRecursively scanning {len(input_roots)} input path(s); processing starts as files are found.")
+    else:
+        resolved_html_files = set() # Use a set to avoid duplicates
+        for path_arg in args.input_paths:
+            path_arg = os.path.abspath(path_arg) # Normalize path
+            if os.path.isfile(path_arg):
+                if is_generated_index(path_arg):
+                    print(f"Warning: Skipping generated index page: {path_arg}")
+                elif path_arg.lower().endswith(('.html', '.htm')):
+                    resolved_html_files.add(path_arg)
+                else:
+                    print(f"Warning: Skipping non-HTML file specified directly: {path_arg}")
+            elif os.path.isdir(path_arg):
+                print(f"Scanning directory: {path_arg}")
+                found_in_dir = 0
+                for item_path in iter_html_files(path_arg, include=include_patterns, exclude=exclude_patterns):
+                    resolved_html_files.add(item_path)
+                    found_in_dir +=1
+                if found_in_dir == 0:
+                    print(f"  No .html or .htm files found in directory: {path_arg}")
+                else:
+                    print(f"  Found {found_in_dir} HTML file(s) in {path_arg}")
+            else:
+                print(f"Warning: Input path not found or not a file/directory: {path_arg}")
+
+        actual_files_to_process = sorted(list(resolved_html_files)) # Convert to sorted list for consistent order
+
+        if not actual_files_to_process and not args.watch:
+            print("No HTML files found to process. Exiting.")
+            return 0
+
+        print(f"\nTotal unique HTML files to process: {len(actual_files_to_process)}")
+        files_to_process = ((path, os.path.dirname(path)) for path in actual_files_to_process)
+        total_files = len(actual_files_to_process)
+        multiple_outputs = total_files > 1
+    # --- End of input file resolution ---
+
+    if args.merge_volume:
+        # Volume mode: the inputs are chapters of a single output document, injected once
+        chapter_paths = sorted((path for path, _ in files_to_process), key=natural_sort_key)
+        volume_path = os.path.abspath(args.merge_volume)
+        if os.path.isdir(volume_path) or volume_path in chapter_paths:
+            print(f"Error: --merge-volume must name a new HTML file, not a directory or one of the chapters: {volume_path}")
+            return 1
+        print(f"\nMerging {len(chapter_paths)} chapter(s) into: {volume_path}")
+        merged_path = None
+        try:
+            volume, chapter_count, page_count = build_volume(chapter_paths, volume_path)
+            if volume is None:
+                print("No chapter with a #pagesContainer found. Nothing to merge.")
+                return 1
+            print(f"  Merged {chapter_count} chapter(s), {page_count} page(s).")
+            with staged_output(volume_path) as (f, merged_path):
+                f.write(str(volume))
+            if args.asset_mode == "shared":
+                asset_path = write_shared_asset(os.path.dirname(volume_path), **script_options)
+                print(f"  Shared script asset: {asset_path}")
+                if args.precompress:
+                    precompress_file(asset_path)
+            inject_script_to_html(merged_path, volume_path, engine="bs4", force=True, asset_mode=args.asset_mode,
+                                  script_options=script_options, image_workers=max(1, args.jobs), **transform_options)
+            if args.precompress:
+                print(f"  Precompressed: {', '.join(os.path.basename(path) for path in precompress_file(volume_path))}")
+        except Exception as e:
+            print(f"Error building volume {volume_path}: {e}")
+            return 1
+        finally:
+            if merged_path:
+                with contextlib.suppress(OSError):
+                    os.remove(merged_path)
+        return 0
+
+
+    if args.watch:
+        multiple_outputs = True # Files found later are written below -o as well, so it is a directory
+
+    # --- 2. Validate --output based on the number of resolved files ---
+    if args.output and multiple_outputs:
+        # If output is specified and there are multiple files, output MUST be a directory
+        if os.path.exists(args.output) and not os.path.isdir(args.output):
+            print(f"Error: Output path '{args.output}' is an existing file. "
+                  "For multiple input files, --output must specify a directory.")
+            return 1
+    # --- End of output validation ---
+
+
+    # --- 3. Handle overwrite confirmation if no -o is given ---
+    proceed_with_overwrites = False
+    if not args.output: # Overwrite mode is active
+        if args.yes:
+            proceed_with_overwrites = True
+            print("\nOverwrite mode: -y specified, all input files will be overwritten if possible.")
+        else:
+            if total_files is None:
+                files_description = "every HTML file found under the given input path(s)"
+            else:
+                plural_s = "s" if total_files > 1 else ""
+                files_description = f"{total_files} resolved input file{plural_s}"
+            confirm_msg = (
+                f"\nNo output destination specified. This will attempt to overwrite "
+                f"{files_description}.\n"
+                "Are you sure you want to proceed with overwriting ALL applicable files? (yes/no): "
+            )
+            initial_confirm = input(confirm_msg).lower()
+            if initial_confirm == 'yes':
+                proceed_with_overwrites = True
+                print("Overwrite mode: Confirmed. Applicable input files will be overwritten.")
+            else:
+                print("Operation cancelled by user. No files will be overwritten.")
+                return 0
+    # --- End of overwrite confirmation ---
+
+    # --- 4. Resolve the output path of each file (lazily, as files are found) ---
+    manifests = {} # output directory -> manifest file entries (only with --manifest)
+    # The journal is only kept where a re-run could not tell finished files apart: when inputs
+    # are overwritten in place, or when asked for
+    use_journal = not args.output or args.resume or args.journal is not None
+    journal_path = os.path.abspath(args.journal or DEFAULT_JOURNAL_PATH)
+    completed_before = load_journal(journal_path) if args.resume else set()
+    script_hash = document_hash(build_payload(args.asset_mode, **script_options)[0], document_transforms(**transform_options))
+    asset_roots = set() # Library roots whose shared script asset has been written
+    if args.resume:
+        print(f"\nResuming: {len(completed_before)} file(s) already completed according to {journal_path}")
+
+    def resolve_tasks(files_to_process):
+        for input_path, input_root in files_to_process:
+            messages = []
+            actual_output_path = ""
+
+            if args.output:
+                if multiple_outputs: # Multiple resolved files -> output must be dir
+                    # Ensure output directory exists (or can be created)
+                    if not os.path.exists(args.output):
+                         os.makedirs(args.output, exist_ok=True)
+                         messages.append(f"  Created output directory: {args.output}")
+                    elif not os.path.isdir(args.output): # Should have been caught by pre-validation
+                        messages.append(f"  Internal Error: Output path '{args.output}' is not a directory.")
+                        yield (input_path, None, messages, None, {})
+                        continue
+                    # Recursive mode mirrors the library layout below the output directory
+                    relative_path = os.path.relpath(input_path, input_root) if args.recursive else os.path.basename(input_path)
+                    actual_output_path = os.path.join(args.output, relative_path)
+                else: # Single resolved file with -o argument
+                    if args.output.endswith(os.path.sep) or \
+                       (os.path.exists(args.output) and os.path.isdir(args.output)): # Output is a dir
+                        if not os.path.exists(args.output):
+                            os.makedirs(args.output, exist_ok=True)
+                            messages.append(f"  Created output directory: {args.output}")
+                        actual_output_path = os.path.join(args.output, os.path.basename(input_path))
+                    else: # Output is a specific file name
+                        actual_output_path = args.output
+            else: # Overwrite mode
+                if not proceed_with_overwrites: # Should have exited if user said no
+                    messages.append(f"  Skipping overwrite for {input_path} (internal safeguard).")
+                    yield (input_path, None, messages, None, {})
+                    continue
+                actual_output_path = input_path
+
+            task_options = {}
+            if args.asset_mode == "shared":
+                # One shared script per library root: the output directory, or the input directory in overwrite mode
+                if args.output:
+                    asset_root = args.output if multiple_outputs else os.path.dirname(os.path.abspath(actual_output_path))
+                else:
+                    asset_root = input_root
+                asset_root = os.path.abspath(asset_root)
+                if asset_root not in asset_roots:
+                    asset_path = write_shared_asset(asset_root, **script_options)
+                    asset_roots.add(asset_root)
+                    messages.append(f"  Shared script asset: {asset_path}")
+                    if args.precompress and not precompressed_is_current(asset_path):
+                        precompress_file(asset_path)
+                task_options["asset_root"] = asset_root
+
+            if search_db is not None and not search_db.is_current(actual_output_path):
+                task_options["collect_text"] = True
+
+            result = None
+            if task_options.get("collect_text"):
+                pass # Not in the search database yet: the worker reads the (possibly up to date) output
+            elif input_path in completed_before:
+                result = ("  Already completed before the interruption (journal). Skipping.\n", None, False, None, None, [], None)
+            elif args.manifest and not args.force:
+                output_dir = os.path.dirname(os.path.abspath(actual_output_path))
+                if output_dir not in manifests:
+                    manifests[output_dir] = load_manifest(output_dir)
+                entry = manifests[output_dir].get(os.path.basename(actual_output_path))
+                if manifest_is_current(entry, input_path, actual_output_path, script_hash) and \
+                        (not args.precompress or precompressed_is_current(actual_output_path)):
+                    metadata = None
+                    if args.index and not entry.get("chapter"):
+                        # Recorded before --index was used: the index needs the chapter's counts and thumbnail
+                        with contextlib.suppress(OSError):
+                            metadata = scan_chapter_metadata(actual_output_path)
+                    result = (f"  Already up to date (manifest, script {script_hash}). Skipping.\n", None, False, metadata, None, [], None)
+
+            yield (input_path, actual_output_path, messages, result, task_options)
+    # --- End of output path resolution ---
+
+
+    # --- 5. Process each resolved file ---
+    dirty_manifests = set()
+    report = RunReport(os.path.abspath(args.report), script_hash) if args.report else None
+    search_db = SearchDatabase(args.search_db) if args.search_db else None
+    if args.output:
+        index_roots = [os.path.abspath(args.output if multiple_outputs else os.path.dirname(os.path.abspath(args.output)))]
+    else:
+        index_roots = sorted({os.path.abspath(path if os.path.isdir(path) else os.path.dirname(path))
+                              for path in args.input_paths if os.path.exists(path)})
+
+    def missing_indexes(output_dirs):
+        """Returns the output directories, and the library roots above them, that have no index page yet."""
+        directories = set(output_dirs)
+        directories.update(root for root in index_roots
+                           if any(directory == root or directory.startswith(root + os.sep) for directory in output_dirs))
+        return {directory for directory in directories if not os.path.exists(os.path.join(directory, INDEX_FILENAME))}
+
+    def update_indexes(changed_dirs):
+        """Rewrites the index of every changed output directory, then of the library roots above them."""
+        for directory in sorted(changed_dirs):
+            if directory not in index_roots:
+                try:
+                    index_path = write_index(directory, script_hash)
+                    if args.precompress:
+                        precompress_file(index_path)
+                except OSError as e:
+                    print(f"Warning: Could not write index in {directory}: {e}")
+        for root in index_roots:
+            if any(directory == root or directory.startswith(root + os.sep) for directory in changed_dirs):
+                try:
+                    index_path = write_index(root, script_hash, find_series_directories(root))
+                    print(f"\nLibrary index: {index_path}")
+                    if args.precompress:
+                        precompress_file(index_path)
+                except OSError as e:
+                    print(f"Warning: Could not write index in {root}: {e}")
+
+    def process_files(files_to_process, total_files):
+        """
+        Injects the given (input_path, input_root) files and returns (counts, completed
+        (input_path, output_path) pairs, interrupted).
+        """
+        counts = {"considered": 0, "processed": 0, "up_to_date": 0, "skipped": 0, "bytes_in": 0}
+        completed_paths = []
+        output_dirs = set()
+        options = {"engine": args.engine, "force": args.force, "asset_mode": args.asset_mode,
+                   "script_options": script_options, "collect_metadata": args.index or bool(args.report),
+                   "precompress": args.precompress, **transform_options}
+        jobs = max(1, args.jobs if total_files is None else min(args.jobs, total_files))
+        if args.variants or args.tile_height:
+            # Image stages get their own process pool only when files are not already processed in parallel
+            options["image_workers"] = max(1, args.jobs) if jobs == 1 else 1
+        if jobs > 1:
+            print(f"\nProcessing with {jobs} worker processes.")
+        progress = ProgressDisplay(total_files) if args.progress else None
+
+        # Written files are renamed into place in crash-safe batches; once renamed they are
+        # recorded in the journal so an interrupted run can be continued with --resume.
+        batch = AtomicWriteBatch(args.fsync_batch)
+        journal = None
+        if use_journal:
+            try:
+                journal = open(journal_path, 'a' if args.resume else 'w', encoding='utf-8')
+            except OSError as e:
+                print(f"Warning: Cannot write the journal {journal_path} ({e}); an interrupted run cannot be resumed.")
+
+        def record_completed(completed):
+            for input_path, output_path, metadata, text_boxes in completed:
+                if journal is not None:
+                    journal.write(input_path + "\n")
+                completed_paths.append((input_path, output_path))
+                output_dirs.add(os.path.dirname(os.path.abspath(output_path)))
+                if search_db is not None:
+                    search_db.update(output_path, text_boxes)
+                if args.manifest:
+                    output_dir = os.path.dirname(os.path.abspath(output_path))
+                    if output_dir not in manifests:
+                        manifests[output_dir] = load_manifest(output_dir)
+                    entries = manifests[output_dir]
+                    entry = manifest_entry(input_path, output_path, script_hash)
+                    previous = entries.get(os.path.basename(output_path)) or {}
+                    if metadata:
+                        entry["chapter"] = metadata
+                    elif "chapter" in previous:
+                        entry["chapter"] = previous["chapter"] # Skipped without being read
+                    if previous != entry:
+                        entries[os.path.basename(output_path)] = entry
+                        dirty_manifests.add(output_dir)
+            if completed:
+                if journal is not None:
+                    journal.flush()
+                if search_db is not None:
+                    search_db.commit()
+
+        interrupted = False
+        try:
+            tasks = _run_tasks(resolve_tasks(files_to_process), jobs, options)
+            for i, ((input_path, output_path, messages, _, _), result) in enumerate(tasks):
+                counts["considered"] += 1
+                if progress is None:
+                    position = f"{i+1}/{total_files}" if total_files is not None else f"{i+1}"
+                    print(f"\n[{position}] Processing: {input_path}")
+                    for message in messages:
+                        print(message)
+                if result is None:
+                    counts["skipped"] += 1
+                    if report is not None:
+                        report.add(input_path, output_path, "skipped")
+                    if progress is not None:
+                        progress.update()
+                    continue
+                output_text, error, written, metadata, text_boxes, siblings, stats = result
+                if progress is None and output_text:
+                    print(output_text, end="")
+                if report is not None:
+                    status = "failed" if error else "processed" if written else "up_to_date"
+                    report.add(input_path, output_path, status, stats, error)
+                if progress is not None:
+                    progress.update(stats["bytes_in"] if written else 0)
+                if error:
+                    if progress is not None:
+                        progress.clear() # Errors are still printed in progress mode
+                    print(error)
+                    counts["skipped"] += 1
+                    continue
+                if written:
+                    counts["processed"] += 1
+                    counts["bytes_in"] += stats["bytes_in"]
+                    record_completed(batch.add(written, output_path, (input_path, output_path, metadata, text_boxes)))
+                else:
+                    counts["up_to_date"] += 1
+                    record_completed([(input_path, output_path, metadata, text_boxes)])
+                for temp_path, sibling_path in siblings:
+                    # Staged after their file, so they are never renamed into place before it
+                    record_completed(batch.add(temp_path, sibling_path))
+        except KeyboardInterrupt:
+            interrupted = True
+            if progress is not None:
+                progress.clear()
+            print("\nInterrupted. Saving the files already written" +
+                  ("; re-run with --resume to continue." if journal is not None else "."))
+        finally:
+            if progress is not None and not interrupted:
+                progress.finish()
+            try:
+                record_completed(batch.commit())
+            finally:
+                batch.discard()
+                if journal is not None:
+                    journal.close()
+                if report is not None:
+                    try:
+                        report.write()
+                    except OSError as e:
+                        print(f"Warning: Could not write report {args.report}: {e}")
+                for output_dir in sorted(dirty_manifests):
+                    try:
+                        save_manifest(output_dir, manifests[output_dir])
+                    except OSError as e:
+                        print(f"Warning: Could not write manifest in {output_dir}: {e}")
+                if args.index:
+                    update_indexes(dirty_manifests | missing_indexes(output_dirs))
+                dirty_manifests.clear()
+
+        if journal is not None and not interrupted:
+            with contextlib.suppress(OSError):
+                os.remove(journal_path) # The batch completed; nothing left to resume
+        return counts, completed_paths, interrupted
+
+    batch_start = time.perf_counter()
+    counts, completed_paths, interrupted = process_files(files_to_process, total_files)
+    elapsed = time.perf_counter() - batch_start
+    if interrupted:
+        if search_db is not None:
+            search_db.close()
+        return 130
+
+    print(f"\n--- Batch Processing Summary ---")
+    print(f"Total unique HTML files considered: {counts['considered']}")
+    print(f"Successfully processed: {counts['processed']}")
+    print(f"Already up to date:     {counts['up_to_date']}")
+    print(f"Skipped or failed:    {counts['skipped']}")
+    print(f"Elapsed: {elapsed:.2f}s ({counts['processed'] / elapsed:.1f} files/s, "
+          f"{counts['bytes_in'] / elapsed / 1e6:.1f} MB/s written)")
+    if report is not None:
+        print(f"Report written to {args.report}")
+
+    # --- 6. Watch the input directories for new or changed chapters (--watch) ---
+    if args.watch:
+        watch_roots = [os.path.abspath(path) for path in args.input_paths if os.path.isdir(path)]
+        if not watch_roots:
+            print("Error: --watch needs at least one input directory.")
+            if search_db is not None:
+                search_db.close()
+            return 1
+        output_root = os.path.abspath(args.output) if args.output else None
+        completed_before.clear() # The journal only applies to the initial pass
+
+        def watch_root_of(path):
+            """Returns the watched root an input HTML file belongs to, or None if it is not an input."""
+            if output_root and (path == output_root or path.startswith(output_root + os.sep)):
+                return None # Our own outputs
+            for root in watch_roots:
+                relative_path = os.path.relpath(path, root)
+                if relative_path == os.pardir or relative_path.startswith(os.pardir + os.sep):
+                    continue
+                relative_path = relative_path.replace(os.sep, "/")
+                if (args.recursive or "/" not in relative_path) and _matches_any(relative_path, include_patterns) \
+                        and not _matches_any(relative_path, exclude_patterns):
+                    return root
+            return None
+
+        def stat_key(path):
+            file_stat = os.stat(path)
+            return file_stat.st_size, file_stat.st_mtime_ns
+
+        own_writes = {} # output path -> (size, mtime_ns) right after we wrote it, to ignore its echo
+        for _, output_path in completed_paths:
+            with contextlib.suppress(OSError):
+                own_writes[output_path] = stat_key(output_path)
+
+        print(f"\nWatching {len(watch_roots)} director{'y' if len(watch_roots) == 1 else 'ies'} for new or "
+              f"changed chapters (settle {args.watch_settle:g}s, batches of {args.watch_batch}). Press Ctrl+C to stop.")
+        watcher = create_watcher(watch_roots, args.recursive, args.watch_poll)
+        pending = {} # path -> ((size, mtime_ns) when last seen, monotonic time it was last seen changing)
+        try:
+            while True:
+                for path in watcher.poll(args.watch_settle / 2):
+                    if watch_root_of(path):
+                        pending[path] = (None, time.monotonic())
+                now = time.monotonic()
+                stable = []
+                for path, (key, since) in list(pending.items()):
+                    try:
+                        current = stat_key(path)
+                    except OSError:
+                        del pending[path] # Deleted or renamed away before it settled
+                        continue
+                    if own_writes.get(path) == current:
+                        del pending[path]
+                    elif current != key:
+                        pending[path] = (current, now) # Still being written
+                    elif now - since >= args.watch_settle:
+                        del pending[path]
+                        if not is_generated_index(path): # e.g. our own index rewritten in overwrite mode
+                            stable.append(path)
+
+                stable.sort(key=natural_sort_key)
+                for start in range(0, len(stable), args.watch_batch):
+                    chunk = stable[start:start + args.watch_batch]
+                    print(f"\n{time.strftime('%H:%M:%S')} Injecting {len(chunk)} new or changed file(s).")
+                    counts, completed_paths, interrupted = process_files(
+                        [(path, watch_root_of(path)) for path in chunk], len(chunk))
+                    for _, output_path in completed_paths:
+                        with contextlib.suppress(OSError):
+                            own_writes[output_path] = stat_key(output_path)
+                    print(f"{time.strftime('%H:%M:%S')} Processed {counts['processed']}, up to date "
+                          f"{counts['up_to_date']}, skipped or failed {counts['skipped']}.")
+                    if interrupted:
+                        raise KeyboardInterrupt
+        except KeyboardInterrupt:
+            print("\nStopped watching.")
+        finally:
+            watcher.close()
+
+    if search_db is not None:
+        search_db.close()
+    return 0
+
+if __name__ == "__main__":
+    process_umask(allow_round_trip=True) # Single-threaded here, so reading it by setting it is safe
+    sys.exit(main())
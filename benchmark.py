@@ -0,0 +1,262 @@
+"""
+Benchmark for Injection.py.
+
+Generates a corpus of synthetic Mokuro-style chapter HTMLs (.page > .pageContainer >
+.textBox > <p>) and measures how inject_script_to_html scales for each injection engine
+and worker count: per-file latency, files/sec, MB/sec and peak traced memory
+(tracemalloc). Results are written as JSON so runs of different versions can be compared.
+Runs entirely offline; only the dependencies of Injection.py are needed.
+
+Usage: python benchmark.py --files 20 --pages 40 --engines splice,bs4 --workers 1,4 -o results.json
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+
+import Injection
+
+# Per-file progress messages would only add noise to the measurements. Set at import time, so it
+# also applies in worker processes, which import this module to run timed_inject.
+Injection.logger.disabled = True
+
+# Latin and Japanese words mixed into the OCR text, so the documents exercise UTF-8 handling.
+WORDS = ("lorem", "ipsum", "dolor", "sit", "amet", "consectetur", "adipiscing", "elit",
+         "こんにちは", "ありがとう", "すごい", "まさか", "本当に", "なんで", "大丈夫", "行くぞ")
+
+HEAD_TEMPLATE = """<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="UTF-8">
+<meta name="viewport" content="width=device-width, initial-scale=1.0">
+<title>{title}</title>
+<style>
+body {{ margin: 0; background-color: var(--colorBackground, #c4c3d0); }}
+.page {{ display: none; }}
+.pageContainer {{ position: relative; margin: 0 auto; }}
+.textBox {{ position: absolute; z-index: 1; }}
+.textBox p {{ display: none; white-space: nowrap; margin: 0; }}
+</style>
+<script>
+let state = {{ page_idx: 0, singlePageView: false, r2l: true, easyNav: true, ctrlToPan: false }};
+function updatePage(idx) {{ state.page_idx = idx; }}
+function nextPage() {{ updatePage(state.page_idx + 1); }}
+function prevPage() {{ updatePage(state.page_idx - 1); }}
+</script>
+</head>
+<body>
+<div id="topMenu"><button id="menuButton">menu</button></div>
+<div id="pagesContainer">
+"""
+
+TAIL = """</div>
+<a id="leftAScreen" href="#"></a>
+<a id="rightAScreen" href="#"></a>
+</body>
+</html>
+"""
+
+
+def _text(rng, words):
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+def generate_page(rng, page_index, boxes, paragraphs, nesting):
+    """Returns the HTML of one .page with the given number of textboxes and <p> per box."""
+    width, height = 1200, rng.choice((1700, 1800, 2400))
+    parts = [
+        f'<div class="page" id="page{page_index}">\n'
+        f'<div class="pageContainer" style="width:{width}px; height:{height}px; '
+        f'background-image:url(&quot;imgs/{page_index:04d}.jpg&quot;)">\n'
+    ]
+    for _ in range(boxes):
+        box_width, box_height = rng.randint(60, 300), rng.randint(80, 500)
+        left, top = rng.randint(0, width - box_width), rng.randint(0, height - box_height)
+        parts.append(
+            f'<div class="textBox" style="left:{left}px; top:{top}px; width:{box_width}px; '
+            f'height:{box_height}px; font-size:{rng.randint(14, 40)}px; writing-mode:vertical-rl;">\n'
+        )
+        for _ in range(paragraphs):
+            inner = _text(rng, rng.randint(2, 8))
+            for _ in range(nesting):
+                inner = f"<span>{inner}</span>"
+            parts.append(f"<p>{inner}</p>\n")
+        parts.append("</div>\n")
+    parts.append("</div>\n</div>\n")
+    return "".join(parts)
+
+
+def generate_mokuro_html(pages=30, boxes=8, paragraphs=3, nesting=0, target_bytes=None, seed=0, title="chapter"):
+    """
+    Returns a synthetic Mokuro chapter document. With target_bytes, pages are added until
+    the document reaches that size (the pages argument is then ignored).
+    """
+    rng = random.Random(seed)
+    head = HEAD_TEMPLATE.format(title=title)
+    body = []
+    size = len(head.encode("utf-8")) + len(TAIL)
+    page_index = 0
+    while (page_index < pages) if target_bytes is None else (size < target_bytes):
+        page = generate_page(rng, page_index, boxes, paragraphs, nesting)
+        body.append(page)
+        size += len(page.encode("utf-8"))
+        page_index += 1
+    return head + "".join(body) + TAIL
+
+
+def write_corpus(directory, files, **generator_options):
+    """Writes the synthetic chapters into directory and returns their paths."""
+    paths = []
+    for index in range(files):
+        path = os.path.join(directory, f"chapter{index:04d}.html")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(generate_mokuro_html(seed=index, title=f"chapter {index}", **generator_options))
+        paths.append(path)
+    return paths
+
+
+def timed_inject(input_path, output_path, engine, trace_memory=False):
+    """Injects one file and returns (seconds, peak traced bytes or None). Runs in worker processes too."""
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        Injection.inject_script_to_html(input_path, output_path, engine=engine, force=True)
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1] if trace_memory else None
+    finally:
+        if trace_memory:
+            tracemalloc.stop()
+    return elapsed, peak
+
+
+def run_pass(paths, output_dir, engine, executor=None, trace_memory=False):
+    """
+    Injects every path once, in the executor's worker processes if one is given; returns
+    (wall seconds, [per-file seconds], [per-file peaks]).
+    """
+    outputs = [os.path.join(output_dir, os.path.basename(path)) for path in paths]
+    start = time.perf_counter()
+    if executor is None:
+        results = [timed_inject(path, output, engine, trace_memory) for path, output in zip(paths, outputs)]
+    else:
+        results = list(executor.map(timed_inject, paths, outputs, [engine] * len(paths),
+                                    [trace_memory] * len(paths)))
+    wall = time.perf_counter() - start
+    return wall, [seconds for seconds, _ in results], [peak for _, peak in results]
+
+
+def benchmark(paths, output_dir, engine, workers, repeat):
+    """
+    Runs repeat timed passes plus one traced pass and summarizes them. With several workers one
+    process pool serves all passes, so process start-up and imports are paid in the warm-up pass
+    and not timed.
+    """
+    total_bytes = sum(os.path.getsize(path) for path in paths)
+    with contextlib.ExitStack() as stack:
+        executor = stack.enter_context(ProcessPoolExecutor(max_workers=workers)) if workers > 1 else None
+        run_pass(paths, output_dir, engine, executor) # Warm-up: page cache, imports, worker start-up
+        walls = []
+        latencies = []
+        for _ in range(repeat):
+            wall, seconds, _ = run_pass(paths, output_dir, engine, executor)
+            walls.append(wall)
+            latencies.extend(seconds)
+        _, _, peaks = run_pass(paths, output_dir, engine, executor, trace_memory=True)
+    wall = statistics.median(walls)
+    return {
+        "engine": engine,
+        "workers": workers,
+        "files": len(paths),
+        "bytes": total_bytes,
+        "repeat": repeat,
+        "wall_seconds": round(wall, 6),
+        "files_per_sec": round(len(paths) / wall, 3),
+        "mb_per_sec": round(total_bytes / wall / 1e6, 3),
+        "latency_ms": {
+            "mean": round(statistics.mean(latencies) * 1000, 3),
+            "p50": round(Injection.percentile(latencies, 0.50) * 1000, 3),
+            "p90": round(Injection.percentile(latencies, 0.90) * 1000, 3),
+            "p99": round(Injection.percentile(latencies, 0.99) * 1000, 3),
+            "max": round(max(latencies) * 1000, 3),
+        },
+        "peak_traced_bytes": max(peaks),
+    }
+
+
+def _int_list(value):
+    try:
+        return [int(part) for part in value.split(",") if part.strip()]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid integer list: '{value}'")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark Injection.py on synthetic Mokuro HTML.")
+    parser.add_argument("--files", type=int, default=20, help="Chapters in the corpus (default: 20).")
+    parser.add_argument("--pages", type=int, default=30, help="Pages per chapter (default: 30).")
+    parser.add_argument("--boxes", type=int, default=8, help="Textboxes per page (default: 8).")
+    parser.add_argument("--paragraphs", type=int, default=3, help="<p> lines per textbox (default: 3).")
+    parser.add_argument("--nesting", type=int, default=0, help="<span> levels inside each <p> (default: 0).")
+    parser.add_argument("--size-kb", type=int, help="Grow each chapter to about this many KB instead of using --pages.")
+    parser.add_argument("--engines", default="splice,bs4",
+                        help="Comma-separated injection engines to measure (default: splice,bs4).")
+    parser.add_argument("--workers", type=_int_list, default=[1, 4],
+                        help="Comma-separated worker counts to measure (default: 1,4).")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed passes per configuration (default: 3).")
+    parser.add_argument("-o", "--output", default="benchmark-results.json", help="Results JSON file.")
+    parser.add_argument("--keep", metavar="DIR", help="Generate the corpus in DIR and keep it.")
+    args = parser.parse_args()
+
+    engines = [engine for engine in args.engines.split(",") if engine]
+    for engine in engines:
+        if engine not in Injection.INJECTION_ENGINES:
+            parser.error(f"unknown engine '{engine}' (choose from {', '.join(Injection.INJECTION_ENGINES)})")
+
+    work_dir = args.keep or tempfile.mkdtemp(prefix="mokuro-benchmark-")
+    corpus_dir = os.path.join(work_dir, "corpus")
+    output_dir = os.path.join(work_dir, "output")
+    os.makedirs(corpus_dir, exist_ok=True)
+    os.makedirs(output_dir, exist_ok=True)
+    try:
+        paths = write_corpus(corpus_dir, args.files, pages=args.pages, boxes=args.boxes,
+                             paragraphs=args.paragraphs, nesting=args.nesting,
+                             target_bytes=args.size_kb * 1024 if args.size_kb else None)
+        corpus_bytes = sum(os.path.getsize(path) for path in paths)
+        print(f"Corpus: {len(paths)} file(s), {corpus_bytes / 1e6:.2f} MB in {corpus_dir}")
+
+        results = []
+        for engine in engines:
+            for workers in args.workers:
+                result = benchmark(paths, output_dir, engine, workers, args.repeat)
+                results.append(result)
+                print(f"  {engine:<6} workers={workers:<3} {result['files_per_sec']:>9.2f} files/s "
+                      f"{result['mb_per_sec']:>8.2f} MB/s  p50 {result['latency_ms']['p50']:>8.2f} ms  "
+                      f"p99 {result['latency_ms']['p99']:>8.2f} ms  peak {result['peak_traced_bytes'] / 1e6:.2f} MB")
+
+        report = {
+            "script_hash": Injection.Injector().script_hash, # As stamped by the default options benchmarked
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "corpus": {"files": args.files, "pages": None if args.size_kb else args.pages, "size_kb": args.size_kb,
+                       "boxes": args.boxes, "paragraphs": args.paragraphs, "nesting": args.nesting,
+                       "bytes": corpus_bytes},
+            "results": results,
+        }
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+    finally:
+        if not args.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
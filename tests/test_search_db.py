@@ -0,0 +1,91 @@
+"""
+Tests for the OCR text index (--search-db) built while injecting.
+"""
+import contextlib
+import io
+import os
+import sqlite3
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import Injection
+
+
+def chapter(lines):
+    """Returns a minimal Mokuro chapter with one page and a textbox per line."""
+    boxes = "".join(f'<div class="textBox" style="left:{10 * i}px; top:20px; width:50px; height:80px;">'
+                    f"<p>{line}</p></div>" for i, line in enumerate(lines))
+    return ('<!DOCTYPE html><html><head><title>t</title></head><body><div id="pagesContainer">'
+            '<div class="page" id="page0"><div class="pageContainer" style="width:1000px; height:1500px; '
+            f'background-image:url(&quot;0000.jpg&quot;)">{boxes}</div></div></div></body></html>')
+
+
+def write_library(directory):
+    texts = {"ch1.html": ["こんにちは世界", "first"], "ch2.html": ["second"], "ch3.html": ["third", "ありがとう"]}
+    for name, lines in texts.items():
+        (directory / name).write_text(chapter(lines), encoding="utf-8")
+    return texts
+
+
+def run(*argv):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return Injection.main([str(arg) for arg in argv])
+
+
+def count_rows(database):
+    connection = sqlite3.connect(database)
+    try:
+        return tuple(connection.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] for table in ("chapters", "boxes"))
+    finally:
+        connection.close()
+
+
+def test_output_directory_run_commits_the_index(tmp_path):
+    # Without a journal (-o mode), the index must still be committed batch by batch
+    library = tmp_path / "library"
+    library.mkdir()
+    write_library(library)
+    database = tmp_path / "lib.db"
+    assert run(library, "-o", tmp_path / "out", "--search-db", database, "--fsync-batch", "2") == 0
+    assert count_rows(database) == (3, 5)
+
+
+def test_indexed_text_is_searchable(tmp_path):
+    library = tmp_path / "library"
+    library.mkdir()
+    write_library(library)
+    database = tmp_path / "lib.db"
+    assert run(library, "-o", tmp_path / "out", "--search-db", database) == 0
+
+    search_db = Injection.SearchDatabase(database)
+    try:
+        rows = search_db.search("こんにちは")
+        assert [(path, page, box, text) for path, page, box, _, _, _, _, text in rows] == \
+            [("out/ch1.html", 0, 0, "こんにちは世界")]
+        assert [row[0] for row in search_db.search("ありがとう")] == ["out/ch3.html"]
+        assert search_db.search("missing text") == []
+    finally:
+        search_db.close()
+
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        assert Injection.main(["search", str(database), "third"]) == 0
+    assert "ch3.html" in output.getvalue()
+
+
+def test_chapters_skipped_by_the_manifest_are_indexed(tmp_path):
+    library = tmp_path / "library"
+    library.mkdir()
+    write_library(library)
+    output_dir = tmp_path / "out"
+    database = tmp_path / "lib.db"
+    assert run(library, "-o", output_dir, "--manifest") == 0
+    assert run(library, "-o", output_dir, "--manifest", "--search-db", database) == 0
+    assert count_rows(database) == (3, 5)
+
+    # Once indexed, the manifest shortcut applies again and the index is left as it is
+    before = {name: os.stat(output_dir / name).st_mtime_ns for name in ("ch1.html", "ch2.html", "ch3.html")}
+    assert run(library, "-o", output_dir, "--manifest", "--search-db", database) == 0
+    assert count_rows(database) == (3, 5)
+    assert before == {name: os.stat(output_dir / name).st_mtime_ns for name in before}
@@ -0,0 +1,73 @@
+"""
+Tests for the splice engine: the injected <script> element is the only change made to the
+document, every other byte is copied unchanged.
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import Injection
+
+DOCUMENT = (
+    b'<!DOCTYPE html>\r\n<HTML lang=ja>\r\n<Head><meta charset="UTF-8"><title>A &amp; B</title>\r\n'
+    b"<style>p::after { content: '</body>'; }</style></Head>\r\n"
+    b"<Body class='x'  data-odd = \"1\">\r\n"
+    b'<div class="page"><p>\xe3\x81\x93\xe3\x82\x93\xe3\x81\xab\xe3\x81\xa1\xe3\x81\xaf<br/>&nbsp;</p></div>\r\n'
+    b"<!-- a comment with </body> in it -->\r\n"
+    b"<script>var closing = '</body>';</script>\r\n"
+    b"</BODY>\r\n</HTML>\r\n"
+)
+
+
+def inject(tmp_path, data, name="chapter.html", **options):
+    """Injects data with the splice engine; returns (injector, output bytes)."""
+    input_path = tmp_path / name
+    input_path.write_bytes(data)
+    output_path = tmp_path / ("out-" + name)
+    injector = Injection.Injector(engine="splice", **options)
+    stats = {}
+    injector.inject_file(str(input_path), str(output_path), force=True, stats=stats)
+    assert stats["engine"] == "splice"
+    return injector, output_path.read_bytes()
+
+
+def script_tag(injector):
+    return Injection.build_script_tag(injector.script_hash, injector.javascript).encode("utf-8")
+
+
+def test_only_the_script_is_inserted_before_the_real_closing_body(tmp_path):
+    injector, output = inject(tmp_path, DOCUMENT)
+    position = DOCUMENT.index(b"</BODY>")
+    assert output == DOCUMENT[:position] + script_tag(injector) + DOCUMENT[position:]
+
+
+def test_closing_body_inside_comment_or_script_after_body_is_ignored(tmp_path):
+    data = (b"<html><head></head><body><p>x</p></body>\n"
+            b"<!-- </body> -->\n<script>document.write('</body>')</script>\n</html>")
+    injector, output = inject(tmp_path, data)
+    position = data.index(b"</body>")
+    assert output == data[:position] + script_tag(injector) + data[position:]
+
+
+@pytest.mark.parametrize("data, before", [
+    (b"<html><head><title>t</title></head><p>no body</p></html>", b"</head>"),
+    (b"<html><p>neither body nor head</p></html>", b"</html>"),
+])
+def test_falls_back_to_head_then_html(tmp_path, data, before):
+    injector, output = inject(tmp_path, data)
+    position = data.index(before)
+    assert output == data[:position] + script_tag(injector) + data[position:]
+
+
+def test_reinjection_is_idempotent_and_replaces_older_scripts(tmp_path):
+    injector, first = inject(tmp_path, DOCUMENT)
+    _, second = inject(tmp_path, first, name="again.html")
+    assert second == first
+
+    updated, third = inject(tmp_path, first, name="updated.html", script_options={"lazy_margin": 123})
+    assert updated.script_hash != injector.script_hash
+    assert third.count(b'id="' + Injection.INJECTED_SCRIPT_ID.encode() + b'"') == 1
+    assert third.replace(script_tag(updated), b"") == DOCUMENT
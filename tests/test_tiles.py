@@ -0,0 +1,43 @@
+"""
+Tests for tile_tall_pages: tall page images are split into tiles and their textboxes moved into
+the tile holding them, whether or not the layout was precomputed by an earlier run.
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import Injection
+
+Image = pytest.importorskip("PIL.Image")
+BeautifulSoup = pytest.importorskip("bs4").BeautifulSoup
+
+DOCUMENT = (
+    '<html><body><div id="pagesContainer"><div class="page">'
+    '<div class="pageContainer" style="width: 100px; height: 3000px; background-image: url(&quot;page.png&quot;);">'
+    '<div class="textBox" style="left: 10px; top: 2500px; width: 20px; height: 100px; font-size: 12px;"><p>a</p></div>'
+    '</div></div></div></body></html>'
+)
+
+
+def tile(tmp_path, precompute):
+    Image.new("RGB", (100, 3000), "white").save(tmp_path / "page.png")
+    soup = BeautifulSoup(DOCUMENT, "html.parser")
+    if precompute:
+        Injection.precompute_textbox_layout(soup)
+    result = Injection.tile_tall_pages(soup, str(tmp_path), 1000)
+    return soup, result
+
+
+@pytest.mark.parametrize("precompute", [False, True])
+def test_textbox_moves_into_the_tile_holding_it(tmp_path, precompute):
+    soup, (tiled, _) = tile(tmp_path, precompute)
+    assert tiled == 1
+    tiles = soup.find_all(class_="webtoon-tile")
+    assert len(tiles) == 3
+    assert tiles[2].find(class_="textBox") is not None
+    style = Injection.parse_style(tiles[2].find(class_="textBox")["style"])
+    assert Injection.css_px(style["top"]) == pytest.approx(50, abs=0.01)
+    assert Injection.css_px(style["height"]) == pytest.approx(10, abs=0.01)